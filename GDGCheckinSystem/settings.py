@@ -2,6 +2,7 @@
 Django settings for GDGCheckinSystem project.
 """
 
+import os
 from pathlib import Path
 
 
@@ -36,6 +37,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'checkin.request_logging.RequestContextMiddleware',  # request ID 與請求摘要 log
+    'checkin.profiling.SamplingProfilerMiddleware',  # 僅在 CHECKIN_PROFILING 啟用時生效
+    'checkin.tracing.RequestTraceMiddleware',  # 僅在 CHECKIN_TRACE_ENABLED = True 時啟用
+    'checkin.tenancy.TenantMiddleware',  # 依路徑前綴 /t/<社團>/ 或子網域判斷社團
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -123,3 +128,104 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # 【修正】：設定本機時區為台北
 TIME_ZONE = 'Asia/Taipei'
 
+
+# Firestore 呼叫的期限 / 重試 / hedged read / 斷路器設定 (見 checkin/firebase_init.py)
+FIRESTORE_RESILIENCE = {
+    'read_timeout': 5.0,
+    'write_timeout': 10.0,
+    'max_retries': 3,
+    'hedge_enabled': False,
+    'breaker_threshold': 5,
+    'breaker_cooldown': 30.0,
+}
+
+# 請求軌跡錄製 (見 checkin/tracing.py)，錄下的檔案可用 `python manage.py replay_traces` 重播
+CHECKIN_TRACE_ENABLED = False
+CHECKIN_TRACE_FILE = BASE_DIR / 'traces' / 'requests.jsonl'
+
+# 取樣式效能剖析 (見 checkin/profiling.py)，結果為可產生火焰圖的 folded stacks
+CHECKIN_PROFILING = {
+    'enabled': os.environ.get('CHECKIN_PROFILING_ENABLED') == '1',
+    # 設定後，帶有 X-Checkin-Profile: <token> 標頭的請求一律剖析 (不需啟用 enabled)
+    'header_token': os.environ.get('CHECKIN_PROFILING_TOKEN') or None,
+    'sample_rate': 0.01,
+    'slow_ms': 1000,
+    'watch_after_ms': 500,
+    'interval': 0.005,
+    'output_dir': BASE_DIR / 'profiles',
+}
+
+# 多社團設定 (見 checkin/tenancy.py)
+# 'default' 使用原本的頂層 collection；其他社團預設使用 tenants/<slug>/students 等命名空間，
+# 也可用 'credentials_env' 指定存放獨立 Firebase 專案金鑰的環境變數。
+CHECKIN_TENANTS = {
+    'default': {},
+    # 'gdg-taipei': {'rate_limit': 30, 'max_concurrency': 8},
+    # 'another-club': {'credentials_env': 'FIREBASE_CREDENTIALS_JSON_ANOTHER_CLUB'},
+}
+# 每個社團的預設上限：每秒請求數 (rate_limit) 與同時進行中的 Firestore 操作數 (max_concurrency)
+CHECKIN_TENANT_DEFAULTS = {
+    'rate_limit': 50,
+    'max_concurrency': 16,
+}
+# 'path'：/t/<slug>/...；'subdomain'：<slug>.<CHECKIN_TENANT_BASE_DOMAIN> (需將 '.<網域>' 加入 ALLOWED_HOSTS)
+CHECKIN_TENANT_ROUTING = 'path'
+CHECKIN_TENANT_BASE_DOMAIN = ''
+
+# 寄信設定 (簽到確認信)。本地測試可啟動 SMTP sink：python -m aiosmtpd -n -l localhost:1025
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', '') == '1'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'GDG Check-in <noreply@gdgcheckinsystem.onrender.com>')
+
+# 簽到確認信的背景寄送 (見 checkin/mailer.py)
+CHECKIN_CONFIRMATION_EMAIL = {
+    'enabled': os.environ.get('CHECKIN_CONFIRMATION_EMAIL') == '1',
+    'batch_size': 20,
+    'rate_per_minute': 60,
+    'max_attempts': 5,
+}
+
+# 結構化日誌 (見 checkin/request_logging.py)：經由佇列在背景寫出，每筆都帶有 request ID
+CHECKIN_SLOW_REQUEST_MS = 1000  # 超過此時間的請求一律記錄為 WARNING
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'checkin.request_logging.RequestContextFilter'},
+        # 成功請求的摘要只保留 10%，錯誤與慢請求不受影響
+        'sample_success': {'()': 'checkin.request_logging.SuccessSamplingFilter', 'rate': 0.1},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'checkin.request_logging.NonBlockingQueueHandler',
+            'filters': ['request_context', 'sample_success'],
+        },
+    },
+    'loggers': {
+        'checkin': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+        'django.request': {'handlers': ['queue'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# 過去學期簽到記錄的冷儲存 (見 checkin/archive.py 與 `python manage.py archive_checkins`)
+CHECKIN_ARCHIVE = {
+    'store': 'firestore',  # 'firestore'：checkin_archives collection；'local'：local_dir 下的 .jsonl.gz
+    'local_dir': BASE_DIR / 'archive',
+    'cutoff_days': 180,
+}
+
+# 未到名單的記憶體快取 (見 checkin/presence.py 與 /api/courses/<id>/absent/)
+CHECKIN_PRESENCE = {
+    'roster_ttl': 300,
+    'checkins_ttl': 60,
+    'max_courses': 64,
+}
+
+# 課程場次模式：開啟中的課程預先載入社員名單與已簽到學號 (見 checkin/course_session.py)
+CHECKIN_COURSE_SESSION = {
+    'refresh_interval': 10,
+    'roster_reload': 300,
+}
@@ -1,7 +1,35 @@
-
 from django.contrib import admin
-from .models import Student, Course, CheckinRecord
+from .models import Student, Course, CheckinRecord, SyncCursor
+
+# 以下資料由 `python manage.py sync_firestore` 從 Firestore 同步而來，
+# 查詢皆在本地 SQL 上執行，不會產生 Firestore 讀取費用。
+
+
+@admin.register(Student)
+class StudentAdmin(admin.ModelAdmin):
+    list_display = ('member_id', 'student_id', 'name', 'email')
+    search_fields = ('student_id', 'name', 'email')
+    ordering = ('member_id',)
+
+
+@admin.register(Course)
+class CourseAdmin(admin.ModelAdmin):
+    list_display = ('date', 'name', 'classroom', 'archived')
+    list_filter = ('archived',)
+    search_fields = ('name', 'classroom')
+    date_hierarchy = 'date'
+
+
+@admin.register(CheckinRecord)
+class CheckinRecordAdmin(admin.ModelAdmin):
+    list_display = ('checkin_time', 'course', 'member_id', 'student_code', 'student_name')
+    list_filter = ('course',)
+    search_fields = ('student_code', 'student_name', 'course__name')
+    list_select_related = ('course', 'student')
+    raw_id_fields = ('course', 'student')
+
 
-admin.site.register(Student)
-admin.site.register(Course)
-admin.site.register(CheckinRecord)
\ No newline at end of file
+@admin.register(SyncCursor)
+class SyncCursorAdmin(admin.ModelAdmin):
+    list_display = ('collection', 'last_updated_at', 'last_run_at', 'synced_count')
+    readonly_fields = ('collection', 'last_updated_at', 'last_run_at', 'synced_count')
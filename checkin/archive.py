@@ -0,0 +1,250 @@
+# checkin/archive.py
+
+"""
+過去學期簽到記錄的冷儲存 (hot / cold archiving)。
+
+archive_checkins 指令會把早於截止日的課程之簽到記錄壓縮 (gzip JSONL) 後移到冷儲存，
+並在課程文件上留下摘要 (archive 欄位)，最後刪除 checkin_records 中已寫入冷儲存的那些記錄，
+讓熱資料的查詢與索引只涵蓋目前學期。讀取快照之後才寫入的簽到不會被刪除，仍留在熱資料中。
+
+冷儲存有兩種：
+- firestore：checkin_archives/<course_id>/chunks/<n>，每個 chunk 存放一段壓縮資料
+- local：<local_dir>/<社團>/<course_id>.jsonl.gz
+
+讀取時請一律使用 get_course_records()：已封存的課程會自動從冷儲存讀取 (並合併留在熱資料中的記錄)；
+全部匯出見 exports.iter_export_pages()。
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+from . import exports, tenancy
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLLECTION = 'checkin_archives'
+
+# Firestore 單一文件上限為 1 MiB，預留欄位與索引的空間
+CHUNK_BYTES = 900 * 1024
+
+DEFAULT_CONFIG = {
+    'store': 'firestore',   # 'firestore' 或 'local'
+    'local_dir': None,      # local 模式的根目錄 (預設為 BASE_DIR / 'archive')
+    'cutoff_days': 180,     # 課程日期早於幾天前才封存
+}
+
+# 已封存的資料不會再變動，保留最近讀取的幾堂課在記憶體中
+_CACHE_SIZE = 32
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_config():
+    config = {**DEFAULT_CONFIG, **getattr(settings, 'CHECKIN_ARCHIVE', {})}
+    if not config['local_dir']:
+        config['local_dir'] = settings.BASE_DIR / 'archive'
+    return config
+
+
+def _local_path(config, course_id):
+    return os.path.join(config['local_dir'], tenancy.current_tenant(), f'{course_id}.jsonl.gz')
+
+
+def _encode(rows):
+    lines = b''.join(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n' for row in rows)
+    return gzip.compress(lines)
+
+
+def _decode(data):
+    rows = []
+    for line in gzip.decompress(data).splitlines():
+        row = json.loads(line)
+        if row.get('checkin_time'):
+            row['checkin_time'] = datetime.fromisoformat(row['checkin_time'])
+        rows.append(row)
+    return rows
+
+
+# 沒有簽到時間的記錄排在最後 (checkin_time 皆為 aware datetime)
+_OLDEST = datetime.min.replace(tzinfo=dt_timezone.utc)
+
+
+# --- 讀取 ---
+
+def read_archive(db, course_id, archive_info):
+    """
+    讀取已封存課程的簽到記錄 (dict list，checkin_time 為 datetime)。
+    """
+    cache_key = (tenancy.current_tenant(), course_id, str(archive_info.get('archived_at')))
+    with _cache_lock:
+        if cache_key in _cache:
+            _cache.move_to_end(cache_key)
+            return _cache[cache_key]
+
+    if archive_info.get('store') == 'local':
+        with open(_local_path(get_config(), course_id), 'rb') as f:
+            data = f.read()
+    else:
+        chunks = db.collection(ARCHIVE_COLLECTION).document(course_id).collection('chunks') \
+            .order_by('__name__').stream()
+        data = b''.join(chunk.to_dict()['data'] for chunk in chunks)
+
+    rows = _decode(data)
+    with _cache_lock:
+        _cache[cache_key] = rows
+        if len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return rows
+
+
+def archived_ids(db, course_id, archive_info):
+    """已封存課程寫入冷儲存的簽到記錄文件 ID。"""
+    return {row['id'] for row in read_archive(db, course_id, archive_info)}
+
+
+def archived_courses(db):
+    """
+    返回所有已封存的課程 {course_id: archive 摘要}。
+    """
+    courses = {}
+    for course_doc in db.collection('courses').stream():
+        archive_info = course_doc.to_dict().get('archive')
+        if archive_info:
+            courses[course_doc.id] = archive_info
+    return courses
+
+
+def get_course_records(db, course_id, course_data=None, newest_first=False):
+    """
+    返回課程的所有簽到記錄 (dict list)。已封存的課程從冷儲存讀取，並合併封存快照之後才寫入、
+    仍留在 checkin_records 的記錄 (通常為 0 筆，只多一次查詢)；否則查詢 checkin_records。
+    course_data 為課程文件內容 (呼叫端通常已讀取過，可避免重複讀取)。
+    """
+    query = db.collection('checkin_records').where(filter=FieldFilter('course_id', '==', course_id))
+
+    archive_info = (course_data or {}).get('archive')
+    if archive_info:
+        rows = read_archive(db, course_id, archive_info)
+        ids = {row['id'] for row in rows}
+        rows = rows + [doc.to_dict() for doc in query.stream() if doc.id not in ids]
+        if newest_first:
+            rows = sorted(rows, key=lambda row: row.get('checkin_time') or _OLDEST, reverse=True)
+        return rows
+
+    if newest_first:
+        query = query.order_by('checkin_time', direction=firestore.Query.DESCENDING)
+    return [doc.to_dict() for doc in query.stream()]
+
+
+# --- 封存 ---
+
+def _hot_record_pages(db, course_id, page_size=exports.PAGE_SIZE):
+    collection_ref = db.collection('checkin_records')
+    last_snapshot = None
+    while True:
+        query = collection_ref.where(filter=FieldFilter('course_id', '==', course_id)) \
+            .order_by('__name__').limit(page_size)
+        if last_snapshot is not None:
+            query = query.start_after(last_snapshot)
+        page = list(query.stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_snapshot = page[-1]
+
+
+def _write_cold(db, config, course_id, data):
+    if config['store'] == 'local':
+        path = _local_path(config, course_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return 1
+
+    chunks_ref = db.collection(ARCHIVE_COLLECTION).document(course_id).collection('chunks')
+    chunks = [data[start:start + CHUNK_BYTES] for start in range(0, len(data), CHUNK_BYTES)] or [b'']
+    # 每個 chunk 接近 1 MiB，分開提交以免超過單次請求大小上限
+    for index, chunk in enumerate(chunks):
+        chunks_ref.document(f'{index:05d}').set({'data': chunk})
+    return len(chunks)
+
+
+def _delete_hot_records(db, references):
+    # 只刪除已寫入冷儲存的文件：讀取快照之後才寫入的簽到不在其中
+    for start in range(0, len(references), exports.PAGE_SIZE):
+        batch = db.batch()
+        for reference in references[start:start + exports.PAGE_SIZE]:
+            batch.delete(reference)
+        batch.commit()
+    return len(references)
+
+
+def archive_course(db, course_id, course_data, config=None, dry_run=False):
+    """
+    封存單一課程，回傳 {'course_id', 'count', 'bytes', 'deleted'}。
+    已封存過的課程只會清除殘留在熱資料中、且已寫入冷儲存的記錄 (例如上次刪除途中中斷)。
+    """
+    config = config or get_config()
+    result = {'course_id': course_id, 'count': 0, 'bytes': 0, 'deleted': 0}
+
+    archive_info = course_data.get('archive')
+    if archive_info:
+        if dry_run:
+            return result
+        ids = archived_ids(db, course_id, archive_info)
+        references = [snapshot.reference for page in _hot_record_pages(db, course_id)
+                      for snapshot in page if snapshot.id in ids]
+        result['deleted'] = _delete_hot_records(db, references)
+        return result
+
+    snapshots = [snapshot for page in _hot_record_pages(db, course_id) for snapshot in page]
+    rows = [exports.record_to_dict(snapshot) for snapshot in snapshots]
+    result['count'] = len(rows)
+    if dry_run:
+        return result
+
+    data = _encode(rows)
+    result['bytes'] = len(data)
+    chunk_count = _write_cold(db, config, course_id, data)
+
+    # 先寫入冷儲存與摘要，才刪除熱資料：中斷時讀取端仍能得到完整記錄
+    db.collection('courses').document(course_id).update({
+        'archive': {
+            'store': config['store'],
+            'count': len(rows),
+            'chunks': chunk_count,
+            'bytes': len(data),
+            'archived_at': timezone.now(),
+        },
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+    result['deleted'] = _delete_hot_records(db, [snapshot.reference for snapshot in snapshots])
+    return result
+
+
+def archive_before(db, cutoff, config=None, dry_run=False):
+    """
+    封存課程日期早於 cutoff (datetime) 的所有課程，逐一 yield 每堂課的結果。
+    """
+    courses = db.collection('courses').where(filter=FieldFilter('date', '<', cutoff)).stream()
+    for course_doc in courses:
+        course_data = course_doc.to_dict()
+        try:
+            yield archive_course(db, course_doc.id, course_data, config=config, dry_run=dry_run)
+        except Exception as e:
+            logger.exception("封存課程 %s 失敗: %s", course_doc.id, e)
+            yield {'course_id': course_doc.id, 'error': str(e)}
@@ -0,0 +1,389 @@
+# checkin/course_session.py
+
+"""
+課程場次 (session) 模式。
+
+管理頁面對一堂課「開啟場次」後，每個 process 會把社員名單與該課程的已簽到學號預先載入記憶體，
+直到場次關閉。場次開啟中，handle_checkin 的「非社員」與「已簽到」都由記憶體判斷，
+只有新的簽到才會寫入 Firestore (一次 create，不需任何讀取)。
+
+- 場次狀態存在課程文件的 session_open 欄位，各 process 的背景執行緒每 refresh_interval 秒
+  查詢一次，發現新開啟的場次就預先載入，已關閉或已刪除的就釋放；簽到請求只讀取記憶體
+- 沒有開啟中場次的社團，查詢間隔逐次加倍到 idle_refresh_max 秒；超過 idle_forget 秒沒有簽到請求的
+  社團停止查詢，下次有請求時才重新開始 (其他 process 開啟的場次最晚 idle_refresh_max 秒後生效，
+  在那之前簽到走一般流程，結果相同)
+- 同一次查詢中，也以 updated_at 游標讀取有變動的社員，名單不需整份重新讀取；
+  每 roster_reload 秒才完整重新讀取一次，以反映其他 process 刪除的社員
+- 簽到記錄使用固定的文件 ID (<課程 ID>_<學號>)，多個 process 同時收到同一位社員的簽到時，
+  只有一筆 create 會成功，其餘回應「已簽到」
+- 已簽到學號與 presence.py 共用同一個 set，未到名單會即時反映場次中的簽到
+
+所有狀態皆以社團區分。
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+from . import firebase_init, presence, tenancy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'refresh_interval': 10,     # 多久查詢一次場次狀態與社員變動 (秒)
+    'roster_reload': 300,       # 多久完整重新讀取一次社員名單 (秒)
+    'idle_refresh_max': 120,    # 沒有開啟中的場次時，查詢間隔的上限 (秒)
+    'idle_forget': 3600,        # 多久沒有簽到請求的社團停止查詢 (秒)
+}
+
+# 社員游標回推的安全區間，避免提交時間相近的寫入被跳過 (重複套用沒有副作用)
+ROSTER_OVERLAP = timedelta(seconds=5)
+
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHECKIN_COURSE_SESSION', {})}
+
+
+def record_id(course_id, student_id):
+    """場次模式的簽到記錄文件 ID：同一課程、同一學號只會有一筆。"""
+    return f"{course_id}_{student_id.replace('/', '_')}"
+
+
+class CourseSession:
+    """一堂課開啟中的場次：課程名稱與已簽到學號 set。"""
+
+    __slots__ = ('course_id', 'course_name', 'checked_in', 'lock')
+
+    def __init__(self, course_id, course_name, checked_in):
+        self.course_id = course_id
+        self.course_name = course_name
+        self.checked_in = checked_in
+        self.lock = threading.Lock()
+
+
+class _TenantState:
+    """一個社團在本 process 中的場次與社員名單。"""
+
+    def __init__(self):
+        self.refreshed_at = None
+        self.next_refresh = 0.0     # 背景執行緒下次查詢的時間 (monotonic)
+        self.idle_interval = None   # 沒有開啟中場次時目前的查詢間隔
+        self.last_used = time.monotonic()
+        self.refresh_lock = threading.Lock()
+        self.sessions = {}          # 課程 ID -> CourseSession
+        self.members = {}           # 學號 -> (姓名, 社員編號, Email)
+        self.member_ids = {}        # 社員文件 ID -> 學號 (改學號時移除舊的學號)
+        self.roster_cursor = None   # 已讀取的社員 updated_at 最大值
+        self.roster_loaded_at = None
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+# 背景更新執行緒 (第一次查詢場次時啟動)
+_refresher = None
+_refresher_lock = threading.Lock()
+_refresh_now = threading.Event()
+
+
+def _state():
+    tenant = tenancy.current_tenant()
+    state = _states.get(tenant)
+    if state is None:
+        with _states_lock:
+            if tenant not in _states:
+                _states[tenant] = _TenantState()
+                # 新的社團立即查詢一次，不必等到下一輪
+                _refresh_now.set()
+            state = _states[tenant]
+    return state
+
+
+# --- 預先載入 ---
+
+def _member_entry(data):
+    return (data.get('name'), data.get('member_id'), data.get('email', ''))
+
+
+def _advance_cursor(state, snapshot, data):
+    # 舊文件沒有 updated_at，以 Firestore 的文件更新時間代替
+    updated_at = data.get('updated_at') or snapshot.update_time
+    if updated_at and (state.roster_cursor is None or updated_at > state.roster_cursor):
+        state.roster_cursor = updated_at
+
+
+def _carry_checked_in(state, old_student_id, new_student_id):
+    # 改學號前已簽到的社員，以新學號視為已簽到
+    for session in state.sessions.values():
+        if old_student_id in session.checked_in:
+            session.checked_in.add(new_student_id)
+
+
+def _reload_roster(db, state):
+    """完整讀取社員名單，建立新的 dict 後才替換，簽到中的請求不會讀到一半的名單。"""
+    members, member_ids = {}, {}
+    for snapshot in db.collection('students').stream():
+        data = snapshot.to_dict()
+        student_id = data.get('student_id')
+        if student_id:
+            members[student_id] = _member_entry(data)
+            member_ids[snapshot.id] = student_id
+        _advance_cursor(state, snapshot, data)
+
+    for doc_id, old_student_id in state.member_ids.items():
+        new_student_id = member_ids.get(doc_id)
+        if new_student_id and new_student_id != old_student_id:
+            _carry_checked_in(state, old_student_id, new_student_id)
+
+    state.members, state.member_ids = members, member_ids
+    if state.roster_cursor is None:
+        # 名單為空：之後新增的社員一定晚於現在
+        state.roster_cursor = timezone.now()
+    state.roster_loaded_at = time.monotonic()
+
+
+def _apply_changed(state, snapshots):
+    for snapshot in snapshots:
+        data = snapshot.to_dict()
+        old_student_id = state.member_ids.pop(snapshot.id, None)
+        new_student_id = data.get('student_id')
+        if old_student_id is not None and old_student_id != new_student_id:
+            state.members.pop(old_student_id, None)
+            if new_student_id:
+                _carry_checked_in(state, old_student_id, new_student_id)
+        if new_student_id:
+            state.members[new_student_id] = _member_entry(data)
+            state.member_ids[snapshot.id] = new_student_id
+        _advance_cursor(state, snapshot, data)
+
+
+def _load_roster(db, state):
+    loaded_at = state.roster_loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at >= get_config()['roster_reload']:
+        _reload_roster(db, state)
+        return
+    changed = db.collection('students').where(
+        filter=FieldFilter('updated_at', '>=', state.roster_cursor - ROSTER_OVERLAP)
+    ).stream()
+    _apply_changed(state, changed)
+
+
+def _open_local(db, state, course_id, course_data):
+    session = state.sessions.get(course_id)
+    if session is None:
+        session = CourseSession(course_id, course_data.get('name'),
+                                presence.load_checked_in_ids(db, course_id, course_data))
+        state.sessions[course_id] = session
+        presence.pin(course_id, session.checked_in)
+    return session
+
+
+def _close_local(state, course_id):
+    if state.sessions.pop(course_id, None) is not None:
+        presence.unpin(course_id)
+    if not state.sessions:
+        # 沒有開啟中的場次時釋放社員名單，下次開啟時重新完整載入
+        state.members, state.member_ids = {}, {}
+        state.roster_cursor, state.roster_loaded_at = None, None
+
+
+def refresh(db):
+    """
+    查詢開啟中的場次並同步本 process 中目前社團的狀態 (由背景執行緒定期呼叫)。
+    """
+    state = _state()
+    with state.refresh_lock:
+        _refresh_state(db, state)
+    return state
+
+
+def _schedule_next(state):
+    config = get_config()
+    if state.sessions:
+        state.idle_interval = None
+        interval = config['refresh_interval']
+    else:
+        # 沒有開啟中的場次：逐次拉長查詢間隔
+        interval = min(config['idle_refresh_max'], (state.idle_interval or config['refresh_interval'] / 2) * 2)
+        state.idle_interval = interval
+    state.next_refresh = state.refreshed_at + interval
+
+
+def _refresh_state(db, state):
+    try:
+        state.refreshed_at = time.monotonic()
+        open_courses = {
+            doc.id: doc.to_dict()
+            for doc in db.collection('courses').where(filter=FieldFilter('session_open', '==', True)).stream()
+        }
+        for course_id in list(state.sessions):
+            if course_id not in open_courses:
+                _close_local(state, course_id)
+        if open_courses:
+            _load_roster(db, state)
+        for course_id, course_data in open_courses.items():
+            _open_local(db, state, course_id, course_data)
+    except Exception as e:
+        # 查詢失敗時沿用目前狀態，稍後再試
+        logger.exception("更新課程場次狀態失敗: %s", e)
+    finally:
+        _schedule_next(state)
+
+
+def _forget_idle(now):
+    """停止查詢沒有開啟中場次、且 idle_forget 秒內沒有簽到請求的社團。"""
+    idle_forget = get_config()['idle_forget']
+    with _states_lock:
+        for tenant, state in list(_states.items()):
+            if not state.sessions and now - state.last_used >= idle_forget:
+                del _states[tenant]
+
+
+def _refresh_due(now):
+    for tenant, state in list(_states.items()):
+        if state.next_refresh > now:
+            continue
+        try:
+            with tenancy.activate(tenant):
+                db = firebase_init.get_firestore_client()
+                if db:
+                    refresh(db)
+                else:
+                    state.refreshed_at = now
+                    _schedule_next(state)
+        except Exception as e:
+            logger.exception("更新社團 %s 的課程場次失敗: %s", tenant, e)
+
+
+def _refresh_loop():
+    while True:
+        now = time.monotonic()
+        _forget_idle(now)
+        _refresh_due(now)
+        # 睡到最早需要查詢的社團；沒有任何社團時等到有請求 (_state() 建立新社團時喚醒)
+        due = min((state.next_refresh for state in list(_states.values())), default=None)
+        _refresh_now.wait(None if due is None else max(0.0, due - time.monotonic()))
+        _refresh_now.clear()
+
+
+def _ensure_refresher():
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = threading.Thread(target=_refresh_loop, name='course-session-refresh', daemon=True)
+            _refresher.start()
+
+
+def get_session(course_id):
+    """
+    返回課程開啟中的場次；未開啟時返回 None。只讀取記憶體，不會查詢 Firestore。
+    """
+    _ensure_refresher()
+    state = _state()
+    state.last_used = time.monotonic()
+    return state.sessions.get(course_id)
+
+
+# --- 管理 ---
+
+def start(db, course_id):
+    """
+    開啟課程場次並在本 process 預先載入，返回 CourseSession。課程不存在或已封存時拋出 ValueError。
+    """
+    course_ref = db.collection('courses').document(course_id)
+    course_doc = course_ref.get()
+    if not course_doc.exists:
+        raise ValueError('課程不存在')
+    course_data = course_doc.to_dict()
+    if course_data.get('archive'):
+        raise ValueError('課程已封存，無法開啟場次')
+
+    course_ref.update({
+        'session_open': True,
+        'session_opened_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+    state = _state()
+    with state.refresh_lock:
+        _refresh_state(db, state)
+        if course_id not in state.sessions:
+            # 剛寫入的 session_open 尚未出現在查詢結果中
+            _load_roster(db, state)
+        session = _open_local(db, state, course_id, course_data)
+    _ensure_refresher()
+    return session
+
+
+def close(db, course_id):
+    """
+    關閉課程場次。其他 process 會在 refresh_interval 秒內釋放。
+    """
+    db.collection('courses').document(course_id).update({
+        'session_open': False,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+    state = _state()
+    with state.refresh_lock:
+        _close_local(state, course_id)
+
+
+def remove_member(doc_id):
+    """
+    社員被刪除後呼叫：本 process 的場次立即不再接受其簽到 (其他 process 於下次完整讀取時移除)。
+    """
+    state = _state()
+    student_id = state.member_ids.pop(doc_id, None)
+    if student_id is not None:
+        state.members.pop(student_id, None)
+
+
+def member_count():
+    return len(_state().members)
+
+
+# --- 簽到 ---
+
+def check_in(db, session, student_id):
+    """
+    場次模式的簽到，返回 (狀態, 社員資料, 簽到時間)。
+    狀態為 'success'、'non_member' 或 'already_checkedin'；社員資料為 (姓名, 社員編號, Email)。
+    """
+    member = _state().members.get(student_id)
+    if member is None:
+        return 'non_member', None, None
+
+    with session.lock:
+        if student_id in session.checked_in:
+            return 'already_checkedin', member, None
+        # 先佔位，同一 process 中的重複掃描不會同時寫入
+        session.checked_in.add(student_id)
+
+    student_name, member_id, student_email = member
+    local_time = timezone.localtime(timezone.now())
+    try:
+        db.collection('checkin_records').document(record_id(session.course_id, student_id)).create({
+            'course_id': session.course_id,
+            'student_id': student_id,
+            'student_name': student_name,
+            'member_id': member_id,
+            'student_email': student_email,
+            'checkin_time': local_time,
+            'updated_at': firestore.SERVER_TIMESTAMP,
+        })
+    except google_exceptions.AlreadyExists:
+        # 另一個 process 已寫入
+        return 'already_checkedin', member, None
+    except Exception:
+        with session.lock:
+            session.checked_in.discard(student_id)
+        raise
+    return 'success', member, local_time
@@ -0,0 +1,245 @@
+# checkin/exports.py
+
+"""
+全部簽到記錄的批次匯出 (年度報表 / 備份)。
+
+先以文件 ID 排序分頁讀取 checkin_records，再依課程 ID 讀取已封存課程的冷儲存 (見 archive.py)，
+逐頁寫出：
+- jsonl：gzip 壓縮的 JSON Lines，每一頁是一個獨立的 gzip member
+- parquet：欄式儲存，輸出為資料夾，每 rows_per_file 筆寫成一個 part 檔 (需安裝 pyarrow)
+熱資料的記憶體用量只與分頁大小有關；冷儲存以一堂課為一頁。已封存但尚未從熱資料刪除的記錄只匯出一次。
+
+匯出時會在輸出檔旁寫入 <輸出>.state.json，記錄游標 (最後一筆文件 ID、最後一堂已封存課程) 與檔案位置，
+中斷後以相同參數重新執行即可從上次的游標繼續。
+"""
+
+import gzip
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+
+from google.cloud.firestore import FieldFilter
+
+COLLECTION = 'checkin_records'
+PAGE_SIZE = 500
+ROWS_PER_FILE = 50000
+
+# Parquet part 檔名，例如 part-00012.parquet
+PART_NAME = re.compile(r'^part-(\d{5})\.parquet$')
+
+# 匯出欄位 (依序)
+FIELDS = ('id', 'course_id', 'student_id', 'student_name', 'member_id', 'student_email', 'checkin_time')
+
+
+def record_to_dict(snapshot):
+    """
+    將簽到記錄文件轉為可序列化的字典 (時間轉為 ISO 8601 字串)。
+    """
+    data = snapshot.to_dict()
+    row = {'id': snapshot.id}
+    for field in FIELDS[1:]:
+        value = data.get(field)
+        row[field] = value.isoformat() if isinstance(value, datetime) else value
+    return row
+
+
+def iter_record_pages(db, page_size=PAGE_SIZE, after_id=None, collection=COLLECTION):
+    """
+    依文件 ID 由小到大分頁讀取，每次 yield 一頁的 snapshot list。
+    after_id 為上次匯出的最後一筆文件 ID，用於續傳。
+    """
+    collection_ref = db.collection(collection)
+    while True:
+        query = collection_ref.order_by('__name__').limit(page_size)
+        if after_id is not None:
+            query = query.where(filter=FieldFilter('__name__', '>', collection_ref.document(after_id).raw))
+        page = list(query.stream())
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1].id
+
+
+def _archived_row(row):
+    # 冷儲存的 checkin_time 已轉為 datetime，轉回與 record_to_dict 相同的格式
+    row = {field: row.get(field) for field in FIELDS}
+    if isinstance(row['checkin_time'], datetime):
+        row['checkin_time'] = row['checkin_time'].isoformat()
+    return row
+
+
+def iter_export_pages(db, page_size=PAGE_SIZE, state=None):
+    """
+    依序 yield (rows, cursor)：rows 為 record_to_dict 格式的 dict list (可能為空)，
+    cursor 為寫完這一頁後應存入狀態檔的游標欄位 (last_id / hot_done / archived_course)。
+    state 為上次的狀態 (續傳時)。
+    """
+    from . import archive
+
+    state = state or {}
+    hot_done, last_id, after = state.get('hot_done'), state.get('last_id'), state.get('archived_course')
+    archived = archive.archived_courses(db)
+    archived_id_sets = {}
+
+    if not hot_done:
+        for page in iter_record_pages(db, page_size, last_id):
+            rows = []
+            for snapshot in page:
+                course_id = snapshot.to_dict().get('course_id')
+                if course_id in archived:
+                    # 已封存、但熱資料尚未刪除的記錄會在冷儲存的部分匯出
+                    if course_id not in archived_id_sets:
+                        archived_id_sets[course_id] = archive.archived_ids(db, course_id, archived[course_id])
+                    if snapshot.id in archived_id_sets[course_id]:
+                        continue
+                rows.append(record_to_dict(snapshot))
+            yield rows, {'last_id': page[-1].id}
+
+    for course_id in sorted(archived):
+        if after is not None and course_id <= after:
+            continue
+        rows = [_archived_row(row) for row in archive.read_archive(db, course_id, archived[course_id])]
+        yield rows, {'hot_done': True, 'archived_course': course_id}
+
+
+def _state_path(output):
+    return f"{output}.state.json"
+
+
+def load_state(output):
+    try:
+        with open(_state_path(output), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save_state(output, state):
+    # 先寫暫存檔再替換，避免中斷時留下寫到一半的狀態檔
+    tmp_path = _state_path(output) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, _state_path(output))
+
+
+def export_jsonl(db, output, page_size=PAGE_SIZE, resume=True, on_page=None):
+    """
+    匯出為 gzip 壓縮的 JSONL，回傳本次與累計的匯出筆數 (exported, total)。
+    """
+    state = load_state(output) if resume else None
+    if state and state.get('format') != 'jsonl':
+        raise ValueError(f"{_state_path(output)} 不是 jsonl 匯出的狀態檔")
+
+    if state:
+        # 輸出檔不存在或比紀錄短時無法續傳 (truncate 會以 NUL 補齊，產生損壞的 gzip)
+        size = os.path.getsize(output) if os.path.exists(output) else None
+        if size is None or size < state['offset']:
+            raise ValueError(
+                f"{output} 不存在或比 {_state_path(output)} 記錄的位置短，無法續傳，請加上 --restart 重新匯出"
+            )
+        # 截掉上次最後一個完整 gzip member 之後的部分 (可能是寫到一半的頁面)
+        with open(output, 'ab') as f:
+            f.truncate(state['offset'])
+    else:
+        state = {'format': 'jsonl', 'last_id': None, 'offset': 0, 'count': 0}
+        open(output, 'wb').close()
+
+    exported = 0
+    with open(output, 'ab') as raw_file:
+        for rows, cursor in iter_export_pages(db, page_size, state):
+            if rows:
+                with gzip.GzipFile(fileobj=raw_file, mode='ab') as member:
+                    for row in rows:
+                        member.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n')
+                raw_file.flush()
+
+            exported += len(rows)
+            state.update(cursor, offset=raw_file.tell(), count=state['count'] + len(rows))
+            _save_state(output, state)
+            if on_page:
+                on_page(state['count'])
+
+    return exported, state['count']
+
+
+def _remove_partial_parts(output, parts):
+    # 移除上次中斷時可能寫到一半的 part 檔；不符合 part 檔名的檔案一律保留
+    for name in os.listdir(output):
+        match = PART_NAME.match(name)
+        if match and int(match.group(1)) >= parts:
+            os.remove(os.path.join(output, name))
+
+
+def export_parquet(db, output, page_size=PAGE_SIZE, rows_per_file=ROWS_PER_FILE, resume=True, on_page=None):
+    """
+    匯出為 Parquet 資料夾 (part-00000.parquet, part-00001.parquet ...)，回傳 (exported, total)。
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError('匯出 Parquet 需要安裝 pyarrow：pip install pyarrow')
+
+    schema = pa.schema([
+        ('id', pa.string()),
+        ('course_id', pa.string()),
+        ('student_id', pa.string()),
+        ('student_name', pa.string()),
+        ('member_id', pa.int64()),
+        ('student_email', pa.string()),
+        ('checkin_time', pa.timestamp('us', tz='UTC')),
+    ])
+
+    state = load_state(output) if resume else None
+    if state and state.get('format') != 'parquet':
+        raise ValueError(f"{_state_path(output)} 不是 parquet 匯出的狀態檔")
+    if not state:
+        state = {'format': 'parquet', 'last_id': None, 'parts': 0, 'count': 0}
+
+    os.makedirs(output, exist_ok=True)
+    _remove_partial_parts(output, state['parts'])
+
+    exported = 0
+    buffer = []
+
+    def flush(cursor):
+        nonlocal buffer
+        for row in buffer:
+            if row['checkin_time']:
+                row['checkin_time'] = datetime.fromisoformat(row['checkin_time'])
+        part_path = os.path.join(output, f"part-{state['parts']:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(buffer, schema=schema), part_path, compression='zstd')
+        state.update(cursor, parts=state['parts'] + 1, count=state['count'] + len(buffer))
+        _save_state(output, state)
+        buffer = []
+
+    cursor = None
+    for rows, cursor in iter_export_pages(db, page_size, state):
+        buffer.extend(rows)
+        exported += len(rows)
+        if len(buffer) >= rows_per_file:
+            flush(cursor)
+        if on_page:
+            on_page(state['count'] + len(buffer))
+
+    if buffer:
+        flush(cursor)
+
+    return exported, state['count']
+
+
+def stream_jsonl_gzip(db, page_size=PAGE_SIZE):
+    """
+    以 generator 逐頁產生 gzip 壓縮的 JSONL 位元組，供 StreamingHttpResponse 使用。
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)  # gzip 格式
+    for rows, _ in iter_export_pages(db, page_size):
+        lines = b''.join(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n' for row in rows)
+        chunk = compressor.compress(lines)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
@@ -0,0 +1,271 @@
+# checkin/fanout.py
+
+"""
+社員身分欄位變更時，同步更新其歷史簽到記錄。
+
+checkin_records 保存了簽到當下的 student_id / student_name / member_id / student_email，
+社員資料被修改 (改學號、改名、重新編號) 後，舊記錄需要一併更新，否則匯出時會對不到社員名單。
+
+- update_data / bulk_update_data 在更新社員文件的同一個 batch 中建立一筆
+  student_fanout_jobs 文件，記錄舊學號與新的欄位值
+- 背景執行緒依文件 ID 分頁查詢該社員的簽到記錄，每頁以一個 batch 寫入，
+  並在同一個 batch 中更新工作的進度 (processed / last_doc_id)，中斷後可從上次位置續傳
+- 執行前以 update_time 為前提條件取得工作 (compare-and-set) 並設定租約 (lease_until)，
+  每頁的進度更新也帶同樣的前提條件：多個 process 或 resume_fanouts 同時執行時，同一工作只會由一方處理
+- 尚未完成的工作可用 `python manage.py resume_fanouts` 繼續執行
+- 工作完成前，匯出時以 apply_pending() 將舊值對應到新值，輸出結果不受進度影響
+
+已封存課程的冷儲存資料是當時的快照，不會被改寫；讀取時 apply_pending() 另外套用
+封存之後才完成的工作 (已完成的工作文件會保留，作為永久的舊值 → 新值對應)。
+"""
+
+import logging
+import queue
+import threading
+
+from datetime import timedelta
+
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+from . import firebase_init, tenancy
+
+logger = logging.getLogger(__name__)
+
+JOB_COLLECTION = 'student_fanout_jobs'
+
+# 每頁的記錄數；加上進度更新共 PAGE_SIZE + 1 筆寫入，需低於 batch 的 500 筆上限
+PAGE_SIZE = 400
+
+# 社員文件欄位 → 簽到記錄欄位
+IDENTITY_FIELDS = {
+    'student_id': 'student_id',
+    'name': 'student_name',
+    'member_id': 'member_id',
+    'email': 'student_email',
+}
+
+UNFINISHED = ('pending', 'running')
+
+# 執行中工作的租約秒數：每寫完一頁就延長；process 中斷後，租約過期才能由其他程序接手
+LEASE_SECONDS = 60
+
+
+def identity_changes(old_data, new_data):
+    """
+    比較社員文件修改前後的內容，返回簽到記錄需要更新的欄位 (沒有變更時為空字典)。
+    """
+    # 舊文件可能沒有 email 欄位，None 與空字串視為相同
+    if all((old_data.get(field) or '') == (new_data.get(field) or '') for field in IDENTITY_FIELDS):
+        return {}
+    return {record_field: new_data.get(field) for field, record_field in IDENTITY_FIELDS.items()}
+
+
+def stage_student_update(db, batch, doc_id, old_data, update_data):
+    """
+    將社員文件的更新加入 batch；身分欄位有變更時，同一個 batch 中也建立同步工作。
+    返回工作 ID (不需要同步時為 None)。batch 提交後請呼叫 submit()。
+    """
+    batch.update(db.collection('students').document(doc_id), update_data)
+
+    record_updates = identity_changes(old_data, update_data)
+    old_student_id = old_data.get('student_id')
+    if not record_updates or not old_student_id:
+        return None
+
+    job_ref = db.collection(JOB_COLLECTION).document()
+    batch.set(job_ref, {
+        'student_doc_id': doc_id,
+        'old_student_id': old_student_id,
+        'updates': record_updates,
+        'status': 'pending',
+        'processed': 0,
+        'last_doc_id': None,
+        'error': None,
+        'created_at': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+    return job_ref.id
+
+
+# --- 執行 ---
+
+def _lease():
+    return timezone.now() + timedelta(seconds=LEASE_SECONDS)
+
+
+def claim_job(db, job_ref):
+    """
+    取得工作的執行權，返回 (工作內容, update_time)。
+    以讀取時的 update_time 為前提條件寫入 running 與租約，兩個程序同時取得時只有一方成功；
+    工作已結束、租約尚未過期或被其他程序搶先時 update_time 為 None。
+    """
+    job_doc = job_ref.get()
+    if not job_doc.exists:
+        raise ValueError(f'找不到同步工作 {job_ref.id}')
+    job = job_doc.to_dict()
+    if job['status'] not in UNFINISHED:
+        return job, None
+    if job['status'] == 'running' and job.get('lease_until') and job['lease_until'] > timezone.now():
+        return job, None
+
+    claim = {'status': 'running', 'error': None, 'lease_until': _lease(), 'updated_at': firestore.SERVER_TIMESTAMP}
+    try:
+        result = job_ref.update(claim, option=db.write_option(last_update_time=job_doc.update_time))
+    except google_exceptions.FailedPrecondition:
+        return job, None
+    return {**job, **claim}, result.update_time
+
+
+def run_job(db, job_id, page_size=PAGE_SIZE):
+    """
+    執行 (或續傳) 一個同步工作，返回工作最後的內容。
+    已結束或正由其他程序執行的工作不會執行，直接返回讀到的內容 (status 不是 done)。
+    """
+    job_ref = db.collection(JOB_COLLECTION).document(job_id)
+    job, update_time = claim_job(db, job_ref)
+    if update_time is None:
+        return job
+
+    record_updates = {**job['updates'], 'updated_at': firestore.SERVER_TIMESTAMP}
+    records_ref = db.collection('checkin_records')
+    processed = job.get('processed') or 0
+    last_doc_id = job.get('last_doc_id')
+
+    try:
+        while True:
+            # 改學號時，已更新的記錄不再符合查詢條件；仍以文件 ID 為游標，兩種情況都不會重複處理
+            query = records_ref.where(filter=FieldFilter('student_id', '==', job['old_student_id']))
+            if last_doc_id:
+                query = query.where(filter=FieldFilter('__name__', '>', records_ref.document(last_doc_id).raw))
+            page = list(query.order_by('__name__').limit(page_size).stream())
+            if not page:
+                break
+
+            batch = db.batch()
+            for snapshot in page:
+                batch.update(snapshot.reference, record_updates)
+            # 工作文件在取得之後被其他程序改寫 (租約過期後被接手) 時，整個 batch 都不會寫入
+            batch.update(job_ref, {
+                'processed': processed + len(page),
+                'last_doc_id': page[-1].id,
+                'lease_until': _lease(),
+                'updated_at': firestore.SERVER_TIMESTAMP,
+            }, option=db.write_option(last_update_time=update_time))
+            update_time = batch.commit()[-1].update_time
+            processed += len(page)
+            last_doc_id = page[-1].id
+
+            if len(page) < page_size:
+                break
+
+        finished = {'status': 'done', 'finished_at': timezone.now(), 'lease_until': None,
+                    'updated_at': firestore.SERVER_TIMESTAMP}
+        job_ref.update(finished, option=db.write_option(last_update_time=update_time))
+    except google_exceptions.FailedPrecondition:
+        logger.warning("同步工作 %s 已由其他程序接手，停止執行", job_id)
+        return job_ref.get().to_dict()
+    except Exception as e:
+        try:
+            job_ref.update({'status': 'failed', 'error': str(e), 'lease_until': None,
+                            'updated_at': firestore.SERVER_TIMESTAMP},
+                           option=db.write_option(last_update_time=update_time))
+        except google_exceptions.FailedPrecondition:
+            pass
+        raise
+
+    return {**job, **finished, 'processed': processed, 'last_doc_id': last_doc_id}
+
+
+def unfinished_jobs(db, include_failed=False):
+    """
+    返回尚未完成的工作 (依建立時間排序)，同一社員的連續修改需依序套用。
+    """
+    statuses = list(UNFINISHED) + (['failed'] if include_failed else [])
+    docs = db.collection(JOB_COLLECTION).where(filter=FieldFilter('status', 'in', statuses)).stream()
+    jobs = [(doc.id, doc.to_dict()) for doc in docs]
+    return sorted(jobs, key=lambda item: item[1].get('created_at') or timezone.now())
+
+
+def pending_old_student_ids(db, student_doc_id):
+    """
+    返回社員尚未同步到簽到記錄的舊學號 (同步工作未完成或失敗)。
+    這段期間舊的簽到記錄仍是舊學號，判斷是否已簽到時需一併查詢。
+    """
+    docs = db.collection(JOB_COLLECTION).where(filter=FieldFilter('student_doc_id', '==', student_doc_id)).stream()
+    return sorted({
+        job['old_student_id']
+        for job in (doc.to_dict() for doc in docs)
+        if job['status'] in UNFINISHED + ('failed',)
+    })
+
+
+def apply_pending(db, records, course_data=None):
+    """
+    將尚未反映在記錄中的社員變更套用到簽到記錄 (dict list)，讓匯出結果與社員名單一致：
+    - 一般課程：尚未完成的工作
+    - 已封存課程 (course_data 帶有 archive)：另加封存之後才完成的工作，冷儲存不會被改寫
+
+    返回新的 list；被修改的記錄是複本，不會更動呼叫端 (例如 archive 的快取) 的 dict。
+    """
+    jobs = unfinished_jobs(db, include_failed=True)
+    archived_at = ((course_data or {}).get('archive') or {}).get('archived_at')
+    if archived_at:
+        finished = db.collection(JOB_COLLECTION).where(filter=FieldFilter('finished_at', '>', archived_at)).stream()
+        jobs = sorted(jobs + [(doc.id, doc.to_dict()) for doc in finished],
+                      key=lambda item: item[1].get('created_at') or timezone.now())
+    if not jobs:
+        return records
+
+    patched = []
+    for record in records:
+        # 依建立順序套用，連續改學號 (A → B → C) 也能對應到最新的值
+        for _, job in jobs:
+            if record.get('student_id') == job['old_student_id']:
+                record = {**record, **job['updates']}
+        patched.append(record)
+    return patched
+
+
+class FanoutWorker:
+    """以單一背景執行緒依序執行同步工作 (同一社員的多次修改不會交錯)。"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, tenant, job_id):
+        self._queue.put((tenant, job_id))
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='student-fanout', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            tenant, job_id = self._queue.get()
+            try:
+                with tenancy.activate(tenant):
+                    job = run_job(firebase_init.get_firestore_client(), job_id)
+                if job['status'] == 'done':
+                    logger.info("社員變更同步完成 %s: %s 筆簽到記錄", job_id, job.get('processed'))
+                else:
+                    logger.info("社員變更同步 %s 由其他程序執行中，略過", job_id)
+            except Exception as e:
+                logger.exception("社員變更同步失敗 %s: %s", job_id, e)
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+
+_worker = FanoutWorker()
+
+
+def submit(job_id):
+    """在目前社團的 context 下，將工作交給背景執行緒。"""
+    _worker.submit(tenancy.current_tenant(), job_id)
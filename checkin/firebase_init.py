@@ -2,26 +2,451 @@
 
 import os
 import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+from concurrent import futures
 from django.conf import settings
-from firebase_admin import credentials, initialize_app, firestore
+from firebase_admin import credentials, initialize_app, firestore, get_app
 from pathlib import Path
 from firebase_admin import _apps as initialized_apps  # 導入已初始化 app 檢查
+from firebase_admin import _DEFAULT_APP_NAME as DEFAULT_APP_NAME
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1.base_collection import BaseCollectionReference
+from google.cloud.firestore_v1.base_document import BaseDocumentReference
+from google.cloud.firestore_v1.base_query import BaseQuery
+from google.cloud.firestore_v1.base_batch import BaseWriteBatch
 
-# 讓 client 保持在模組級別，避免重複初始化
-_firestore_client = None
+from . import request_logging, tenancy
 
+logger = logging.getLogger(__name__)
 
-def get_firestore_client():
+# 讓 client 保持在模組級別 (每個社團一個)，避免重複初始化
+_firestore_clients = {}
+_firestore_clients_lock = threading.Lock()
+
+# 預設的逾時 / 重試 / 斷路器參數，可由 settings.FIRESTORE_RESILIENCE 覆寫
+DEFAULT_RESILIENCE = {
+    'read_timeout': 5.0,        # 單次讀取操作 (含重試) 的總期限，秒
+    'write_timeout': 10.0,      # 單次寫入操作的期限，秒
+    'max_retries': 3,           # 冪等讀取的最大重試次數
+    'backoff_base': 0.1,        # 指數退避的起始等待秒數
+    'backoff_max': 2.0,         # 指數退避的等待上限
+    'hedge_enabled': False,     # 是否在慢讀取時送出重複請求 (hedged read)
+    'hedge_min_delay': 0.05,    # 送出重複請求前至少等待的秒數
+    'hedge_min_samples': 20,    # 累積多少筆延遲樣本後才啟用 p95 門檻
+    'hedge_workers': 8,         # hedged read 使用的執行緒數量 (每個社團)
+    'breaker_threshold': 5,     # 連續失敗幾次後開啟斷路器
+    'breaker_cooldown': 30.0,   # 斷路器開啟後多久允許試探請求，秒
+}
+
+# 視為暫時性、可重試的 gRPC 錯誤
+TRANSIENT_ERRORS = (
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.Aborted,
+    google_exceptions.Unknown,
+)
+
+# 會發出 RPC 的方法：讀取 (冪等，可重試/hedge) 與寫入 (只套用期限)
+_READ_METHODS = frozenset({'get', 'stream', 'get_all'})
+# 回傳 generator 的讀取方法，需在期限內讀完
+_STREAMING_METHODS = frozenset({'stream', 'get_all'})
+_WRITE_METHODS = frozenset({'add', 'set', 'update', 'delete', 'create'})
+_WRAPPED_TYPES = (BaseQuery, BaseCollectionReference, BaseDocumentReference, BaseWriteBatch)
+
+
+class FirestoreUnavailable(Exception):
+    """斷路器開啟中：Firestore 暫時不健康，直接快速失敗而不發出請求。"""
+
+
+class CircuitBreaker:
+    """
+    簡單的連續失敗斷路器。
+    開啟後在 cooldown 期間內直接拒絕請求，之後只放行一個試探請求 (half-open)。
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.cooldown or self._trial_in_flight:
+                raise FirestoreUnavailable('Firestore 暫時無法使用，請稍後再試。')
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+class LatencyTracker:
+    """記錄每種操作最近的延遲樣本，用來估算 hedged read 的 p95 門檻。"""
+
+    def __init__(self, window=200):
+        self._window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, op, seconds):
+        with self._lock:
+            self._samples.setdefault(op, deque(maxlen=self._window)).append(seconds)
+
+    def p95(self, op, min_samples):
+        with self._lock:
+            samples = self._samples.get(op)
+            if not samples or len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+class _ResilientRef:
+    """
+    包裝 Firestore 的 Collection / Document / Query / WriteBatch 物件。
+    串接方法 (where、order_by、document...) 回傳同樣被包裝的物件，
+    真正發出 RPC 的方法則交給 ResilientFirestoreClient 套用期限、重試與斷路器。
+    """
+
+    __slots__ = ('_target', '_client')
+
+    def __init__(self, target, client):
+        self._target = target
+        self._client = client
+
+    @property
+    def raw(self):
+        return self._target
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        op = f"{type(self._target).__name__}.{name}"
+        is_batch = isinstance(self._target, BaseWriteBatch)
+
+        if name in _READ_METHODS and not is_batch:
+            return lambda *args, **kwargs: self._client._read(op, attr, name in _STREAMING_METHODS, args, kwargs)
+        if (name in _WRITE_METHODS and not is_batch) or (is_batch and name == 'commit'):
+            return lambda *args, **kwargs: self._client._write(op, attr, args, kwargs)
+
+        def passthrough(*args, **kwargs):
+            return self._client._wrap(attr(*_unwrap_args(args), **_unwrap_kwargs(kwargs)))
+        return passthrough
+
+    def __repr__(self):
+        return f"<Resilient {self._target!r}>"
+
+
+def _unwrap(value):
+    if isinstance(value, (list, tuple)):
+        # 例如 get_all([doc_ref, ...])
+        return type(value)(_unwrap(item) for item in value)
+    return value.raw if isinstance(value, _ResilientRef) else value
+
+
+def _unwrap_args(args):
+    return tuple(_unwrap(arg) for arg in args)
+
+
+def _unwrap_kwargs(kwargs):
+    return {key: _unwrap(value) for key, value in kwargs.items()}
+
+
+class ResilientFirestoreClient(_ResilientRef):
+    """
+    Firestore Client 的包裝：
+    - 每個操作都帶有期限 (timeout)
+    - 冪等讀取遇到暫時性錯誤時以 jitter 指數退避重試
+    - (選用) 讀取超過 p95 延遲時送出重複請求，取先完成者
+    - 連續失敗時開啟斷路器，快速失敗
+    用法與原生 client 相同：db.collection('students').where(...).stream()
+    """
+
+    __slots__ = ('config', 'breaker', 'latency', 'namespace', '_slots', '_stats', '_stats_lock',
+                 '_hedge_executor', '_hedge_lock')
+
+    def __init__(self, raw_client, config=None, namespace='', max_concurrency=None):
+        super().__init__(raw_client, self)
+        self.config = {**DEFAULT_RESILIENCE, **(config or {})}
+        self.breaker = CircuitBreaker(self.config['breaker_threshold'], self.config['breaker_cooldown'])
+        self.latency = LatencyTracker()
+        # 社團的 collection 命名空間，例如 'tenants/gdg-taipei'
+        self.namespace = namespace.strip('/')
+        # 同時進行中的操作上限，避免單一社團占滿連線
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        # hedged read 的執行緒池 (延遲建立)；每個社團各自一個，慢的社團不會占滿其他社團的執行緒
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+
+    def _scoped(self, path):
+        return f"{self.namespace}/{path}" if self.namespace else path
+
+    def collection(self, path, *rest):
+        return self._wrap(self._target.collection(self._scoped(path), *rest))
+
+    def document(self, path, *rest):
+        return self._wrap(self._target.document(self._scoped(path), *rest))
+
+    def _acquire_slot(self, timeout):
+        if self._slots is not None and not self._slots.acquire(timeout=max(timeout, 0)):
+            raise FirestoreUnavailable('此社團目前的資料庫請求過多，請稍後再試。')
+
+    def _release_slot(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def _enter(self, timeout):
+        """
+        取得社團的請求名額後才詢問斷路器：half-open 的試探請求一旦放行就一定會發出，
+        並由呼叫端以 record_success / record_failure 結束，不會卡在「試探中」。
+        """
+        self._acquire_slot(timeout)
+        try:
+            self.breaker.before_call()
+        except FirestoreUnavailable:
+            self._release_slot()
+            raise
+
+    def _count(self, op, documents=0):
+        with self._stats_lock:
+            self._stats[op] += 1
+            if documents:
+                self._stats['documents_read'] += documents
+
+    def stats(self):
+        """
+        返回目前累計的操作次數 {'Query.stream': n, ..., 'documents_read': n}。
+        """
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+    def _wrap(self, value):
+        if isinstance(value, _WRAPPED_TYPES):
+            return _ResilientRef(value, self)
+        return value
+
+    def _backoff(self, attempt):
+        # Full jitter：在 [0, min(上限, base * 2^n)] 之間隨機等待
+        ceiling = min(self.config['backoff_max'], self.config['backoff_base'] * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def _read(self, op, method, materialize, args, kwargs):
+        args, kwargs = _unwrap_args(args), _unwrap_kwargs(kwargs)
+        deadline = time.monotonic() + self.config['read_timeout']
+
+        # 名額與斷路器以一個邏輯操作為單位：重試期間持有名額，重試用盡後才記錄一次失敗，
+        # 少數幾個慢請求的重試不會讓斷路器對所有呼叫端開啟
+        self._enter(self.config['read_timeout'])
+        try:
+            result, elapsed = self._read_with_retries(op, method, materialize, args, kwargs, deadline)
+        except TRANSIENT_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # 非暫時性錯誤 (例如 NotFound、缺少索引) 代表服務仍有回應
+            self.breaker.record_success()
+            raise
+        finally:
+            self._release_slot()
+
+        self.breaker.record_success()
+        self.latency.record(op, elapsed)
+        request_logging.record_firestore_op(op, elapsed)
+        if materialize or isinstance(result, list):
+            self._count(op, len(result))
+        else:
+            self._count(op, 1 if getattr(result, 'exists', False) else 0)
+        return result
+
+    def _read_with_retries(self, op, method, materialize, args, kwargs, deadline):
+        """在期限內重試暫時性錯誤，返回 (結果, 最後一次嘗試的耗時)。"""
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise google_exceptions.DeadlineExceeded(f'{op} 超過期限 {self.config["read_timeout"]} 秒')
+
+            def call(timeout=remaining):
+                result = method(*args, retry=None, timeout=timeout, **kwargs)
+                # stream() 回傳 generator，必須在期限內讀完才算完成
+                return list(result) if materialize else result
+
+            started = time.monotonic()
+            try:
+                result = self._hedged(op, call)
+            except TRANSIENT_ERRORS:
+                request_logging.record_firestore_op(f"{op}!retry", time.monotonic() - started)
+                attempt += 1
+                pause = self._backoff(attempt - 1)
+                if attempt > self.config['max_retries'] or time.monotonic() + pause >= deadline:
+                    raise
+                time.sleep(pause)
+                continue
+            return result, time.monotonic() - started
+
+    def _get_hedge_executor(self):
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                prefix = 'firestore-hedge-' + (self.namespace.rsplit('/', 1)[-1] if self.namespace else 'default')
+                self._hedge_executor = futures.ThreadPoolExecutor(
+                    max_workers=self.config['hedge_workers'], thread_name_prefix=prefix
+                )
+            return self._hedge_executor
+
+    def _hedged(self, op, call):
+        if not self.config['hedge_enabled']:
+            return call()
+
+        threshold = self.latency.p95(op, self.config['hedge_min_samples'])
+        if threshold is None:
+            return call()
+
+        executor = self._get_hedge_executor()
+        pending = {executor.submit(call)}
+        done, pending = futures.wait(pending, timeout=max(threshold, self.config['hedge_min_delay']))
+        if not done:
+            # 主請求超過 p95 仍未完成，送出一個重複請求
+            pending.add(executor.submit(call))
+
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+
+    def _write(self, op, method, args, kwargs):
+        # 寫入不自動重試 (add 不是冪等的)，只套用期限與斷路器
+        self._enter(self.config['write_timeout'])
+        started = time.monotonic()
+        try:
+            result = method(*_unwrap_args(args), retry=None, timeout=self.config['write_timeout'],
+                            **_unwrap_kwargs(kwargs))
+        except TRANSIENT_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            self.breaker.record_success()
+            raise
+        finally:
+            self._release_slot()
+            request_logging.record_firestore_op(op, time.monotonic() - started)
+        self.breaker.record_success()
+        self._count(op)
+        return result
+
+
+def get_firestore_client(tenant=None):
+    """
+    返回社團專用的單例 (Singleton) ResilientFirestoreClient，預設為目前請求所屬的社團。
+    所有 view 都應透過這個函式取得 client，以套用期限、重試、斷路器與社團命名空間。
+    """
+    slug = tenant or tenancy.current_tenant()
+
+    client = _firestore_clients.get(slug)
+    if client is not None:
+        return client
+
+    with _firestore_clients_lock:
+        if slug in _firestore_clients:
+            return _firestore_clients[slug]
+
+        config = tenancy.get_tenant_config(slug)
+        if config is None:
+            logger.error("未設定的社團: %s", slug)
+            return None
+
+        raw_client = _init_raw_client(config['credentials_env'], app_name=slug)
+        if raw_client is None:
+            return None
+
+        client = ResilientFirestoreClient(
+            raw_client,
+            getattr(settings, 'FIRESTORE_RESILIENCE', None),
+            namespace=config['namespace'],
+            max_concurrency=config['max_concurrency'],
+        )
+        _firestore_clients[slug] = client
+        return client
+
+
+def get_all_clients():
     """
-    初始化並返回單例 (Singleton) Firestore Client。
+    返回目前已建立的所有社團 client {slug: client}。
     """
-    global _firestore_client
+    with _firestore_clients_lock:
+        return dict(_firestore_clients)
 
-    if _firestore_client is not None:
-        return _firestore_client
+
+def _init_raw_client(credentials_env=None, app_name=None):
+    """
+    初始化 Firebase Admin SDK 並返回原生 Firestore Client。
+    credentials_env 指定時，以該環境變數中的金鑰初始化獨立的 Firebase App (社團使用自己的專案)。
+    """
 
     FIREBASE_CREDENTIALS = None
 
+    # --- 本地模擬器 (Firestore Emulator) ---
+    # 設定 FIRESTORE_EMULATOR_HOST 時不需要金鑰，直接連到本地模擬器 (壓力測試 / 重播使用)
+    if os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import firestore as cloud_firestore
+
+        project_id = os.environ.get('FIREBASE_PROJECT_ID', 'demo-gdg-checkin')
+        logger.info("使用本地 Firestore 模擬器: %s (project: %s)", os.environ['FIRESTORE_EMULATOR_HOST'], project_id)
+        return cloud_firestore.Client(project=project_id, credentials=AnonymousCredentials())
+
+    # --- 獨立專案的社團 ---
+    if credentials_env:
+        try:
+            if app_name not in initialized_apps:
+                cred = credentials.Certificate(json.loads(os.environ[credentials_env]))
+                initialize_app(cred, name=app_name)
+                logger.info("Firebase App [%s] 初始化成功！", app_name)
+            return firestore.client(app=get_app(app_name))
+        except KeyError:
+            logger.error("未設定環境變數 %s，社團 %s 無法使用。", credentials_env, app_name)
+        except Exception as e:
+            logger.exception("Firebase App [%s] 初始化失敗: %s", app_name, e)
+        return None
+
     # --- 獲取認證資料 ---
     FIREBASE_CREDENTIALS_JSON = os.environ.get('FIREBASE_CREDENTIALS_JSON')
 
@@ -30,7 +455,7 @@ def get_firestore_client():
         try:
             FIREBASE_CREDENTIALS = json.loads(FIREBASE_CREDENTIALS_JSON)
         except json.JSONDecodeError:
-            print("FIREBASE_CREDENTIALS_JSON 環境變數 JSON 解析錯誤！")
+            logger.error("FIREBASE_CREDENTIALS_JSON 環境變數 JSON 解析錯誤！")
             return None
     else:
         # 方式二：從檔案載入 (本地開發)
@@ -44,31 +469,30 @@ def get_firestore_client():
 
         # 捕獲所有可能的本地錯誤
         except FileNotFoundError:
-            print(f"本地未找到 serviceAccountKey.json 檔案。預期路徑: {key_path}")
+            logger.warning("本地未找到 serviceAccountKey.json 檔案。預期路徑: %s", key_path)
         except AttributeError:
-            print("settings.BASE_DIR 存取錯誤，請確認 settings.py 設定。")
+            logger.error("settings.BASE_DIR 存取錯誤，請確認 settings.py 設定。")
         except Exception as e:
             # 捕獲其他如 JSON 格式錯誤
-            print(f"載入 serviceAccountKey.json 時發生錯誤: {e}")
+            logger.exception("載入 serviceAccountKey.json 時發生錯誤: %s", e)
 
     # --- 執行初始化 ---
     if FIREBASE_CREDENTIALS:
         try:
             # 檢查是否已經有預設 App 初始化，避免重複初始化錯誤
-            if not initialized_apps:
+            if DEFAULT_APP_NAME not in initialized_apps:
                 cred = credentials.Certificate(FIREBASE_CREDENTIALS)
                 initialize_app(cred)
-                print("Firebase Admin SDK 初始化成功！")
+                logger.info("Firebase Admin SDK 初始化成功！")
 
             # 獲取 Firestore 客戶端
-            _firestore_client = firestore.client()
-            return _firestore_client
+            return firestore.client()
 
         except Exception as e:
             # 捕獲所有初始化錯誤，例如認證失敗
-            print(f"Firebase 初始化失敗: 請檢查金鑰內容或網路連線。錯誤: {e}")
+            logger.exception("Firebase 初始化失敗: 請檢查金鑰內容或網路連線。錯誤: %s", e)
             return None
 
     # 如果 FIREBASE_CREDENTIALS 是 None，則表示認證資訊缺失
-    print("警告: 未找到 Firebase 認證資訊，Firebase 功能將無法使用。")
+    logger.warning("未找到 Firebase 認證資訊，Firebase 功能將無法使用。")
     return None
\ No newline at end of file
@@ -0,0 +1,216 @@
+# checkin/mailer.py
+
+"""
+簽到確認信的背景寄送。
+
+handle_checkin 只把事件放進記憶體佇列 (不會等待 SMTP)，由背景執行緒批次寄出：
+- 重複使用同一個 SMTP 連線，閒置一段時間後才關閉
+- 依 rate_per_minute 控制寄送速度
+- 寄送失敗以指數退避重試，超過 max_attempts 後放棄
+- 同一社團、同一課程、同一社員只寄一次
+
+本地測試可啟動 SMTP sink (例如 `python -m aiosmtpd -n -l localhost:1025`)，
+並設定環境變數 EMAIL_HOST=localhost、EMAIL_PORT=1025。
+"""
+
+import atexit
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': False,
+    'batch_size': 20,           # 每批最多寄送幾封
+    'batch_wait': 2.0,          # 湊滿一批最多等待的秒數
+    'rate_per_minute': 60,      # 每分鐘最多寄送幾封
+    'max_attempts': 5,          # 每封信最多嘗試次數
+    'retry_base': 5.0,          # 重試的起始等待秒數 (之後加倍)
+    'idle_close': 30.0,         # SMTP 連線閒置多久後關閉
+    'queue_size': 10000,        # 佇列上限，超過時捨棄新的事件
+    'dedup_size': 50000,        # 記住多少組 (社團, 課程, 社員) 以避免重複寄送
+}
+
+
+class ConfirmationMailer:
+    """以單一背景執行緒批次寄送簽到確認信。"""
+
+    def __init__(self, config=None):
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self._queue = queue.Queue(maxsize=self.config['queue_size'])
+        self._retries = []  # (到期時間, 序號, 訊息) 的 heap
+        self._sequence = itertools.count()
+        self._seen = OrderedDict()
+        self._seen_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._connection = None
+        self._in_flight = 0
+        self._last_sent = 0.0
+        self._last_activity = time.monotonic()
+
+    def enqueue(self, key, message):
+        """
+        放入佇列 (不阻塞)。重複或佇列已滿時返回 False。
+        """
+        with self._seen_lock:
+            if key in self._seen:
+                return False
+            self._seen[key] = True
+            if len(self._seen) > self.config['dedup_size']:
+                self._seen.popitem(last=False)
+
+        try:
+            self._queue.put_nowait({'key': key, 'message': message, 'attempts': 0})
+        except queue.Full:
+            logger.warning("確認信佇列已滿，略過: %s", key)
+            with self._seen_lock:
+                self._seen.pop(key, None)
+            return False
+
+        self._ensure_worker()
+        return True
+
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='checkin-mailer', daemon=True)
+                self._thread.start()
+
+    def _next_batch(self):
+        """
+        取得下一批要寄的信：到期的重試優先，再從佇列補滿。
+        """
+        batch = []
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.config['batch_size']:
+            batch.append(heapq.heappop(self._retries)[2])
+            self._in_flight += 1
+
+        # 沒有待寄的信時，最多等到下一個重試到期 (或關閉閒置連線的時間)
+        timeout = self.config['idle_close']
+        if self._retries:
+            timeout = min(timeout, max(0.0, self._retries[0][0] - now))
+
+        deadline = now + (self.config['batch_wait'] if batch else timeout)
+        while len(batch) < self.config['batch_size']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            self._in_flight += 1
+            # 收到第一封後，只再等 batch_wait 湊成一批
+            deadline = min(deadline, time.monotonic() + self.config['batch_wait'])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._send_batch(batch)
+            elif self._connection is not None and time.monotonic() - self._last_activity > self.config['idle_close']:
+                self._close_connection()
+
+    def _open_connection(self):
+        if self._connection is None:
+            self._connection = get_connection(fail_silently=False)
+            self._connection.open()
+        return self._connection
+
+    def _close_connection(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def _throttle(self):
+        interval = 60.0 / self.config['rate_per_minute']
+        wait = self._last_sent + interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_sent = time.monotonic()
+
+    def _send_batch(self, batch):
+        for item in batch:
+            self._throttle()
+            try:
+                self._open_connection().send_messages([item['message']])
+            except Exception as e:
+                # 連線可能已失效，下次重新建立
+                self._close_connection()
+                self._schedule_retry(item, e)
+            self._in_flight -= 1
+            self._last_activity = time.monotonic()
+
+    def _schedule_retry(self, item, error):
+        item['attempts'] += 1
+        if item['attempts'] >= self.config['max_attempts']:
+            logger.error("確認信寄送失敗 (已嘗試 %s 次)，放棄: %s 錯誤: %s", item['attempts'], item['key'], error)
+            return
+        delay = self.config['retry_base'] * (2 ** (item['attempts'] - 1))
+        heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), item))
+
+    def pending(self):
+        """尚未寄出的信件數 (含等待重試)。"""
+        return self._queue.qsize() + len(self._retries) + self._in_flight
+
+    def drain(self, timeout):
+        """等待佇列寄完 (最多 timeout 秒)，供程式結束前使用。"""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+
+def get_mailer():
+    global _mailer
+    with _mailer_lock:
+        if _mailer is None:
+            _mailer = ConfirmationMailer(getattr(settings, 'CHECKIN_CONFIRMATION_EMAIL', None))
+            atexit.register(_mailer.drain, 5.0)
+        return _mailer
+
+
+def enqueue_checkin_confirmation(tenant, course_id, course_name, student_id, student_name, email, checkin_time):
+    """
+    簽到成功後呼叫：建立確認信並放入背景佇列。不會阻塞，也不會拋出例外。
+    """
+    try:
+        mailer = get_mailer()
+        if not mailer.config['enabled'] or not email:
+            return False
+
+        message = EmailMessage(
+            subject=f'[{course_name}] 簽到成功通知',
+            body=(
+                f'{student_name} 您好：\n\n'
+                f'您已於 {checkin_time.strftime("%Y/%m/%d %H:%M:%S")} 完成「{course_name}」的簽到。\n'
+                f'學號：{student_id}\n\n'
+                f'此信件由簽到系統自動發送，請勿直接回覆。'
+            ),
+            from_email=mailer.config.get('from_email') or settings.DEFAULT_FROM_EMAIL,
+            to=[email],
+        )
+        return mailer.enqueue((tenant, course_id, student_id), message)
+    except Exception as e:
+        logger.exception("確認信排入佇列失敗: %s", e)
+        return False
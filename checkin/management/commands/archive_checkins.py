@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from checkin import archive, firebase_init, tenancy
+
+
+class Command(BaseCommand):
+    help = (
+        "將早於截止日的課程之簽到記錄移到冷儲存 (壓縮後存放)，並在課程文件留下摘要。"
+        "已封存的課程仍可透過匯出與簽到列表讀取。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', metavar='YYYY-MM-DD',
+                            help='封存課程日期早於此日的課程 (預設為 CHECKIN_ARCHIVE 的 cutoff_days 天前)')
+        parser.add_argument('--store', choices=['firestore', 'local'],
+                            help='冷儲存位置 (預設為 CHECKIN_ARCHIVE 的 store)')
+        parser.add_argument('--dry-run', action='store_true', help='只列出會封存的課程與筆數，不寫入')
+        parser.add_argument('--tenant', default=tenancy.DEFAULT_TENANT,
+                            help=f'要封存的社團 (預設 {tenancy.DEFAULT_TENANT})')
+
+    def handle(self, *args, **options):
+        config = archive.get_config()
+        if options['store']:
+            config['store'] = options['store']
+
+        if options['before']:
+            try:
+                cutoff = datetime.strptime(options['before'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('日期格式錯誤，請使用 YYYY-MM-DD 格式。')
+        else:
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            cutoff = today - timedelta(days=config['cutoff_days'])
+
+        with tenancy.activate(options['tenant']):
+            db = firebase_init.get_firestore_client()
+            if not db:
+                raise CommandError('Firebase 未初始化，無法封存。')
+
+            self.stdout.write(f"封存 {cutoff:%Y/%m/%d} 之前的課程 (冷儲存: {config['store']})...")
+            totals = {'courses': 0, 'count': 0, 'bytes': 0, 'deleted': 0, 'errors': 0}
+            for result in archive.archive_before(db, cutoff, config=config, dry_run=options['dry_run']):
+                if 'error' in result:
+                    totals['errors'] += 1
+                    self.stderr.write(f"  {result['course_id']}: 失敗 ({result['error']})")
+                    continue
+                totals['courses'] += 1
+                for key in ('count', 'bytes', 'deleted'):
+                    totals[key] += result[key]
+                self.stdout.write(
+                    f"  {result['course_id']}: 封存 {result['count']} 筆 ({result['bytes']:,} bytes)，"
+                    f"刪除熱資料 {result['deleted']} 筆"
+                )
+
+        summary = (
+            f"共 {totals['courses']} 堂課，封存 {totals['count']} 筆，壓縮後 {totals['bytes']:,} bytes，"
+            f"刪除熱資料 {totals['deleted']} 筆"
+        )
+        if options['dry_run']:
+            summary = '(dry run) ' + summary
+        if totals['errors']:
+            self.stdout.write(self.style.WARNING(f"{summary}，{totals['errors']} 堂課失敗"))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
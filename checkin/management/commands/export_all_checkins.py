@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from checkin import exports, firebase_init, tenancy
+
+
+class Command(BaseCommand):
+    help = (
+        "分頁匯出全部簽到記錄 (含已封存課程) 為 gzip JSONL 或 Parquet。"
+        "中斷後以相同參數重新執行會從上次的游標繼續 (加上 --restart 則從頭開始)。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='輸出路徑 (jsonl 為檔案，例如 checkins.jsonl.gz；parquet 為資料夾)')
+        parser.add_argument('--format', choices=['jsonl', 'parquet'], default='jsonl')
+        parser.add_argument('--page-size', type=int, default=exports.PAGE_SIZE,
+                            help=f'每次分頁讀取的文件數 (預設 {exports.PAGE_SIZE})')
+        parser.add_argument('--rows-per-file', type=int, default=exports.ROWS_PER_FILE,
+                            help=f'Parquet 每個 part 檔的筆數 (預設 {exports.ROWS_PER_FILE})')
+        parser.add_argument('--restart', action='store_true', help='忽略既有的續傳狀態，從頭匯出')
+        parser.add_argument('--tenant', default=tenancy.DEFAULT_TENANT,
+                            help=f'要匯出的社團 (預設 {tenancy.DEFAULT_TENANT})')
+
+    def handle(self, *args, **options):
+        db = firebase_init.get_firestore_client(options['tenant'])
+        if not db:
+            raise CommandError('Firebase 未初始化，無法匯出。')
+
+        output = options['output']
+        resume = not options['restart']
+        state = exports.load_state(output) if resume else None
+        if state:
+            position = (f"已封存課程 {state['archived_course']}" if state.get('archived_course')
+                        else f"最後 ID {state['last_id']}")
+            self.stdout.write(f"從上次進度繼續：已匯出 {state['count']} 筆，{position}")
+
+        started = time.monotonic()
+
+        def on_page(total):
+            self.stdout.write(f"\r已匯出 {total} 筆", ending='')
+            self.stdout.flush()
+
+        try:
+            if options['format'] == 'jsonl':
+                exported, total = exports.export_jsonl(
+                    db, output, page_size=options['page_size'], resume=resume, on_page=on_page
+                )
+            else:
+                exported, total = exports.export_parquet(
+                    db, output, page_size=options['page_size'], rows_per_file=options['rows_per_file'],
+                    resume=resume, on_page=on_page
+                )
+        except (ImportError, ValueError) as e:
+            raise CommandError(str(e))
+
+        elapsed = time.monotonic() - started
+        rate = exported / elapsed if elapsed > 0 else 0
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"匯出完成：本次 {exported} 筆 (累計 {total} 筆)，耗時 {elapsed:.1f} 秒，約 {rate:,.0f} 筆/秒"
+        ))
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent import futures
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import setup_test_environment
+
+from checkin import firebase_init, tenancy, tracing
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "重播 RequestTraceMiddleware 錄下的請求軌跡，依原本的到達間隔 (可加速) 送出，"
+        "並回報延遲百分位數與 Firestore 操作次數。預設只允許連到本地 Firestore 模擬器。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace_file', nargs='?',
+                            help='軌跡檔路徑 (預設為 settings.CHECKIN_TRACE_FILE)')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='重播倍速，例如 1、10、100 (預設 1)')
+        parser.add_argument('--workers', type=int, default=16,
+                            help='同時處理請求的執行緒數 (預設 16)')
+        parser.add_argument('--emulator', metavar='HOST:PORT',
+                            help='Firestore 模擬器位址 (會設定 FIRESTORE_EMULATOR_HOST)')
+        parser.add_argument('--fixture', metavar='PATH',
+                            help='重播前先寫入 snapshot_trace_fixture 建立的 fixture (課程、假名社員與既有簽到)')
+        parser.add_argument('--allow-live', action='store_true',
+                            help='允許在未使用模擬器時重播 (會寫入正式資料庫！)')
+
+    def handle(self, *args, **options):
+        if options['speed'] <= 0:
+            raise CommandError('--speed 必須大於 0')
+
+        if options['emulator']:
+            os.environ['FIRESTORE_EMULATOR_HOST'] = options['emulator']
+        if not os.environ.get('FIRESTORE_EMULATOR_HOST') and not options['allow_live']:
+            raise CommandError('重播會產生簽到與寫入，請使用 --emulator 指定本地模擬器 (或明確加上 --allow-live)。')
+
+        path = options['trace_file'] or tracing.get_trace_file()
+        try:
+            traces = tracing.load_traces(path)
+        except FileNotFoundError:
+            raise CommandError(f'找不到軌跡檔: {path}')
+        # 社員管理端點的 payload 沒有錄下，重播只會得到 400，略過
+        redacted = sum(1 for entry in traces if entry.get('redacted'))
+        traces = [entry for entry in traces if not entry.get('redacted')]
+        if not traces:
+            raise CommandError(f'{path} 中沒有可重播的請求軌跡。')
+
+        db = firebase_init.get_firestore_client()
+        if not db:
+            raise CommandError('Firebase 未初始化，無法重播。')
+
+        if options['fixture']:
+            try:
+                with open(options['fixture'], 'r', encoding='utf-8') as f:
+                    fixture = json.load(f)
+            except FileNotFoundError:
+                raise CommandError(f"找不到 fixture: {options['fixture']}")
+            with tenancy.activate(fixture.get('tenant', tenancy.DEFAULT_TENANT)):
+                written = tracing.seed_fixture(firebase_init.get_firestore_client(), fixture)
+            self.stdout.write(
+                f"已寫入 fixture：{len(fixture['courses'])} 門課程、{len(fixture['students'])} 位社員，共 {written} 份文件"
+            )
+        else:
+            self.stdout.write(self.style.WARNING(
+                '未指定 --fixture：模擬器中沒有對應假名的社員時，簽到只會得到 non_member'
+            ))
+
+        # 讓測試用 Client 的 testserver 主機名稱通過 ALLOWED_HOSTS 檢查
+        setup_test_environment()
+        for client in firebase_init.get_all_clients().values():
+            client.reset_stats()
+
+        span = traces[-1]['ts'] - traces[0]['ts']
+        self.stdout.write(
+            f"重播 {len(traces)} 個請求 (原始時長 {span:.1f} 秒，{options['speed']:g}× 速度)..."
+        )
+        if redacted:
+            self.stdout.write(f"略過 {redacted} 個未記錄內容的社員管理請求")
+
+        latencies = defaultdict(list)
+        statuses = Counter()
+        lags = []
+        lock = threading.Lock()
+
+        def send(entry):
+            client = Client()
+            started = time.monotonic()
+            if entry['method'] == 'POST':
+                payload = entry.get('payload') or {}
+                if entry.get('content_type') == 'application/json':
+                    response = client.post(entry['path'], data=json.dumps(payload), content_type='application/json')
+                else:
+                    response = client.post(entry['path'], data=payload)
+            else:
+                response = client.get(entry['path'])
+            elapsed_ms = (time.monotonic() - started) * 1000
+
+            with lock:
+                latencies[entry.get('view') or entry['path']].append(elapsed_ms)
+                statuses[response.status_code] += 1
+
+        # 依原始到達時間排程 (open-loop)：伺服器變慢時不會拖慢後續請求的送出
+        replay_started = time.monotonic()
+        first_ts = traces[0]['ts']
+        with futures.ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            pending = []
+            for entry in traces:
+                due = (entry['ts'] - first_ts) / options['speed']
+                delay = due - (time.monotonic() - replay_started)
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < -0.001:
+                    lags.append(-delay * 1000)
+                pending.append(executor.submit(send, entry))
+            for future in futures.as_completed(pending):
+                future.result()
+
+        total_elapsed = time.monotonic() - replay_started
+        # 加總所有社團的 client (軌跡中可能包含多個社團的請求)
+        stats = Counter()
+        for client in firebase_init.get_all_clients().values():
+            stats.update(client.stats())
+        self._report(latencies, statuses, lags, dict(stats), total_elapsed, len(traces))
+
+    def _report(self, latencies, statuses, lags, stats, total_elapsed, count):
+        self.stdout.write('')
+        self.stdout.write(f"{'端點':<24}{'次數':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        all_samples = []
+        for view, samples in sorted(latencies.items()):
+            all_samples.extend(samples)
+            self.stdout.write(
+                f"{view:<24}{len(samples):>8}{_percentile(samples, 50):>10.1f}{_percentile(samples, 95):>10.1f}"
+                f"{_percentile(samples, 99):>10.1f}{max(samples):>10.1f}"
+            )
+        self.stdout.write(
+            f"{'(全部)':<24}{len(all_samples):>8}{_percentile(all_samples, 50):>10.1f}"
+            f"{_percentile(all_samples, 95):>10.1f}{_percentile(all_samples, 99):>10.1f}{max(all_samples):>10.1f}"
+        )
+
+        self.stdout.write('')
+        self.stdout.write('狀態碼: ' + ', '.join(f"{code}×{n}" for code, n in sorted(statuses.items())))
+        if lags:
+            self.stdout.write(f"排程延遲 (送出晚於原始時間): {len(lags)} 次，最大 {max(lags):.1f} ms")
+
+        self.stdout.write('')
+        self.stdout.write('Firestore 操作次數:')
+        documents_read = stats.pop('documents_read', 0)
+        for op, n in sorted(stats.items()):
+            self.stdout.write(f"  {op:<32}{n:>8}")
+        self.stdout.write(f"  {'讀取文件數':<32}{documents_read:>8}")
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：{count} 個請求，耗時 {total_elapsed:.1f} 秒 ({count / total_elapsed:.1f} req/s)"
+        ))
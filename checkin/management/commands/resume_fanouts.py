@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from checkin import fanout, firebase_init, tenancy
+
+
+class Command(BaseCommand):
+    help = (
+        "繼續執行尚未完成的社員變更同步工作 (例如伺服器在同步途中重新啟動)，"
+        "將社員的新學號 / 姓名 / 編號 / Email 寫入其歷史簽到記錄。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help='一併重試先前失敗的工作')
+        parser.add_argument('--page-size', type=int, default=fanout.PAGE_SIZE,
+                            help=f'每個 batch 更新的記錄數 (預設 {fanout.PAGE_SIZE}，上限 499)')
+        parser.add_argument('--tenant', default=tenancy.DEFAULT_TENANT,
+                            help=f'要處理的社團 (預設 {tenancy.DEFAULT_TENANT})')
+
+    def handle(self, *args, **options):
+        if not 0 < options['page_size'] < 500:
+            raise CommandError('--page-size 必須介於 1 到 499 之間。')
+
+        with tenancy.activate(options['tenant']):
+            db = firebase_init.get_firestore_client()
+            if not db:
+                raise CommandError('Firebase 未初始化，無法同步。')
+
+            jobs = fanout.unfinished_jobs(db, include_failed=options['retry_failed'])
+            if not jobs:
+                self.stdout.write('沒有未完成的同步工作。')
+                return
+
+            failed = 0
+            for job_id, job in jobs:
+                if job['status'] == 'failed':
+                    db.collection(fanout.JOB_COLLECTION).document(job_id).update({'status': 'pending'})
+                try:
+                    result = fanout.run_job(db, job_id, page_size=options['page_size'])
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"  {job_id} ({job['old_student_id']}): 失敗 ({e})")
+                    continue
+                if result['status'] != 'done':
+                    # 租約 (fanout.LEASE_SECONDS) 過期前，其他程序仍持有這個工作
+                    self.stdout.write(f"  {job_id} ({job['old_student_id']}): 由其他程序執行中，略過")
+                    continue
+                self.stdout.write(f"  {job_id} ({job['old_student_id']}): 已更新 {result['processed']} 筆簽到記錄")
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f"共 {len(jobs)} 個工作，{failed} 個失敗"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"共 {len(jobs)} 個工作已完成"))
@@ -0,0 +1,43 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from checkin import firebase_init, tenancy, tracing
+
+
+class Command(BaseCommand):
+    help = (
+        "依請求軌跡建立重播用的 fixture：軌跡中的課程、學號換成假名的社員與錄製前已有的簽到，"
+        "不含姓名與 Email。以 replay_traces --fixture 寫入模擬器後重播。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace_file', nargs='?',
+                            help='軌跡檔路徑 (預設為 settings.CHECKIN_TRACE_FILE)')
+        parser.add_argument('--output', metavar='PATH',
+                            help='fixture 輸出路徑 (預設為軌跡檔旁的 fixture.json)')
+        parser.add_argument('--tenant', default=tenancy.DEFAULT_TENANT,
+                            help=f'讀取哪個社團的資料 (預設 {tenancy.DEFAULT_TENANT})')
+
+    def handle(self, *args, **options):
+        path = options['trace_file'] or tracing.get_trace_file()
+        try:
+            traces = tracing.load_traces(path)
+        except FileNotFoundError:
+            raise CommandError(f'找不到軌跡檔: {path}')
+        output = options['output'] or os.path.join(os.path.dirname(os.path.abspath(path)), 'fixture.json')
+
+        with tenancy.activate(options['tenant']):
+            db = firebase_init.get_firestore_client()
+            if not db:
+                raise CommandError('Firebase 未初始化，無法建立 fixture。')
+            fixture = tracing.build_fixture(db, traces)
+        fixture['tenant'] = options['tenant']
+
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(fixture, f, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(
+            f"已寫入 {output}：{len(fixture['courses'])} 門課程、{len(fixture['students'])} 位社員、"
+            f"{sum(len(ids) for ids in fixture['checkins'].values())} 筆既有簽到"
+        ))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from checkin import firebase_init, replica, tenancy
+
+
+class Command(BaseCommand):
+    help = (
+        "將 Firestore 的 courses / students / checkin_records 同步到本地 SQL 資料表。"
+        "預設為增量同步 (只讀取上次同步後有變動的文件)。本地複本只包含預設社團的資料。"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='完整掃描所有文件，並刪除 Firestore 已不存在的本地資料')
+        parser.add_argument('--watch', action='store_true',
+                            help='常駐執行，以 snapshot listener 即時同步')
+        parser.add_argument('--page-size', type=int, default=replica.PAGE_SIZE,
+                            help=f'每次分頁讀取的文件數 (預設 {replica.PAGE_SIZE})')
+
+    def handle(self, *args, **options):
+        db = firebase_init.get_firestore_client(tenancy.DEFAULT_TENANT)
+        if not db:
+            raise CommandError('Firebase 未初始化，無法同步。')
+
+        started = time.monotonic()
+        results = replica.sync_all(db, full=options['full'], page_size=options['page_size'])
+        for name in replica.COLLECTIONS:
+            stats = results[name]
+            self.stdout.write(
+                f"{name}: 同步 {stats['applied']} 筆，略過 {stats['skipped']} 筆，刪除 {stats['deleted']} 筆"
+            )
+        if not options['full']:
+            self.stdout.write(f"依刪除記錄刪除 {results['tombstones']} 筆")
+        self.stdout.write(f"重新關聯簽到記錄 {results['relinked']} 筆")
+        self.stdout.write(self.style.SUCCESS(f"同步完成，耗時 {time.monotonic() - started:.1f} 秒"))
+
+        if not options['watch']:
+            return
+
+        watchers = replica.watch(db)
+        self.stdout.write('進入即時同步模式 (Ctrl+C 結束)...')
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            for watcher in watchers:
+                watcher.unsubscribe()
+            self.stdout.write('已停止即時同步。')
@@ -0,0 +1,83 @@
+# Generated by Django 4.2.25 on 2026-10-19 15:49
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0003_checkinrecord_member_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=100, unique=True, verbose_name='Collection')),
+                ('last_updated_at', models.DateTimeField(blank=True, null=True, verbose_name='最後同步的更新時間')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='最後執行時間')),
+                ('synced_count', models.PositiveIntegerField(default=0, verbose_name='上次同步筆數')),
+            ],
+            options={
+                'verbose_name': '同步進度',
+                'verbose_name_plural': '同步進度',
+            },
+        ),
+        migrations.AddField(
+            model_name='checkinrecord',
+            name='firestore_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Firestore ID'),
+        ),
+        migrations.AddField(
+            model_name='checkinrecord',
+            name='student_code',
+            field=models.CharField(blank=True, db_index=True, max_length=15, verbose_name='學號'),
+        ),
+        migrations.AddField(
+            model_name='checkinrecord',
+            name='student_email',
+            field=models.EmailField(blank=True, max_length=254, verbose_name='Email'),
+        ),
+        migrations.AddField(
+            model_name='checkinrecord',
+            name='student_name',
+            field=models.CharField(blank=True, max_length=100, verbose_name='社員姓名'),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='firestore_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Firestore ID'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='email',
+            field=models.EmailField(blank=True, max_length=254, verbose_name='Email'),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='firestore_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Firestore ID'),
+        ),
+        migrations.AlterField(
+            model_name='checkinrecord',
+            name='student',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='checkin.student', verbose_name='社員'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='classroom',
+            field=models.CharField(blank=True, max_length=50, verbose_name='社課教室'),
+        ),
+        migrations.AlterField(
+            model_name='course',
+            name='date',
+            field=models.DateField(db_index=True, default=django.utils.timezone.now, verbose_name='課程日期'),
+        ),
+        migrations.AddIndex(
+            model_name='checkinrecord',
+            index=models.Index(fields=['course', '-checkin_time'], name='checkin_course_time_idx'),
+        ),
+    ]
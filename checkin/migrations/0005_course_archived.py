@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-19 15:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkin', '0004_firestore_replica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='archived',
+            field=models.BooleanField(default=False, verbose_name='已封存'),
+        ),
+    ]
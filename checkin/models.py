@@ -16,6 +16,10 @@ class Student(models.Model):
 
     student_id = models.CharField(max_length=15, unique=True, verbose_name="學號")
     name = models.CharField(max_length=100, verbose_name="姓名")
+    email = models.EmailField(blank=True, verbose_name="Email")
+
+    # Firestore 文件 ID (由 sync_firestore 指令同步時寫入)
+    firestore_id = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="Firestore ID")
 
     def __str__(self):
         # 由於 member_id 可能為 None，使用 if-else 處理顯示
@@ -29,9 +33,11 @@ class Student(models.Model):
 
 class Course(models.Model):
     """社課課程資料模型"""
-    date = models.DateField(default=timezone.now, verbose_name="課程日期")
+    date = models.DateField(default=timezone.now, db_index=True, verbose_name="課程日期")
     name = models.CharField(max_length=200, verbose_name="課程名稱")
-    classroom = models.CharField(max_length=50, verbose_name="社課教室")
+    classroom = models.CharField(max_length=50, blank=True, verbose_name="社課教室")
+    archived = models.BooleanField(default=False, verbose_name="已封存")
+    firestore_id = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="Firestore ID")
 
     def __str__(self):
         return f"[{self.date}] {self.name}"
@@ -45,7 +51,13 @@ class Course(models.Model):
 class CheckinRecord(models.Model):
     """社員簽到記錄模型"""
     course = models.ForeignKey(Course, on_delete=models.CASCADE, verbose_name="課程")
-    student = models.ForeignKey(Student, on_delete=models.CASCADE, verbose_name="社員")
+    # Firestore 的簽到記錄不會隨社員刪除，因此允許為空 (以 student_code 對應)
+    student = models.ForeignKey(Student, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="社員")
+
+    # === 冗餘欄位：與 Firestore checkin_records 文件一致 ===
+    student_code = models.CharField(max_length=15, blank=True, db_index=True, verbose_name="學號")
+    student_name = models.CharField(max_length=100, blank=True, verbose_name="社員姓名")
+    student_email = models.EmailField(blank=True, verbose_name="Email")
 
     # === 新增欄位：社員編號 (冗餘儲存) ===
     member_id = models.IntegerField(
@@ -56,13 +68,33 @@ class CheckinRecord(models.Model):
     # ====================================
 
     checkin_time = models.DateTimeField(default=timezone.now, verbose_name="簽到時間")
+    firestore_id = models.CharField(max_length=64, unique=True, null=True, blank=True, verbose_name="Firestore ID")
 
     def __str__(self):
-        return f"{self.student.name} 簽到於 {self.course.name} ({self.checkin_time.strftime('%H:%M')})"
+        name = self.student.name if self.student else self.student_name
+        return f"{name} 簽到於 {self.course.name} ({self.checkin_time.strftime('%H:%M')})"
 
     class Meta:
         # 限制：一堂課同一位社員不可重復簽到
         unique_together = ('course', 'student')
+        indexes = [
+            models.Index(fields=['course', '-checkin_time'], name='checkin_course_time_idx'),
+        ]
         verbose_name = "簽到記錄"
         verbose_name_plural = "簽到記錄"
-        ordering = ['-checkin_time']
\ No newline at end of file
+        ordering = ['-checkin_time']
+
+
+class SyncCursor(models.Model):
+    """Firestore → 本地 SQL 同步進度 (每個 collection 一筆)"""
+    collection = models.CharField(max_length=100, unique=True, verbose_name="Collection")
+    last_updated_at = models.DateTimeField(null=True, blank=True, verbose_name="最後同步的更新時間")
+    last_run_at = models.DateTimeField(null=True, blank=True, verbose_name="最後執行時間")
+    synced_count = models.PositiveIntegerField(default=0, verbose_name="上次同步筆數")
+
+    def __str__(self):
+        return f"{self.collection} @ {self.last_updated_at}"
+
+    class Meta:
+        verbose_name = "同步進度"
+        verbose_name_plural = "同步進度"
@@ -0,0 +1,200 @@
+# checkin/presence.py
+
+"""
+課程進行中的出缺席狀態 (每個 process 各自保存於記憶體)。
+
+- 社員名單：依 member_id 排序後快取，roster_ttl 秒後或社員資料變更時重新讀取
+- 已簽到學號：每堂課一個 set，第一次查詢時從簽到記錄載入，之後由 handle_checkin 直接加入；
+  多個 process 同時服務時，其他 process 的簽到會在 checkins_ttl 秒後重新載入時反映
+- 課程場次 (course_session.py) 開啟中的課程，已簽到學號由場次固定 (pin)，不會過期或被淘汰
+- 未到名單 = 社員名單 - 已簽到學號，查詢時不需掃描任何 collection
+- 快取過期時，同一社團的名單 (或同一堂課的簽到) 只由一個執行緒重新讀取，其他執行緒等待結果
+
+所有快取皆以社團區分。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import archive, fanout, tenancy
+
+DEFAULT_CONFIG = {
+    'roster_ttl': 300,      # 社員名單快取秒數
+    'checkins_ttl': 60,     # 已簽到學號重新載入的間隔 (秒)
+    'max_courses': 64,      # 每個 process 最多保存幾堂課的簽到狀態
+}
+
+_lock = threading.Lock()
+_rosters = {}               # 社團 -> (載入時間, 社員 tuple)
+_courses = OrderedDict()    # (社團, 課程 ID) -> (載入時間, 已簽到學號 set)
+_pinned = {}                # (社團, 課程 ID) -> 已簽到學號 set (課程場次開啟中)
+_loading = {}               # ('roster' | 'checkins', ...) -> 載入用的 lock (single-flight)
+
+
+def get_config():
+    return {**DEFAULT_CONFIG, **getattr(settings, 'CHECKIN_PRESENCE', {})}
+
+
+def _member_sort_key(member):
+    member_id = member[0]
+    # 社員編號可能是數字或字串 (例如從試算表匯入)：數字 (含數字字串) 依大小排序，
+    # 其他字串排在數字之後，沒有社員編號的排在最後
+    text = '' if member_id is None else str(member_id).strip()
+    numeric = text.isdigit()
+    return (member_id is None, not numeric, int(text) if numeric else 0, text, member[1])
+
+
+def _load_lock(key):
+    with _lock:
+        lock = _loading.get(key)
+        if lock is None:
+            lock = _loading[key] = threading.Lock()
+        return lock
+
+
+def _cached_roster(tenant):
+    cached = _rosters.get(tenant)
+    if cached and time.monotonic() - cached[0] < get_config()['roster_ttl']:
+        return cached[1]
+    return None
+
+
+def get_roster(db):
+    """
+    返回目前社團依 member_id 排序的社員名單，每筆為 (member_id, student_id, name)。
+    """
+    tenant = tenancy.current_tenant()
+    roster = _cached_roster(tenant)
+    if roster is not None:
+        return roster
+
+    with _load_lock(('roster', tenant)):
+        # 等待期間其他執行緒可能已載入
+        roster = _cached_roster(tenant)
+        if roster is not None:
+            return roster
+
+        now = time.monotonic()
+        roster = []
+        for doc in db.collection('students').stream():
+            data = doc.to_dict()
+            if data.get('student_id'):
+                roster.append((data.get('member_id'), data['student_id'], data.get('name') or ''))
+        roster = tuple(sorted(roster, key=_member_sort_key))
+
+        with _lock:
+            _rosters[tenant] = (now, roster)
+        return roster
+
+
+def load_checked_in_ids(db, course_id, course_data):
+    """
+    從簽到記錄 (或冷儲存) 讀取課程的已簽到學號 set。
+    """
+    # 社員改學號的同步工作尚未完成時，先以新學號計算
+    records = fanout.apply_pending(db, archive.get_course_records(db, course_id, course_data), course_data)
+    return {record.get('student_id') for record in records if record.get('student_id')}
+
+
+def _cached_ids(key):
+    with _lock:
+        if key in _pinned:
+            return _pinned[key]
+        cached = _courses.get(key)
+        if cached and time.monotonic() - cached[0] < get_config()['checkins_ttl']:
+            _courses.move_to_end(key)
+            return cached[1]
+    return None
+
+
+def checked_in_ids(db, course_id):
+    """
+    返回課程的已簽到學號 set；課程不存在時返回 None。
+    """
+    key = (tenancy.current_tenant(), course_id)
+    ids = _cached_ids(key)
+    if ids is not None:
+        return ids
+
+    with _load_lock(('checkins',) + key):
+        # 等待期間其他執行緒可能已載入
+        ids = _cached_ids(key)
+        if ids is not None:
+            return ids
+
+        now = time.monotonic()
+        course_doc = db.collection('courses').document(course_id).get()
+        if not course_doc.exists:
+            return None
+        ids = load_checked_in_ids(db, course_id, course_doc.to_dict())
+
+        with _lock:
+            cached = _courses.get(key)
+            if cached:
+                # 載入期間 handle_checkin 加入的學號
+                ids |= cached[1]
+            _courses[key] = (now, ids)
+            _courses.move_to_end(key)
+            while len(_courses) > get_config()['max_courses']:
+                evicted, _ = _courses.popitem(last=False)
+                _loading.pop(('checkins',) + evicted, None)
+        return ids
+
+
+def mark_checked_in(course_id, student_id):
+    """
+    handle_checkin 成功 (或發現已簽到) 時呼叫。尚未載入的課程不需處理，查詢時會完整載入。
+    """
+    key = (tenancy.current_tenant(), course_id)
+    with _lock:
+        if key in _pinned:
+            _pinned[key].add(student_id)
+        cached = _courses.get(key)
+        if cached:
+            cached[1].add(student_id)
+
+
+def pin(course_id, ids):
+    """課程場次開啟時呼叫：之後的查詢直接使用場次的已簽到學號 set (同一個物件)。"""
+    with _lock:
+        _pinned[(tenancy.current_tenant(), course_id)] = ids
+
+
+def unpin(course_id):
+    with _lock:
+        _pinned.pop((tenancy.current_tenant(), course_id), None)
+
+
+def invalidate_roster():
+    """社員新增 / 修改 / 刪除後呼叫 (只影響本 process，其他 process 依 roster_ttl 更新)。"""
+    with _lock:
+        _rosters.pop(tenancy.current_tenant(), None)
+
+
+def invalidate_courses(course_id=None):
+    """清除一堂課 (或目前社團所有課程) 的簽到狀態，下次查詢時重新載入。"""
+    tenant = tenancy.current_tenant()
+    with _lock:
+        for key in list(_courses):
+            if key[0] == tenant and course_id in (None, key[1]):
+                del _courses[key]
+
+
+def absent_members(db, course_id, offset=0, limit=100):
+    """
+    返回課程尚未簽到的社員 (依 member_id 排序) 的一頁；課程不存在時返回 None。
+    """
+    checked_in = checked_in_ids(db, course_id)
+    if checked_in is None:
+        return None
+    roster = get_roster(db)
+    absent = [member for member in roster if member[1] not in checked_in]
+    return {
+        'total_members': len(roster),
+        'checked_in': sum(1 for member in roster if member[1] in checked_in),
+        'absent_count': len(absent),
+        'absent': absent[offset:offset + limit],
+    }
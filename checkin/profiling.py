@@ -0,0 +1,246 @@
+# checkin/profiling.py
+
+"""
+取樣式效能剖析 (選用)。
+
+SamplingProfilerMiddleware 將請求執行緒登記到共用的取樣執行緒，取樣執行緒每隔 interval 秒
+以 sys._current_frames() 讀取這些執行緒的呼叫堆疊並累計次數。請求執行緒本身不做任何額外工作，
+沒有登記的請求完全不受影響；登記了但尚未到開始取樣時間的請求，取樣執行緒也只是睡到最早的開始時間。
+
+以下請求會被剖析並寫出結果：
+- 依 sample_rate 隨機抽樣的請求
+- 帶有 X-Checkin-Profile: <header_token> 標頭的請求
+- 處理時間超過 slow_ms 的請求 (執行超過 watch_after_ms 後才開始取樣，只涵蓋變慢的那段)
+
+結果為 folded stacks 格式 (每行「frame;frame;... 次數」)，可直接交給 flamegraph.pl、
+speedscope 或 inferno 產生火焰圖：
+    <output_dir>/<view>/<時間>_<request ID>.folded
+每個剖析結果另外在 <output_dir>/index.jsonl 追加一行摘要，方便依 view 或 request ID 查詢。
+"""
+
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import request_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = {
+    'enabled': False,           # 啟用抽樣與慢請求剖析
+    'header_token': None,       # 設定後，帶有相符 X-Checkin-Profile 標頭的請求一律剖析
+    'sample_rate': 0.01,        # 隨機抽樣比例
+    'slow_ms': 1000,            # 超過此時間的請求寫出剖析結果 (None 表示不剖析慢請求)
+    'watch_after_ms': 500,      # 沒有被抽樣的請求執行超過此時間後才開始取樣
+    'interval': 0.005,          # 取樣間隔 (秒)
+    'max_depth': 128,           # 每個堆疊最多保留幾層
+    'output_dir': None,         # 預設為 BASE_DIR / 'profiles'
+}
+
+HEADER = 'X-Checkin-Profile'
+
+# request ID 可能來自用戶端的 X-Request-ID，用於檔名前需過濾
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def get_config():
+    config = {**DEFAULT_CONFIG, **getattr(settings, 'CHECKIN_PROFILING', {})}
+    if not config['output_dir']:
+        config['output_dir'] = settings.BASE_DIR / 'profiles'
+    return config
+
+
+def _short_path(filename):
+    base_dir = str(settings.BASE_DIR)
+    if filename.startswith(base_dir):
+        return os.path.relpath(filename, base_dir)
+    # 第三方套件與標準函式庫只保留最後兩層，例如 django/template/base.py -> template/base.py
+    parts = filename.replace('\\', '/').split('/')
+    return '/'.join(parts[-2:])
+
+
+class _Profile:
+    __slots__ = ('collect_from', 'stacks', 'samples')
+
+    def __init__(self, collect_from):
+        self.collect_from = collect_from
+        self.stacks = Counter()
+        self.samples = 0
+
+
+class Sampler:
+    """共用的取樣執行緒：只讀取已登記的請求執行緒之堆疊。"""
+
+    def __init__(self, interval=0.005, max_depth=128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self._active = {}  # 執行緒 ID -> _Profile
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._labels = {}  # code object -> frame 名稱
+
+    def register(self, thread_id, collect_from):
+        with self._lock:
+            self._active[thread_id] = _Profile(collect_from)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='checkin-profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def unregister(self, thread_id):
+        # 取樣在持有 lock 時進行，返回後不會再有執行緒修改這份結果
+        with self._lock:
+            return self._active.pop(thread_id, None)
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'
+            # folded 格式以 ';' 分隔 frame
+            label = label.replace(';', ':')
+            self._labels[code] = label
+        return label
+
+    def _fold(self, frame):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                due = min((profile.collect_from for profile in self._active.values()), default=None)
+            now = time.monotonic()
+            if due is None or due > now:
+                # 沒有請求需要取樣時不佔用 CPU：睡到最早的開始時間，或有新的請求登記
+                self._wakeup.wait(None if due is None else due - now)
+                self._wakeup.clear()
+                continue
+
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            now = time.monotonic()
+            with self._lock:
+                for thread_id, profile in self._active.items():
+                    frame = frames.get(thread_id)
+                    if frame is None or now < profile.collect_from:
+                        continue
+                    profile.stacks[self._fold(frame)] += 1
+                    profile.samples += 1
+            del frames
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler(config):
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = Sampler(config['interval'], config['max_depth'])
+        return _sampler
+
+
+def write_profile(config, profile, view, request_id, meta):
+    """
+    寫出 folded stacks 檔案並在 index.jsonl 追加摘要，返回檔案路徑。
+    """
+    output_dir = str(config['output_dir'])
+    view_dir = os.path.join(output_dir, view)
+    os.makedirs(view_dir, exist_ok=True)
+    path = os.path.join(view_dir, f"{datetime.now():%Y%m%dT%H%M%S}_{request_id}.folded")
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in profile.stacks.most_common():
+            f.write(f'{stack} {count}\n')
+
+    entry = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'view': view,
+        'request_id': request_id,
+        'samples': profile.samples,
+        'file': os.path.relpath(path, output_dir),
+        **meta,
+    }
+    with open(os.path.join(output_dir, 'index.jsonl'), 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    return path
+
+
+class SamplingProfilerMiddleware:
+    """
+    依設定抽樣、標頭或處理時間剖析請求。未啟用 (enabled 為 False 且未設定 header_token) 時
+    由 Django 自動移除 (MiddlewareNotUsed)。需放在 RequestContextMiddleware 之後以取得 request ID。
+    """
+
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['enabled'] and not self.config['header_token']:
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.sampler = get_sampler(self.config)
+
+    def __call__(self, request):
+        config = self.config
+        token = request.headers.get(HEADER)
+        forced = bool(config['header_token'] and token) and hmac.compare_digest(
+            token.encode(), str(config['header_token']).encode())
+        sampled = config['enabled'] and random.random() < config['sample_rate']
+        watch_slow = config['enabled'] and config['slow_ms'] is not None
+        if not (forced or sampled or watch_slow):
+            return self.get_response(request)
+
+        started = time.monotonic()
+        collect_from = started if forced or sampled else started + config['watch_after_ms'] / 1000
+        thread_id = threading.get_ident()
+        self.sampler.register(thread_id, collect_from)
+        try:
+            response = self.get_response(request)
+        finally:
+            profile = self.sampler.unregister(thread_id)
+        duration_ms = round((time.monotonic() - started) * 1000, 2)
+
+        if forced:
+            reason = 'header'
+        elif sampled:
+            reason = 'sampled'
+        elif watch_slow and duration_ms >= config['slow_ms']:
+            reason = 'slow'
+        else:
+            return response
+
+        if profile is None or not profile.samples:
+            return response
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name if match else None) or 'unresolved'
+        request_id = _UNSAFE_CHARS.sub('_', request_logging.current_request_id() or f'{int(time.time() * 1000)}')
+        meta = {
+            'reason': reason,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': duration_ms,
+        }
+        try:
+            write_profile(config, profile, view, request_id, meta)
+            response['X-Checkin-Profile-ID'] = request_id
+        except Exception as e:
+            # 剖析結果只是附加資訊，寫出失敗不影響請求本身
+            logger.warning("寫出剖析結果失敗: %s", e)
+        return response
@@ -0,0 +1,306 @@
+# checkin/replica.py
+
+"""
+Firestore → 本地 SQL 複本同步。
+
+將 Firestore 的 courses / students / checkin_records 複製到 checkin/models.py 的資料表，
+讓報表、admin 與匯出可以直接以 SQL 查詢，不必每次都向 Firestore 讀取。
+
+- 增量模式：以文件的 updated_at 欄位為游標，只讀取上次同步後有變動的文件；
+  刪除則以 deleted_documents 中的 tombstone 反映 (views 刪除文件時以 stage_delete() 在同一個 batch 寫入)
+- 完整模式：掃描整個 collection，並刪除 Firestore 已不存在的本地資料
+  (不經由 views 的刪除，例如在 Firebase 主控台手動刪除，只有完整模式會反映)
+- 常駐模式：以 snapshot listener 即時接收新增 / 修改 / 刪除
+"""
+
+import logging
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+from .models import Student, Course, CheckinRecord, SyncCursor
+
+logger = logging.getLogger(__name__)
+
+# 依相依順序同步：簽到記錄需要先有課程與社員
+COLLECTIONS = ('courses', 'students', 'checkin_records')
+
+PAGE_SIZE = 300
+
+# 刪除記錄 (tombstone)：文件 ID 為 <collection>_<文件 ID>，重複刪除只會覆寫同一筆
+TOMBSTONE_COLLECTION = 'deleted_documents'
+
+# 游標回推的安全區間，避免提交時間相近的寫入被跳過 (upsert 本身是冪等的)
+CURSOR_OVERLAP = timedelta(seconds=5)
+
+
+def _apply_course(doc_id, data):
+    course_date = data.get('date')
+    Course.objects.update_or_create(
+        firestore_id=doc_id,
+        defaults={
+            'name': data.get('name') or '',
+            'classroom': data.get('classroom') or '',
+            'archived': bool(data.get('archive')),
+            # add_course 以不含時區的日期寫入，Firestore 會當成 UTC 儲存，直接取日期即可
+            'date': course_date.date() if course_date else timezone.localdate(),
+        },
+    )
+    return True
+
+
+def _apply_student(doc_id, data):
+    member_id = data.get('member_id')
+    with transaction.atomic():
+        if member_id is not None:
+            # 社員重新編號時，先釋放舊持有者的編號 (它稍後同步時會拿到新值)
+            Student.objects.filter(member_id=member_id).exclude(firestore_id=doc_id).update(member_id=None)
+        Student.objects.update_or_create(
+            firestore_id=doc_id,
+            defaults={
+                'student_id': data.get('student_id') or '',
+                'name': data.get('name') or '',
+                'email': data.get('email') or '',
+                'member_id': member_id,
+            },
+        )
+    return True
+
+
+def _apply_checkin(doc_id, data):
+    course = Course.objects.filter(firestore_id=data.get('course_id')).first()
+    if course is None:
+        # 課程已被刪除或尚未同步
+        return False
+
+    student_code = data.get('student_id') or ''
+    defaults = {
+        'course': course,
+        'student': Student.objects.filter(student_id=student_code).first(),
+        'student_code': student_code,
+        'student_name': data.get('student_name') or '',
+        'student_email': data.get('student_email') or '',
+        'member_id': data.get('member_id'),
+        'checkin_time': data.get('checkin_time') or timezone.now(),
+    }
+    try:
+        with transaction.atomic():
+            CheckinRecord.objects.update_or_create(firestore_id=doc_id, defaults=defaults)
+    except IntegrityError:
+        # Firestore 中同一課程出現重複簽到時，本地只保留第一筆的社員關聯
+        defaults['student'] = None
+        CheckinRecord.objects.update_or_create(firestore_id=doc_id, defaults=defaults)
+    return True
+
+
+_APPLIERS = {
+    'courses': _apply_course,
+    'students': _apply_student,
+    'checkin_records': _apply_checkin,
+}
+
+_MODELS = {
+    'courses': Course,
+    'students': Student,
+    'checkin_records': CheckinRecord,
+}
+
+
+def _iter_documents(db, name, since, page_size):
+    """
+    分頁讀取文件。since 為 None 時依文件 ID 掃描全部，否則只讀取 updated_at >= since 的文件。
+    """
+    if since is None:
+        base_query = db.collection(name).order_by('__name__')
+    else:
+        base_query = db.collection(name).where(
+            filter=FieldFilter('updated_at', '>=', since)
+        ).order_by('updated_at')
+
+    last_snapshot = None
+    while True:
+        query = base_query.limit(page_size)
+        if last_snapshot is not None:
+            query = query.start_after(last_snapshot)
+        page = list(query.stream())
+        yield from page
+        if len(page) < page_size:
+            return
+        last_snapshot = page[-1]
+
+
+def _delete_missing(name, seen_ids):
+    model = _MODELS[name]
+    local_rows = model.objects.exclude(firestore_id=None)
+    if name == 'checkin_records':
+        # 已封存課程的記錄已從 Firestore 移到冷儲存，本地複本保留作為報表用途
+        local_rows = local_rows.exclude(course__archived=True)
+    local_ids = set(local_rows.values_list('firestore_id', flat=True))
+    missing = list(local_ids - seen_ids)
+    for start in range(0, len(missing), 500):
+        model.objects.filter(firestore_id__in=missing[start:start + 500]).delete()
+    return len(missing)
+
+
+def sync_collection(db, name, full=False, page_size=PAGE_SIZE):
+    """
+    同步單一 collection，回傳統計資訊 {'applied', 'skipped', 'deleted'}。
+    """
+    cursor, _ = SyncCursor.objects.get_or_create(collection=name)
+    since = None
+    if not full and cursor.last_updated_at is not None:
+        since = cursor.last_updated_at - CURSOR_OVERLAP
+
+    apply = _APPLIERS[name]
+    newest = cursor.last_updated_at
+    seen_ids = set()
+    stats = {'applied': 0, 'skipped': 0, 'deleted': 0}
+
+    for snapshot in _iter_documents(db, name, since, page_size):
+        data = snapshot.to_dict()
+        seen_ids.add(snapshot.id)
+        try:
+            applied = apply(snapshot.id, data)
+        except IntegrityError as e:
+            logger.warning("同步 %s/%s 失敗 (唯一值衝突): %s", name, snapshot.id, e)
+            applied = False
+        stats['applied' if applied else 'skipped'] += 1
+
+        # 舊文件沒有 updated_at，以 Firestore 的文件更新時間代替
+        updated_at = data.get('updated_at') or snapshot.update_time
+        if updated_at and (newest is None or updated_at > newest):
+            newest = updated_at
+
+    if since is None:
+        stats['deleted'] = _delete_missing(name, seen_ids)
+
+    cursor.last_updated_at = newest
+    cursor.last_run_at = timezone.now()
+    cursor.synced_count = stats['applied']
+    cursor.save()
+    return stats
+
+
+def stage_delete(db, batch, name, doc_id):
+    """
+    將文件的刪除加入 batch，並在同一個 batch 中寫入 tombstone，讓增量同步也能刪除本地複本
+    (每筆刪除多一次寫入)。
+    """
+    batch.delete(db.collection(name).document(doc_id))
+    batch.set(db.collection(TOMBSTONE_COLLECTION).document(f'{name}_{doc_id}'), {
+        'collection': name,
+        'doc_id': doc_id,
+        'updated_at': firestore.SERVER_TIMESTAMP,
+    })
+
+
+def sync_deletions(db, full=False, started_at=None, page_size=PAGE_SIZE):
+    """
+    依上次同步後新增的 tombstone 刪除本地資料，回傳刪除筆數。
+    完整模式已經刪除 Firestore 不存在的資料，只將游標前移到本次同步開始的時間。
+    """
+    cursor, _ = SyncCursor.objects.get_or_create(collection=TOMBSTONE_COLLECTION)
+    if full or cursor.last_updated_at is None:
+        # 尚未有游標時從本次同步開始記錄 (之前的刪除只有完整模式會反映)
+        cursor.last_updated_at = started_at or timezone.now()
+        cursor.last_run_at = timezone.now()
+        cursor.save()
+        return 0
+
+    newest = cursor.last_updated_at
+    tombstones = {}
+    for snapshot in _iter_documents(db, TOMBSTONE_COLLECTION, cursor.last_updated_at - CURSOR_OVERLAP, page_size):
+        data = snapshot.to_dict()
+        if data.get('collection') in _MODELS and data.get('doc_id'):
+            tombstones[(data['collection'], data['doc_id'])] = db.collection(data['collection']).document(data['doc_id'])
+        updated_at = data.get('updated_at') or snapshot.update_time
+        if updated_at and updated_at > newest:
+            newest = updated_at
+
+    deleted = 0
+    if tombstones:
+        # 刪除後又以相同 ID 重新建立的文件不刪除
+        recreated = {(snapshot.reference.parent.id, snapshot.id)
+                     for snapshot in db.get_all(list(tombstones.values())) if snapshot.exists}
+        for name, doc_id in tombstones.keys() - recreated:
+            model = _MODELS[name]
+            rows = model.objects.filter(firestore_id=doc_id)
+            if name == 'checkin_records':
+                rows = rows.exclude(course__archived=True)
+            # 不計入連帶刪除 (例如課程的簽到記錄)
+            deleted += rows.delete()[1].get(model._meta.label, 0)
+
+    cursor.last_updated_at = newest
+    cursor.last_run_at = timezone.now()
+    cursor.save()
+    return deleted
+
+
+def relink_orphan_records():
+    """
+    將尚未對應到社員的簽到記錄，以學號重新關聯 (社員可能比簽到記錄晚同步)。
+    """
+    relinked = 0
+    orphans = CheckinRecord.objects.filter(student__isnull=True).exclude(student_code='')
+    students = Student.objects.filter(student_id__in=orphans.values('student_code'))
+    for student in students:
+        for record in orphans.filter(student_code=student.student_id):
+            record.student = student
+            try:
+                with transaction.atomic():
+                    record.save(update_fields=['student'])
+                relinked += 1
+            except IntegrityError:
+                continue
+    return relinked
+
+
+def sync_all(db, full=False, page_size=PAGE_SIZE):
+    """
+    依序同步所有 collection，回傳 {collection: stats}。
+    """
+    started_at = timezone.now()
+    results = {name: sync_collection(db, name, full=full, page_size=page_size) for name in COLLECTIONS}
+    results['tombstones'] = sync_deletions(db, full=full, started_at=started_at, page_size=page_size)
+    results['relinked'] = relink_orphan_records()
+    return results
+
+
+def watch(db):
+    """
+    以 snapshot listener 常駐同步，回傳 listener 清單 (呼叫 .unsubscribe() 停止)。
+    已有游標時只監聽 updated_at 之後的文件，避免每次啟動都重新讀取整個 collection。
+    """
+    watchers = []
+    for name in COLLECTIONS:
+        cursor, _ = SyncCursor.objects.get_or_create(collection=name)
+        query = db.collection(name)
+        if cursor.last_updated_at is not None:
+            query = query.where(filter=FieldFilter('updated_at', '>=', cursor.last_updated_at - CURSOR_OVERLAP))
+        watchers.append(query.on_snapshot(_make_listener(name)))
+    return watchers
+
+
+def _make_listener(name):
+    apply = _APPLIERS[name]
+    model = _MODELS[name]
+
+    def on_snapshot(col_snapshot, changes, read_time):
+        for change in changes:
+            doc = change.document
+            try:
+                if change.type.name == 'REMOVED':
+                    model.objects.filter(firestore_id=doc.id).delete()
+                else:
+                    apply(doc.id, doc.to_dict())
+            except Exception as e:
+                logger.exception("即時同步 %s/%s 失敗: %s", name, doc.id, e)
+
+        if name == 'students':
+            relink_orphan_records()
+        SyncCursor.objects.filter(collection=name).update(last_updated_at=read_time, last_run_at=timezone.now())
+
+    return on_snapshot
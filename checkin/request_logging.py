@@ -0,0 +1,184 @@
+# checkin/request_logging.py
+
+"""
+結構化、不阻塞的請求日誌。
+
+- RequestContextMiddleware：為每個請求產生 request ID (或沿用 X-Request-ID)，記錄 view 名稱，
+  並在請求結束時輸出一筆摘要 (狀態碼、耗時、Firestore 操作與耗時)
+- RequestContextFilter：將 request ID / 社團 / view / Firestore 操作附加到每筆 log record
+- SuccessSamplingFilter：成功請求的摘要只保留一部分 (錯誤與慢請求一律保留)
+- NonBlockingQueueHandler：log record 先放入佇列，由背景執行緒寫出，請求執行緒不會等待 I/O
+
+設定方式見 settings.LOGGING。
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from . import tenancy
+
+logger = logging.getLogger('checkin.request')
+
+_request_id = contextvars.ContextVar('checkin_request_id', default=None)
+_view_name = contextvars.ContextVar('checkin_view_name', default=None)
+_firestore_ops = contextvars.ContextVar('checkin_firestore_ops', default=None)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def record_firestore_op(op, seconds):
+    """
+    由 firebase_init 呼叫，記錄目前請求執行的 Firestore 操作 (請求之外呼叫時忽略)。
+    """
+    ops = _firestore_ops.get()
+    if ops is not None:
+        ops.append((op, round(seconds * 1000, 2)))
+
+
+class RequestContextFilter(logging.Filter):
+    """將請求的 context 附加到 log record。"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        if getattr(record, 'tenant', None) is None:
+            record.tenant = tenancy.current_tenant()
+        record.view = _view_name.get()
+        ops = _firestore_ops.get()
+        record.firestore_ops = list(ops) if ops else []
+        return True
+
+
+class SuccessSamplingFilter(logging.Filter):
+    """
+    只保留 rate 比例的取樣 record (以 extra={'sampled': True} 標記)，其餘一律保留。
+    """
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sampled', False):
+            return random.random() < self.rate
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆 record 輸出為一行 JSON。"""
+
+    EXTRA_FIELDS = ('request_id', 'tenant', 'view', 'method', 'path', 'status', 'duration_ms')
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+
+        ops = getattr(record, 'firestore_ops', None)
+        if ops:
+            entry['firestore_ops'] = ops
+            entry['firestore_ms'] = round(sum(ms for _, ms in ops), 2)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler + 背景 QueueListener。佇列滿時直接捨棄 record，不阻塞請求執行緒。
+    """
+
+    def __init__(self, maxsize=10000, stream=None):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.dropped = 0
+        self.listener = logging.handlers.QueueListener(self.queue, target, respect_handler_level=False)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # 在請求執行緒先格式化例外，之後背景執行緒就不需要 exc_info
+        if record.exc_info:
+            record.exc_text = JsonFormatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestContextMiddleware:
+    """
+    設定每個請求的 request ID 與 view 名稱，並在結束時輸出摘要 log。
+    成功且不慢的請求標記為取樣 (sampled)，由 SuccessSamplingFilter 決定是否保留。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'CHECKIN_SLOW_REQUEST_MS', 1000)
+
+    def __call__(self, request):
+        request_id = (request.headers.get('X-Request-ID') or uuid.uuid4().hex[:16])[:64]
+        request.request_id = request_id
+        tokens = (
+            _request_id.set(request_id),
+            _view_name.set(None),
+            _firestore_ops.set([]),
+        )
+        started = time.monotonic()
+        try:
+            response = self.get_response(request)
+            duration_ms = round((time.monotonic() - started) * 1000, 2)
+            response['X-Request-ID'] = request_id
+            self._log(request, response.status_code, duration_ms)
+            return response
+        finally:
+            for var, token in zip((_request_id, _view_name, _firestore_ops), tokens):
+                var.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _view_name.set(getattr(view_func, '__name__', None))
+
+    def _log(self, request, status, duration_ms):
+        extra = {
+            'method': request.method,
+            'path': request.path,
+            'status': status,
+            'duration_ms': duration_ms,
+            # TenantMiddleware 在內層，此時社團的 context 已還原，改用 request 上的值
+            'tenant': getattr(request, 'tenant', None),
+        }
+        message = f"{request.method} {request.path} {status} {duration_ms}ms"
+        if status >= 500:
+            logger.error(message, extra=extra)
+        elif duration_ms >= self.slow_ms:
+            logger.warning(f"慢請求: {message}", extra=extra)
+        else:
+            logger.info(message, extra={**extra, 'sampled': True})
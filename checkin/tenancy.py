@@ -0,0 +1,148 @@
+# checkin/tenancy.py
+
+"""
+多社團 (multi-tenant) 路由。
+
+一個部署可服務多個社團，每個社團的資料放在各自的 collection 命名空間
+(預設為 tenants/<slug>/students ...) 或獨立的 Firebase 專案。
+TenantMiddleware 依路徑前綴 (/t/<slug>/...) 或子網域 (<slug>.example.com) 判斷社團，
+之後 firebase_init.get_firestore_client() 便會回傳該社團專用的 client。
+"""
+
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import HttpResponseNotFound, JsonResponse
+from django.urls import get_script_prefix, set_script_prefix
+
+DEFAULT_TENANT = 'default'
+
+# 每個社團的預設值，可由 settings.CHECKIN_TENANT_DEFAULTS 與個別社團設定覆寫
+TENANT_DEFAULTS = {
+    'namespace': None,          # collection 前綴；None 表示預設社團用頂層、其他社團用 tenants/<slug>
+    'credentials_env': None,    # 使用獨立 Firebase 專案時，存放金鑰 JSON 的環境變數名稱
+    'max_concurrency': 16,      # 同時進行中的 Firestore 操作上限
+    'rate_limit': None,         # 每秒請求數上限 (None 表示不限制)
+    'burst': None,              # 瞬間可容許的請求數 (預設為 rate_limit 的兩倍)
+}
+
+_PATH_PATTERN = re.compile(r'^/t/([a-z0-9][a-z0-9-]*)(?=/|$)')
+
+_current_tenant = contextvars.ContextVar('checkin_tenant', default=DEFAULT_TENANT)
+
+
+def current_tenant():
+    """目前請求所屬的社團 slug。"""
+    return _current_tenant.get()
+
+
+@contextmanager
+def activate(slug):
+    """在請求之外 (例如 management command) 切換社團。"""
+    token = _current_tenant.set(slug)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+def get_tenant_config(slug):
+    """
+    返回社團的完整設定；未設定的社團返回 None。
+    """
+    tenants = getattr(settings, 'CHECKIN_TENANTS', None) or {DEFAULT_TENANT: {}}
+    if slug not in tenants:
+        return None
+
+    config = {**TENANT_DEFAULTS, **getattr(settings, 'CHECKIN_TENANT_DEFAULTS', {}), **tenants[slug]}
+    if config['namespace'] is None:
+        config['namespace'] = '' if slug == DEFAULT_TENANT else f'tenants/{slug}'
+    if config['rate_limit'] and not config['burst']:
+        config['burst'] = config['rate_limit'] * 2
+    return config
+
+
+class TokenBucket:
+    """每個社團獨立的請求速率限制。"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class TenantMiddleware:
+    """
+    判斷請求所屬的社團並設定 context：
+    - 路徑前綴：/t/<slug>/checkin/ → 以 /checkin/ 解析 URL，{% url %} 產生的連結也會帶上前綴
+    - 子網域 (CHECKIN_TENANT_ROUTING = 'subdomain')：<slug>.<CHECKIN_TENANT_BASE_DOMAIN>
+    沒有指定社團的請求屬於 DEFAULT_TENANT。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.routing = getattr(settings, 'CHECKIN_TENANT_ROUTING', 'path')
+        self.base_domain = getattr(settings, 'CHECKIN_TENANT_BASE_DOMAIN', '')
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def _resolve(self, request):
+        if self.routing == 'subdomain' and self.base_domain:
+            host = request.get_host().split(':')[0]
+            suffix = '.' + self.base_domain
+            if host.endswith(suffix):
+                return host[:-len(suffix)], ''
+            return DEFAULT_TENANT, ''
+
+        match = _PATH_PATTERN.match(request.path_info)
+        if match:
+            return match.group(1), match.group(0)
+        return DEFAULT_TENANT, ''
+
+    def _bucket(self, slug, config):
+        if not config['rate_limit']:
+            return None
+        with self._buckets_lock:
+            if slug not in self._buckets:
+                self._buckets[slug] = TokenBucket(config['rate_limit'], config['burst'])
+            return self._buckets[slug]
+
+    def __call__(self, request):
+        slug, prefix = self._resolve(request)
+        config = get_tenant_config(slug)
+        if config is None:
+            return HttpResponseNotFound('找不到此社團。')
+
+        bucket = self._bucket(slug, config)
+        if bucket is not None and not bucket.try_acquire():
+            return JsonResponse({'status': 'error', 'message': '此社團目前請求過多，請稍後再試。'}, status=429)
+
+        request.tenant = slug
+        old_prefix = get_script_prefix()
+        if prefix:
+            request.path_info = request.path_info[len(prefix):] or '/'
+            set_script_prefix(old_prefix + prefix.lstrip('/') + '/')
+
+        token = _current_tenant.set(slug)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_tenant.reset(token)
+            if prefix:
+                set_script_prefix(old_prefix)
@@ -0,0 +1,229 @@
+"""
+測試用的記憶體 Firestore 與共用工具。
+"""
+
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+from google.cloud import firestore
+
+from checkin import course_session, firebase_init, presence
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self.update_time = reference.db.update_times.get(reference.path) if data is not None else None
+        # 快照是讀取當下的內容，之後的寫入不會反映在快照上
+        self._data = dict(data) if data is not None else None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, collection, doc_id):
+        self.db = db
+        self.collection = collection
+        self.id = doc_id
+        self.path = f'{collection}/{doc_id}'
+        self.parent = FakeQuery(db, collection)
+
+    @property
+    def raw(self):
+        return self
+
+    def _docs(self):
+        return self.db.data.setdefault(self.collection, {})
+
+    def get(self, **kwargs):
+        self.db.rpc()
+        return FakeSnapshot(self, self._docs().get(self.id))
+
+    def _check(self, option):
+        if option is not None and self.db.update_times.get(self.path) != option.last_update_time:
+            raise google_exceptions.FailedPrecondition(self.path)
+
+    def _written(self):
+        self.db.clock += 1
+        self.db.update_times[self.path] = self.db.clock
+        return FakeWriteResult(self.db.clock)
+
+    def create(self, data, **kwargs):
+        self.db.rpc()
+        if self.id in self._docs():
+            raise google_exceptions.AlreadyExists(self.path)
+        self._docs()[self.id] = _resolve(data)
+        return self._written()
+
+    def set(self, data, **kwargs):
+        self.db.rpc()
+        self._docs()[self.id] = _resolve(data)
+        return self._written()
+
+    def update(self, data, option=None, **kwargs):
+        self.db.rpc()
+        if self.id not in self._docs():
+            raise google_exceptions.NotFound(self.path)
+        self._check(option)
+        self._docs()[self.id].update(_resolve(data))
+        return self._written()
+
+    def delete(self, **kwargs):
+        self.db.rpc()
+        self._docs().pop(self.id, None)
+        self.db.update_times.pop(self.path, None)
+
+
+class FakeWriteResult:
+    def __init__(self, update_time):
+        self.update_time = update_time
+
+
+class FakeWriteOption:
+    def __init__(self, last_update_time):
+        self.last_update_time = last_update_time
+
+
+def _resolve(data):
+    # 伺服器時間以目前時間代替
+    return {key: timezone.now() if value is firestore.SERVER_TIMESTAMP else value for key, value in data.items()}
+
+
+def _matches(doc_id, data, field, op, value):
+    if field == '__name__':
+        actual, value = doc_id, value.id
+    else:
+        actual = data.get(field)
+    if op == '==':
+        return actual == value
+    if op == 'in':
+        return actual in value
+    if actual is None:
+        return False
+    if op == '>':
+        return actual > value
+    if op == '>=':
+        return actual >= value
+    raise NotImplementedError(op)
+
+
+class FakeQuery:
+    def __init__(self, db, collection, filters=(), order=None, limit_to=None, after=None):
+        self.db = db
+        self.collection = collection
+        # 社團的 collection 路徑帶有命名空間 (tenants/<slug>/students)，id 只取最後一段
+        self.id = collection.rsplit('/', 1)[-1]
+        self.filters = filters
+        self.order = order
+        self.limit_to = limit_to
+        self.after = after
+
+    def _copy(self, **changes):
+        fields = {'filters': self.filters, 'order': self.order, 'limit_to': self.limit_to, 'after': self.after}
+        return FakeQuery(self.db, self.collection, **{**fields, **changes})
+
+    def where(self, field=None, op=None, value=None, filter=None):
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self.filters + ((field, op, value),))
+
+    def order_by(self, field, **kwargs):
+        return self._copy(order=field)
+
+    def limit(self, count):
+        return self._copy(limit_to=count)
+
+    def start_after(self, snapshot):
+        return self._copy(after=snapshot.id)
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            self.db.auto_id += 1
+            doc_id = f'auto{self.db.auto_id:04d}'
+        return FakeDocument(self.db, self.collection, doc_id)
+
+    def stream(self, **kwargs):
+        self.db.rpc()
+        docs = self.db.data.get(self.collection, {})
+        ids = [doc_id for doc_id, data in docs.items()
+               if all(_matches(doc_id, data, *f) for f in self.filters)]
+        if self.order == '__name__':
+            ids.sort()
+        elif self.order:
+            ids.sort(key=lambda doc_id: (docs[doc_id].get(self.order), doc_id))
+        if self.after is not None:
+            ids = ids[ids.index(self.after) + 1:]
+        if self.limit_to is not None:
+            ids = ids[:self.limit_to]
+        snapshots = [FakeSnapshot(FakeDocument(self.db, self.collection, doc_id), docs[doc_id]) for doc_id in ids]
+        # 原生 client 的 stream() 回傳 generator；ResilientFirestoreClient 會讀成 list
+        return snapshots if self.db.materialize else iter(snapshots)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def create(self, ref, data):
+        self.ops.append((ref, ref.create, data, None))
+
+    def set(self, ref, data):
+        self.ops.append((ref, ref.set, data, None))
+
+    def update(self, ref, data, option=None):
+        self.ops.append((ref, ref.update, data, option))
+
+    def delete(self, ref):
+        self.ops.append((ref, ref.delete, None, None))
+
+    def commit(self, **kwargs):
+        self.db.rpc()
+        # 前提條件不成立時整個 batch 都不寫入
+        for ref, _, _, option in self.ops:
+            ref._check(option)
+        self.db.commits += 1
+        return [method(data) if data is not None else method() for _, method, data, _ in self.ops]
+
+
+class FakeFirestore:
+    """支援本模組用到的查詢 (==、>、>=、in、__name__ 游標) 與 batch 的記憶體 Firestore。"""
+
+    def __init__(self, data=None):
+        self.data = {name: {doc_id: dict(doc) for doc_id, doc in docs.items()}
+                     for name, docs in (data or {}).items()}
+        self.auto_id = 0
+        self.commits = 0
+        # 文件路徑 -> 最後寫入的「時間」(遞增的整數)，供 write_option(last_update_time=...) 使用
+        self.clock = 0
+        self.update_times = {}
+        self.down = False
+        self.materialize = True
+
+    def rpc(self):
+        if self.down:
+            raise firebase_init.FirestoreUnavailable('Firestore 暫時無法使用，請稍後再試。')
+
+    def collection(self, name):
+        return FakeQuery(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    @staticmethod
+    def write_option(last_update_time):
+        return FakeWriteOption(last_update_time)
+
+    def get_all(self, refs, **kwargs):
+        return [ref.get() for ref in refs]
+
+
+def reset_caches():
+    """清除各模組保存在記憶體中的快取與場次。"""
+    course_session._states.clear()
+    presence._rosters.clear()
+    presence._courses.clear()
+    presence._pinned.clear()
+    presence._loading.clear()
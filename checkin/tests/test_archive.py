@@ -0,0 +1,106 @@
+import gzip
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from checkin import archive, exports
+
+from .fakes import FakeFirestore
+
+CHECKIN_TIME = datetime(2025, 9, 1, 19, 0, tzinfo=timezone.utc)
+
+_write_cold = archive._write_cold
+
+
+class ArchiveTestCase(SimpleTestCase):
+    def setUp(self):
+        records = {
+            f'c1_A00{i}': {'course_id': 'c1', 'student_id': f'A00{i}', 'checkin_time': CHECKIN_TIME + timedelta(minutes=i)}
+            for i in range(1, 4)
+        }
+        records['c2_A001'] = {'course_id': 'c2', 'student_id': 'A001', 'checkin_time': CHECKIN_TIME}
+        self.db = FakeFirestore({
+            'courses': {'c1': {'name': '去年的課'}, 'c2': {'name': '這學期的課'}},
+            'checkin_records': records,
+        })
+        self.db.materialize = False
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        settings = self.settings(CHECKIN_ARCHIVE={'store': 'local', 'local_dir': self.dir.name, 'cutoff_days': 180})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        archive._cache.clear()
+        self.addCleanup(archive._cache.clear)
+
+    def _records(self):
+        return sorted(self.db.data['checkin_records'])
+
+    def _archive_c1(self):
+        return archive.archive_course(self.db, 'c1', self.db.data['courses']['c1'])
+
+    def _late_checkin(self, *args, **kwargs):
+        # 讀取快照之後、刪除熱資料之前寫入的簽到
+        self.db.data['checkin_records']['c1_A009'] = {'course_id': 'c1', 'student_id': 'A009', 'checkin_time': None}
+        return _write_cold(*args, **kwargs)
+
+
+class ArchiveCourseTests(ArchiveTestCase):
+    def test_deletes_only_archived_records(self):
+        with mock.patch.object(archive, '_write_cold', side_effect=self._late_checkin):
+            result = self._archive_c1()
+
+        self.assertEqual((result['count'], result['deleted']), (3, 3))
+        self.assertEqual(self._records(), ['c1_A009', 'c2_A001'])
+        self.assertEqual(self.db.data['courses']['c1']['archive']['count'], 3)
+
+    def test_rerun_deletes_leftover_archived_records_only(self):
+        self._archive_c1()
+        # 上次刪除途中中斷：已封存的記錄仍在熱資料中，另有一筆快照之後的簽到
+        self.db.data['checkin_records']['c1_A001'] = {'course_id': 'c1', 'student_id': 'A001'}
+        self.db.data['checkin_records']['c1_A009'] = {'course_id': 'c1', 'student_id': 'A009'}
+
+        result = self._archive_c1()
+        self.assertEqual((result['count'], result['deleted']), (0, 1))
+        self.assertEqual(self._records(), ['c1_A009', 'c2_A001'])
+
+    def test_course_records_include_records_left_in_hot_storage(self):
+        self._archive_c1()
+        self.db.data['checkin_records']['c1_A009'] = {'course_id': 'c1', 'student_id': 'A009', 'checkin_time': None}
+
+        rows = archive.get_course_records(self.db, 'c1', self.db.data['courses']['c1'], newest_first=True)
+        self.assertEqual([row['student_id'] for row in rows], ['A003', 'A002', 'A001', 'A009'])
+
+
+class ExportArchivedTests(ArchiveTestCase):
+    def setUp(self):
+        super().setUp()
+        self.output = os.path.join(self.dir.name, 'checkins.jsonl.gz')
+
+    def _ids(self):
+        with gzip.open(self.output, 'rt', encoding='utf-8') as f:
+            return [json.loads(line)['id'] for line in f]
+
+    def test_export_includes_archive_once(self):
+        self._archive_c1()
+        # 已封存但尚未從熱資料刪除的記錄只匯出一次
+        self.db.data['checkin_records']['c1_A002'] = {'course_id': 'c1', 'student_id': 'A002'}
+
+        self.assertEqual(exports.export_jsonl(self.db, self.output, page_size=2), (4, 4))
+        self.assertEqual(self._ids(), ['c2_A001', 'c1_A001', 'c1_A002', 'c1_A003'])
+        state = exports.load_state(self.output)
+        self.assertEqual((state['hot_done'], state['archived_course']), (True, 'c1'))
+
+        # 已全部匯出，續傳不會重複
+        self.assertEqual(exports.export_jsonl(self.db, self.output, page_size=2), (0, 4))
+
+    def test_stream_includes_archive(self):
+        self._archive_c1()
+        data = gzip.decompress(b''.join(exports.stream_jsonl_gzip(self.db)))
+        rows = [json.loads(line) for line in data.splitlines()]
+        self.assertEqual([row['id'] for row in rows], ['c2_A001', 'c1_A001', 'c1_A002', 'c1_A003'])
+        self.assertEqual(rows[1]['checkin_time'], (CHECKIN_TIME + timedelta(minutes=1)).isoformat())
@@ -0,0 +1,135 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+
+from checkin import course_session, fanout
+
+from .fakes import FakeFirestore, reset_caches
+
+
+COURSES = {'c1': {'name': 'Django 入門', 'session_open': True}}
+STUDENTS = {
+    's1': {'student_id': 'A001', 'name': '王小明', 'member_id': 2, 'email': 'a@example.com'},
+    's2': {'student_id': 'A002', 'name': '陳小華', 'member_id': 1, 'email': ''},
+}
+
+
+class CheckinTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.db = FakeFirestore({'courses': COURSES, 'students': STUDENTS})
+        patches = [
+            mock.patch('checkin.firebase_init.get_firestore_client', return_value=self.db),
+            mock.patch('checkin.course_session._ensure_refresher'),
+            mock.patch('checkin.mailer.enqueue_checkin_confirmation'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(reset_caches)
+
+    def _post(self, student_id):
+        return self.client.post('/checkin/', json.dumps({'course_id': 'c1', 'student_id': student_id}),
+                                content_type='application/json')
+
+
+class SessionCheckinTests(CheckinTestCase):
+    def test_session_mode(self):
+        course_session.refresh(self.db)
+        self.assertIsNotNone(course_session.get_session('c1'))
+
+        self.assertEqual(self._post('Z999').json()['status'], 'non_member')
+        response = self._post('A001').json()
+        self.assertEqual(response['status'], 'success')
+        self.assertEqual(response['course_name'], 'Django 入門')
+        self.assertEqual(self._post('A001').json()['status'], 'already_checkedin')
+        self.assertIn(course_session.record_id('c1', 'A001'), self.db.data['checkin_records'])
+
+    def test_session_mode_record_written_by_another_process(self):
+        course_session.refresh(self.db)
+        self.db.data['checkin_records'] = {
+            course_session.record_id('c1', 'A002'): {'course_id': 'c1', 'student_id': 'A002'},
+        }
+        self.assertEqual(self._post('A002').json()['status'], 'already_checkedin')
+
+    def test_session_mode_picks_up_new_member(self):
+        course_session.refresh(self.db)
+        self.db.data['students']['s3'] = {'student_id': 'A003', 'name': '林小美', 'updated_at': timezone.now()}
+        course_session._refresh_state(self.db, course_session._state())
+        self.assertEqual(self._post('A003').json()['status'], 'success')
+
+    def test_closed_session_is_released(self):
+        course_session.refresh(self.db)
+        self.db.data['courses']['c1']['session_open'] = False
+        course_session._refresh_state(self.db, course_session._state())
+        self.assertIsNone(course_session.get_session('c1'))
+
+
+class NormalCheckinRenamedStudentTests(CheckinTestCase):
+    def setUp(self):
+        super().setUp()
+        # 社員 A001 改為 A101，同步工作尚未完成：舊的簽到記錄仍是 A001
+        self.db.data['courses']['c1']['session_open'] = False
+        self.db.data['students']['s1']['student_id'] = 'A101'
+        self.db.data['checkin_records'] = {
+            course_session.record_id('c1', 'A001'): {'course_id': 'c1', 'student_id': 'A001'},
+        }
+        self.db.data[fanout.JOB_COLLECTION] = {'job1': {
+            'student_doc_id': 's1', 'old_student_id': 'A001', 'updates': {'student_id': 'A101'},
+            'status': 'pending', 'processed': 0, 'last_doc_id': None,
+        }}
+
+    def test_pending_rename_is_not_checked_in_twice(self):
+        self.assertEqual(self._post('A101').json()['status'], 'already_checkedin')
+        self.assertEqual(len(self.db.data['checkin_records']), 1)
+
+    def test_finished_rename_is_not_checked_in_twice(self):
+        fanout.run_job(self.db, 'job1')
+        self.assertEqual(self._post('A101').json()['status'], 'already_checkedin')
+        self.assertEqual(len(self.db.data['checkin_records']), 1)
+
+    def test_other_member_checks_in(self):
+        self.assertEqual(self._post('A002').json()['status'], 'success')
+
+
+@override_settings(CHECKIN_COURSE_SESSION={'refresh_interval': 10, 'idle_refresh_max': 40, 'idle_forget': 600})
+class RefreshScheduleTests(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        self.db = FakeFirestore({'courses': {'c1': {'name': 'Django 入門', 'session_open': False}}, 'students': STUDENTS})
+
+    def _interval(self, state):
+        course_session._refresh_state(self.db, state)
+        return state.next_refresh - state.refreshed_at
+
+    def test_backs_off_while_idle(self):
+        state = course_session._state()
+        self.assertEqual([self._interval(state) for _ in range(4)], [10, 20, 40, 40])
+
+        self.db.data['courses']['c1']['session_open'] = True
+        self.assertEqual(self._interval(state), 10)
+        self.db.data['courses']['c1']['session_open'] = False
+        self.assertEqual(self._interval(state), 10)
+
+    def test_polls_only_due_tenants(self):
+        state = course_session._state()
+        with mock.patch('checkin.firebase_init.get_firestore_client', return_value=self.db) as get_client:
+            course_session._refresh_due(state.next_refresh)
+            course_session._refresh_due(state.refreshed_at + 5)
+        self.assertEqual(get_client.call_count, 1)
+
+    def test_forgets_idle_tenants(self):
+        state = course_session._state()
+        course_session._forget_idle(state.last_used + 599)
+        self.assertIn('default', course_session._states)
+        course_session._forget_idle(state.last_used + 600)
+        self.assertNotIn('default', course_session._states)
+
+    def test_keeps_tenants_with_open_sessions(self):
+        self.db.data['courses']['c1']['session_open'] = True
+        state = course_session.refresh(self.db)
+        course_session._forget_idle(state.last_used + 3600)
+        self.assertIn('default', course_session._states)
@@ -0,0 +1,72 @@
+import gzip
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from checkin import exports
+
+from .fakes import FakeFirestore
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class ExportJsonlTests(SimpleTestCase):
+    def setUp(self):
+        records = {f'r{i:02d}': {'course_id': 'c1', 'student_id': f'A{i:03d}'} for i in range(1, 8)}
+        self.db = FakeFirestore({'checkin_records': records})
+        self.db.materialize = False
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.output = os.path.join(self.dir.name, 'checkins.jsonl.gz')
+
+    def _ids(self):
+        with gzip.open(self.output, 'rt', encoding='utf-8') as f:
+            return [json.loads(line)['id'] for line in f]
+
+    def _interrupt_after_first_page(self, total):
+        raise _Interrupted
+
+    def test_export_all_pages(self):
+        self.assertEqual(exports.export_jsonl(self.db, self.output, page_size=3), (7, 7))
+        self.assertEqual(self._ids(), [f'r{i:02d}' for i in range(1, 8)])
+
+    def test_resume_after_interruption(self):
+        with self.assertRaises(_Interrupted):
+            exports.export_jsonl(self.db, self.output, page_size=3, on_page=self._interrupt_after_first_page)
+        # 上次寫到一半的頁面會被截掉
+        with open(self.output, 'ab') as f:
+            f.write(b'partial page')
+
+        self.assertEqual(exports.export_jsonl(self.db, self.output, page_size=3), (4, 7))
+        self.assertEqual(self._ids(), [f'r{i:02d}' for i in range(1, 8)])
+
+    def test_refuses_to_resume_missing_or_short_output(self):
+        with self.assertRaises(_Interrupted):
+            exports.export_jsonl(self.db, self.output, page_size=3, on_page=self._interrupt_after_first_page)
+        with open(self.output, 'r+b') as f:
+            f.truncate(5)
+        with self.assertRaises(ValueError):
+            exports.export_jsonl(self.db, self.output, page_size=3)
+        self.assertEqual(os.path.getsize(self.output), 5)
+
+        os.remove(self.output)
+        with self.assertRaises(ValueError):
+            exports.export_jsonl(self.db, self.output, page_size=3)
+
+        # 不續傳時重新匯出
+        self.assertEqual(exports.export_jsonl(self.db, self.output, page_size=3, resume=False), (7, 7))
+
+
+class RemovePartialPartsTests(SimpleTestCase):
+    def test_keeps_finished_parts_and_unrelated_files(self):
+        with tempfile.TemporaryDirectory() as output:
+            names = ['part-00000.parquet', 'part-00001.parquet', 'part-00002.parquet',
+                     'part-old.parquet', 'part-00003.parquet.bak', 'notes.txt']
+            for name in names:
+                open(os.path.join(output, name), 'w').close()
+            exports._remove_partial_parts(output, 2)
+            self.assertEqual(sorted(os.listdir(output)), sorted(set(names) - {'part-00002.parquet'}))
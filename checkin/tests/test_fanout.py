@@ -0,0 +1,120 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+
+from checkin import fanout
+
+from .fakes import FakeBatch, FakeDocument, FakeFirestore
+
+
+class FanoutTestCase(SimpleTestCase):
+    def setUp(self):
+        records = {f'r{i}': {'course_id': 'c1', 'student_id': 'A001', 'student_name': '王小明'} for i in range(1, 6)}
+        records['x1'] = {'course_id': 'c1', 'student_id': 'B001', 'student_name': '其他社員'}
+        self.db = FakeFirestore({
+            'checkin_records': records,
+            fanout.JOB_COLLECTION: {'job1': {
+                'old_student_id': 'A001',
+                'updates': {'student_id': 'A101', 'student_name': '王大明'},
+                'status': 'pending', 'processed': 0, 'last_doc_id': None,
+            }},
+        })
+
+    def _names(self):
+        return {doc_id: record['student_name'] for doc_id, record in self.db.data['checkin_records'].items()}
+
+
+class FanoutResumeTests(FanoutTestCase):
+    def test_resumes_from_last_doc_id(self):
+        # 上次在 r2 之後中斷
+        self.db.data[fanout.JOB_COLLECTION]['job1'].update(status='running', processed=2, last_doc_id='r2')
+        job = fanout.run_job(self.db, 'job1', page_size=2)
+
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['processed'], 5)
+        names = self._names()
+        self.assertEqual(names['r1'], '王小明')
+        self.assertEqual(names['r2'], '王小明')
+        self.assertEqual({names[f'r{i}'] for i in range(3, 6)}, {'王大明'})
+        self.assertEqual(names['x1'], '其他社員')
+
+    def test_failed_page_keeps_progress(self):
+        original_commit = FakeBatch.commit
+
+        def commit_then_fail(batch, **kwargs):
+            if self.db.commits == 1:
+                raise google_exceptions.ServiceUnavailable('commit')
+            return original_commit(batch, **kwargs)
+
+        with mock.patch.object(FakeBatch, 'commit', commit_then_fail):
+            with self.assertRaises(google_exceptions.ServiceUnavailable):
+                fanout.run_job(self.db, 'job1', page_size=2)
+        job = self.db.data[fanout.JOB_COLLECTION]['job1']
+        self.assertEqual((job['status'], job['processed'], job['last_doc_id']), ('failed', 2, 'r2'))
+
+        job['status'] = 'pending'
+        result = fanout.run_job(self.db, 'job1', page_size=2)
+        self.assertEqual(result['processed'], 5)
+        self.assertEqual(self.db.commits, 3)
+        self.assertNotIn('王小明', {self._names()[f'r{i}'] for i in range(1, 6)})
+
+
+class FanoutClaimTests(FanoutTestCase):
+    def _job(self):
+        return self.db.data[fanout.JOB_COLLECTION]['job1']
+
+    def _claim(self):
+        return fanout.claim_job(self.db, self.db.collection(fanout.JOB_COLLECTION).document('job1'))
+
+    def test_running_job_is_not_run_twice(self):
+        job, update_time = self._claim()
+        self.assertIsNotNone(update_time)
+        self.assertEqual(self._job()['status'], 'running')
+
+        # 租約未過期：resume_fanouts 或其他 process 不會重複執行
+        self.assertEqual(fanout.run_job(self.db, 'job1')['status'], 'running')
+        self.assertEqual(self.db.commits, 0)
+
+        self._job()['lease_until'] = timezone.now() - timedelta(seconds=1)
+        self.assertEqual(fanout.run_job(self.db, 'job1')['status'], 'done')
+
+    def test_concurrent_claim_has_one_winner(self):
+        original_get = FakeDocument.get
+        raced = []
+
+        def get_then_race(doc, **kwargs):
+            snapshot = original_get(doc, **kwargs)
+            if doc.collection == fanout.JOB_COLLECTION and not raced:
+                # 讀取之後、寫入之前，另一個程序取得了工作
+                raced.append(None)
+                raced[0] = self._claim()
+            return snapshot
+
+        with mock.patch.object(FakeDocument, 'get', get_then_race):
+            job = fanout.run_job(self.db, 'job1')
+        self.assertIsNotNone(raced[0][1])
+        self.assertEqual(job['status'], 'pending')
+        self.assertEqual(self.db.commits, 0)
+        self.assertEqual(set(self._names().values()), {'王小明', '其他社員'})
+
+    def test_stale_worker_stops_after_takeover(self):
+        original_commit = FakeBatch.commit
+
+        def commit_then_takeover(batch, **kwargs):
+            result = original_commit(batch, **kwargs)
+            if self.db.commits == 1:
+                # 第一頁之後租約過期，被另一個程序接手
+                self._job()['lease_until'] = timezone.now() - timedelta(seconds=1)
+                self._claim()
+            return result
+
+        with mock.patch.object(FakeBatch, 'commit', commit_then_takeover):
+            job = fanout.run_job(self.db, 'job1', page_size=2)
+        self.assertEqual((job['status'], job['processed'], job['last_doc_id']), ('running', 2, 'r2'))
+        self.assertEqual(self.db.commits, 1)
+
+        self._job()['lease_until'] = None
+        self.assertEqual(fanout.run_job(self.db, 'job1', page_size=2)['processed'], 5)
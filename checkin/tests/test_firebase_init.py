@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from google.api_core import exceptions as google_exceptions
+
+from checkin import firebase_init
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_open_half_open_close(self):
+        breaker = firebase_init.CircuitBreaker(threshold=2, cooldown=30)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(firebase_init.FirestoreUnavailable):
+            breaker.before_call()
+
+        # cooldown 結束：只放行一個試探請求
+        breaker._opened_at -= 30
+        breaker.before_call()
+        with self.assertRaises(firebase_init.FirestoreUnavailable):
+            breaker.before_call()
+
+        breaker.record_success()
+        self.assertFalse(breaker.is_open)
+        breaker.before_call()
+
+    def test_failed_trial_reopens(self):
+        breaker = firebase_init.CircuitBreaker(threshold=5, cooldown=30)
+        for _ in range(5):
+            breaker.record_failure()
+        breaker._opened_at -= 30
+        breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(firebase_init.FirestoreUnavailable):
+            breaker.before_call()
+
+
+class ResilientReadTests(SimpleTestCase):
+    def _client(self, **config):
+        return firebase_init.ResilientFirestoreClient(object(), {'max_retries': 3, **config}, max_concurrency=1)
+
+    def _flaky(self, failures, result='ok'):
+        calls = []
+
+        def method(retry=None, timeout=None):
+            calls.append(timeout)
+            if len(calls) <= failures:
+                raise google_exceptions.ServiceUnavailable('unavailable')
+            return result
+        return method, calls
+
+    def test_retries_transient_errors_with_backoff(self):
+        client = self._client(backoff_base=0.1, backoff_max=2.0)
+        method, calls = self._flaky(failures=2)
+        with mock.patch('checkin.firebase_init.time.sleep') as sleep:
+            self.assertEqual(client._read('Fake.get', method, False, (), {}), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+        # full jitter：第 n 次等待不超過 base * 2^n
+        for attempt, call in enumerate(sleep.call_args_list):
+            self.assertLessEqual(call.args[0], 0.1 * 2 ** attempt)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_gives_up_after_max_retries(self):
+        client = self._client(max_retries=2, breaker_threshold=100)
+        method, calls = self._flaky(failures=10)
+        with mock.patch('checkin.firebase_init.time.sleep'):
+            with self.assertRaises(google_exceptions.ServiceUnavailable):
+                client._read('Fake.get', method, False, (), {})
+        self.assertEqual(len(calls), 3)
+
+    def test_does_not_sleep_past_deadline(self):
+        client = self._client(read_timeout=0.5)
+        method, calls = self._flaky(failures=10)
+        with mock.patch.object(firebase_init.ResilientFirestoreClient, '_backoff', return_value=1.0), \
+                mock.patch('checkin.firebase_init.time.sleep') as sleep:
+            with self.assertRaises(google_exceptions.ServiceUnavailable):
+                client._read('Fake.get', method, False, (), {})
+        self.assertEqual(len(calls), 1)
+        sleep.assert_not_called()
+        self.assertLessEqual(calls[0], 0.5)
+
+    def test_retries_count_as_one_breaker_failure(self):
+        client = self._client(max_retries=3, breaker_threshold=5)
+        method, calls = self._flaky(failures=3)
+        with mock.patch('checkin.firebase_init.time.sleep'):
+            client._read('Fake.get', method, False, (), {})
+        # 重試後成功的操作不算失敗
+        self.assertEqual(client.breaker._failures, 0)
+
+        method, calls = self._flaky(failures=10)
+        for expected in (1, 2):
+            with mock.patch('checkin.firebase_init.time.sleep'):
+                with self.assertRaises(google_exceptions.ServiceUnavailable):
+                    client._read('Fake.get', method, False, (), {})
+            self.assertEqual(client.breaker._failures, expected)
+        self.assertEqual(len(calls), 8)
+        self.assertFalse(client.breaker.is_open)
+
+    def test_non_transient_errors_are_not_retried(self):
+        client = self._client()
+
+        def method(retry=None, timeout=None):
+            raise google_exceptions.NotFound('missing')
+        with self.assertRaises(google_exceptions.NotFound):
+            client._read('Fake.get', method, False, (), {})
+        self.assertFalse(client.breaker.is_open)
+
+    def test_open_breaker_fails_fast_and_releases_slot(self):
+        client = self._client(max_retries=0, breaker_threshold=2)
+        method, calls = self._flaky(failures=2)
+        for _ in range(2):
+            with self.assertRaises(google_exceptions.ServiceUnavailable):
+                client._read('Fake.get', method, False, (), {})
+        self.assertTrue(client.breaker.is_open)
+
+        with self.assertRaises(firebase_init.FirestoreUnavailable):
+            client._read('Fake.get', method, False, (), {})
+        self.assertEqual(len(calls), 2)
+        # 被斷路器拒絕的請求不會占住社團的名額
+        self.assertTrue(client._slots.acquire(blocking=False))
+        client._slots.release()
+
+        # half-open 的試探請求成功後關閉斷路器
+        client.breaker._opened_at -= client.breaker.cooldown
+        self.assertEqual(client._read('Fake.get', method, False, (), {}), 'ok')
+        self.assertFalse(client.breaker.is_open)
@@ -0,0 +1,91 @@
+from datetime import datetime
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase
+
+from checkin import mailer
+
+
+def _message(to='a@example.com'):
+    return EmailMessage(subject='簽到成功通知', body='...', from_email='noreply@example.com', to=[to])
+
+
+class ConfirmationMailerTests(SimpleTestCase):
+    def setUp(self):
+        # 不啟動背景執行緒，由測試直接呼叫 _next_batch / _send_batch
+        patch = mock.patch.object(mailer.ConfirmationMailer, '_ensure_worker')
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.mailer = mailer.ConfirmationMailer({
+            'enabled': True, 'batch_wait': 0.01, 'idle_close': 0.05, 'rate_per_minute': 60000, 'retry_base': 0,
+            'max_attempts': 3, 'queue_size': 2,
+        })
+
+    def _send_pending(self):
+        self.mailer._send_batch(self.mailer._next_batch())
+
+    def test_same_checkin_is_sent_once(self):
+        self.assertTrue(self.mailer.enqueue(('default', 'c1', 'A001'), _message()))
+        self.assertFalse(self.mailer.enqueue(('default', 'c1', 'A001'), _message()))
+        self.assertTrue(self.mailer.enqueue(('gdg-south', 'c1', 'A001'), _message()))
+
+        self._send_pending()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(self.mailer.pending(), 0)
+
+    def test_full_queue_does_not_remember_key(self):
+        self.mailer.enqueue(('default', 'c1', 'A001'), _message())
+        self.mailer.enqueue(('default', 'c1', 'A002'), _message())
+        self.assertFalse(self.mailer.enqueue(('default', 'c1', 'A003'), _message()))
+
+        # 佇列有空位後，同一社員仍可排入
+        self._send_pending()
+        self.assertTrue(self.mailer.enqueue(('default', 'c1', 'A003'), _message()))
+
+    def test_failed_send_is_retried_then_dropped(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = OSError('connection refused')
+        self.mailer.enqueue(('default', 'c1', 'A001'), _message())
+
+        with mock.patch.object(mailer, 'get_connection', return_value=connection):
+            self._send_pending()
+            self.assertEqual(len(self.mailer._retries), 1)
+            self.assertEqual(self.mailer.pending(), 1)
+
+            self._send_pending()
+            self._send_pending()
+        self.assertEqual(connection.send_messages.call_count, 3)
+        # 失敗後會重新建立連線
+        self.assertEqual(connection.open.call_count, 3)
+        self.assertEqual(self.mailer.pending(), 0)
+
+    def test_retry_succeeds(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [OSError('timeout'), 1]
+        self.mailer.enqueue(('default', 'c1', 'A001'), _message())
+
+        with mock.patch.object(mailer, 'get_connection', return_value=connection):
+            self._send_pending()
+            self._send_pending()
+        self.assertEqual(connection.send_messages.call_count, 2)
+        self.assertEqual(self.mailer.pending(), 0)
+
+
+class EnqueueConfirmationTests(SimpleTestCase):
+    def test_skipped_when_disabled_or_without_email(self):
+        enabled = mailer.ConfirmationMailer({'enabled': True})
+        disabled = mailer.ConfirmationMailer({'enabled': False})
+        args = ('default', 'c1', 'Django 入門', 'A001', '王小明')
+        now = datetime(2026, 3, 2, 19, 0)
+
+        with mock.patch.object(mailer, 'get_mailer', return_value=disabled):
+            self.assertFalse(mailer.enqueue_checkin_confirmation(*args, 'a@example.com', now))
+        with mock.patch.object(mailer, 'get_mailer', return_value=enabled), \
+                mock.patch.object(enabled, 'enqueue', return_value=True) as enqueue:
+            self.assertFalse(mailer.enqueue_checkin_confirmation(*args, '', now))
+            self.assertTrue(mailer.enqueue_checkin_confirmation(*args, 'a@example.com', now))
+        key, message = enqueue.call_args.args
+        self.assertEqual(key, ('default', 'c1', 'A001'))
+        self.assertEqual(message.to, ['a@example.com'])
@@ -0,0 +1,98 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from checkin import presence
+
+from .fakes import FakeDocument, FakeFirestore, FakeQuery, reset_caches
+
+
+class AbsentMembersTests(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        students = {f's{i}': {'student_id': f'A{i:03d}', 'name': f'社員{i}', 'member_id': 10 - i} for i in range(1, 6)}
+        students['s9'] = {'student_id': 'A009', 'name': '沒有編號'}
+        self.db = FakeFirestore({
+            'courses': {'c1': {'name': 'Django 入門'}},
+            'students': students,
+            'checkin_records': {
+                'c1_A002': {'course_id': 'c1', 'student_id': 'A002'},
+                'c1_A004': {'course_id': 'c1', 'student_id': 'A004'},
+                'c2_A001': {'course_id': 'c2', 'student_id': 'A001'},
+            },
+        })
+
+    def test_pages_in_member_id_order(self):
+        first = presence.absent_members(self.db, 'c1', offset=0, limit=2)
+        self.assertEqual((first['total_members'], first['checked_in'], first['absent_count']), (6, 2, 4))
+        self.assertEqual([member[1] for member in first['absent']], ['A005', 'A003'])
+
+        second = presence.absent_members(self.db, 'c1', offset=2, limit=2)
+        # 沒有社員編號的排在最後
+        self.assertEqual([member[1] for member in second['absent']], ['A001', 'A009'])
+        self.assertEqual(presence.absent_members(self.db, 'c1', offset=4, limit=2)['absent'], [])
+
+    def test_checkin_is_reflected_without_reload(self):
+        presence.absent_members(self.db, 'c1')
+        self.db.down = True
+        presence.mark_checked_in('c1', 'A005')
+        result = presence.absent_members(self.db, 'c1', offset=0, limit=1)
+        self.assertEqual(result['absent_count'], 3)
+        self.assertEqual(result['absent'][0][1], 'A003')
+
+    def test_unknown_course(self):
+        self.assertIsNone(presence.absent_members(self.db, 'nope'))
+
+    def test_view_returns_page(self):
+        with mock.patch('checkin.firebase_init.get_firestore_client', return_value=self.db):
+            response = self.client.get('/api/courses/c1/absent/', {'offset': 1, 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row['index'] for row in data['absent']], [2, 3])
+        self.assertEqual([row['student_id'] for row in data['absent']], ['A003', 'A001'])
+
+    def test_mixed_member_id_types(self):
+        self.db.data['students'] = {
+            's1': {'student_id': 'A001', 'member_id': '12'},
+            's2': {'student_id': 'A002', 'member_id': 3},
+            's3': {'student_id': 'A003', 'member_id': 'B7'},
+            's4': {'student_id': 'A004'},
+            's5': {'student_id': 'A005', 'member_id': '05'},
+        }
+        roster = presence.get_roster(self.db)
+        self.assertEqual([member[1] for member in roster], ['A002', 'A005', 'A001', 'A003', 'A004'])
+
+    def _concurrently(self, func, count=8):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(func())) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        return results
+
+    def test_expired_cache_is_loaded_once(self):
+        reads = []
+        original_stream, original_get = FakeQuery.stream, FakeDocument.get
+
+        def slow_stream(query, **kwargs):
+            reads.append(query.collection)
+            time.sleep(0.05)
+            return original_stream(query, **kwargs)
+
+        def slow_get(doc, **kwargs):
+            reads.append(doc.collection)
+            time.sleep(0.05)
+            return original_get(doc, **kwargs)
+
+        with mock.patch.object(FakeQuery, 'stream', slow_stream), mock.patch.object(FakeDocument, 'get', slow_get):
+            rosters = self._concurrently(lambda: presence.get_roster(self.db))
+            checked_in = self._concurrently(lambda: presence.checked_in_ids(self.db, 'c1'))
+
+        self.assertEqual(len(set(map(id, rosters))), 1)
+        self.assertEqual(reads.count('students'), 1)
+        self.assertEqual(reads.count('courses'), 1)
+        self.assertEqual(checked_in[0], {'A002', 'A004'})
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from checkin import profiling
+
+
+def _busy(seconds):
+    until = time.monotonic() + seconds
+    while time.monotonic() < until:
+        pass
+
+
+class SamplerTests(SimpleTestCase):
+    def setUp(self):
+        self.sampler = profiling.Sampler(interval=0.001)
+        self.thread_id = threading.get_ident()
+
+    def test_sleeps_until_due(self):
+        with mock.patch.object(profiling.sys, '_current_frames', wraps=profiling.sys._current_frames) as frames:
+            self.sampler.register(self.thread_id, time.monotonic() + 60)
+            time.sleep(0.05)
+            profile = self.sampler.unregister(self.thread_id)
+        # 還沒到開始取樣的時間：取樣執行緒不讀取堆疊
+        self.assertEqual(frames.call_count, 0)
+        self.assertEqual(profile.samples, 0)
+
+    def test_samples_registered_thread(self):
+        self.sampler.register(self.thread_id, time.monotonic())
+        _busy(0.05)
+        profile = self.sampler.unregister(self.thread_id)
+        self.assertGreater(profile.samples, 0)
+        self.assertTrue(any('_busy (' in stack for stack in profile.stacks))
+        # unregister 之後不會再被修改
+        samples = profile.samples
+        _busy(0.01)
+        self.assertEqual(profile.samples, samples)
+
+
+class SamplingProfilerMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        settings = self.settings(CHECKIN_PROFILING={
+            'enabled': False, 'header_token': 'secret', 'interval': 0.001, 'output_dir': self.dir.name,
+        })
+        settings.enable()
+        self.addCleanup(settings.disable)
+        patch = mock.patch.object(profiling, '_sampler', None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _view(self, request):
+        _busy(0.05)
+        return HttpResponse('ok')
+
+    def _request(self, token):
+        request = RequestFactory().get('/checkin/', HTTP_X_CHECKIN_PROFILE=token)
+        return profiling.SamplingProfilerMiddleware(self._view)(request)
+
+    def test_header_profiles_request(self):
+        response = self._request('secret')
+        profile_id = response['X-Checkin-Profile-ID']
+
+        with open(os.path.join(self.dir.name, 'index.jsonl'), encoding='utf-8') as f:
+            entry = json.loads(f.read())
+        self.assertEqual((entry['request_id'], entry['reason'], entry['status']), (profile_id, 'header', 200))
+        with open(os.path.join(self.dir.name, entry['file']), encoding='utf-8') as f:
+            self.assertIn('_busy (', f.read())
+
+    def test_wrong_token_is_not_profiled(self):
+        self.assertNotIn('X-Checkin-Profile-ID', self._request('guess'))
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    def test_write_error_does_not_fail_request(self):
+        with mock.patch.object(profiling, 'write_profile', side_effect=OSError('disk full')), \
+                self.assertLogs('checkin.profiling', 'WARNING'):
+            response = self._request('secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Checkin-Profile-ID', response)
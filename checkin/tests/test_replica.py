@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from checkin import replica
+from checkin.models import CheckinRecord, Course, Student
+
+from .fakes import FakeFirestore
+
+
+def _firestore_data():
+    updated_at = timezone.now() - timedelta(minutes=5)
+    course_date = datetime(2026, 3, 2, tzinfo=timezone.utc)
+    return {
+        'courses': {
+            f'c{i}': {'name': f'第 {i} 堂', 'date': course_date, 'updated_at': updated_at} for i in range(1, 4)
+        },
+        'students': {
+            f's{i}': {'student_id': f'A00{i}', 'name': f'社員{i}', 'member_id': i, 'updated_at': updated_at}
+            for i in range(1, 4)
+        },
+        'checkin_records': {
+            'c1_A001': {'course_id': 'c1', 'student_id': 'A001', 'student_name': '社員1',
+                        'checkin_time': updated_at, 'updated_at': updated_at},
+        },
+    }
+
+
+class ReplicaSyncTests(TestCase):
+    def setUp(self):
+        self.db = FakeFirestore(_firestore_data())
+        # 原生 client 的 stream() 是 generator，同步不能依賴 list
+        self.db.materialize = False
+
+    def test_full_then_incremental_sync(self):
+        self.db.data['students']['s2']['updated_at'] = timezone.now() - timedelta(minutes=1)
+        results = replica.sync_all(self.db, full=True, page_size=2)
+        self.assertEqual(results['courses']['applied'], 3)
+        self.assertEqual(Student.objects.count(), 3)
+        self.assertEqual(CheckinRecord.objects.get().student.student_id, 'A001')
+
+        self.db.data['students']['s2'].update(name='改名', updated_at=timezone.now())
+        results = replica.sync_all(self.db, page_size=2)
+        # 只讀取游標 (減去安全區間) 之後有變動的文件
+        self.assertEqual(results['students']['applied'], 1)
+        self.assertEqual(Student.objects.get(firestore_id='s2').name, '改名')
+
+    def _delete(self, name, doc_id):
+        batch = self.db.batch()
+        replica.stage_delete(self.db, batch, name, doc_id)
+        batch.commit()
+
+    def test_incremental_sync_applies_tombstones(self):
+        replica.sync_all(self.db, full=True)
+        self._delete('students', 's3')
+        self._delete('courses', 'c1')
+
+        results = replica.sync_all(self.db)
+        self.assertEqual(results['tombstones'], 2)
+        self.assertFalse(Student.objects.filter(firestore_id='s3').exists())
+        self.assertFalse(Course.objects.filter(firestore_id='c1').exists())
+        self.assertEqual(Student.objects.count(), 2)
+
+        # 已處理的 tombstone 不會重複讀取
+        self.assertEqual(replica.sync_all(self.db)['tombstones'], 0)
+
+    def test_recreated_document_is_kept(self):
+        replica.sync_all(self.db, full=True)
+        self._delete('students', 's3')
+        self.db.data['students']['s3'] = {'student_id': 'A003', 'name': '回來了', 'updated_at': timezone.now()}
+
+        self.assertEqual(replica.sync_all(self.db)['tombstones'], 0)
+        self.assertEqual(Student.objects.get(firestore_id='s3').name, '回來了')
+
+    def test_delete_view_writes_tombstone(self):
+        with mock.patch('checkin.firebase_init.get_firestore_client', return_value=self.db):
+            response = self.client.post('/api/delete_data/', {'doc_type': 'student', 'doc_id': 's1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('s1', self.db.data['students'])
+        tombstone = self.db.data[replica.TOMBSTONE_COLLECTION]['students_s1']
+        self.assertEqual((tombstone['collection'], tombstone['doc_id']), ('students', 's1'))
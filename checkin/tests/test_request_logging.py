@@ -0,0 +1,92 @@
+import atexit
+import io
+import json
+import logging
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from checkin import request_logging, tenancy
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.addFilter(request_logging.RequestContextFilter())
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class RequestContextTests(SimpleTestCase):
+    def setUp(self):
+        self.capture = _Capture()
+        logger = logging.getLogger('checkin')
+        logger.addHandler(self.capture)
+        self.addCleanup(logger.removeHandler, self.capture)
+
+    def _view(self, request):
+        request_logging.record_firestore_op('Query.stream', 0.012)
+        logging.getLogger('checkin.views').warning('在 view 中寫的 log')
+        return HttpResponse('ok')
+
+    def test_records_carry_request_context(self):
+        def get_response(request):
+            # Django 在解析 URL 後呼叫 process_view
+            middleware.process_view(request, self._view, (), {})
+            return self._view(request)
+
+        middleware = request_logging.RequestContextMiddleware(get_response)
+        request = RequestFactory().get('/checkin/', HTTP_X_REQUEST_ID='req-123')
+        request.tenant = 'gdg-south'
+        with tenancy.activate('gdg-south'):
+            response = middleware(request)
+
+        self.assertEqual(response['X-Request-ID'], 'req-123')
+        view_record, summary = self.capture.records
+        self.assertEqual((view_record.request_id, view_record.tenant, view_record.view),
+                         ('req-123', 'gdg-south', '_view'))
+        self.assertEqual(view_record.firestore_ops, [('Query.stream', 12.0)])
+        self.assertEqual((summary.status, summary.tenant, summary.method), (200, 'gdg-south', 'GET'))
+        self.assertTrue(summary.sampled)
+
+        # 請求結束後 context 已還原
+        self.assertIsNone(request_logging.current_request_id())
+        request_logging.record_firestore_op('Query.stream', 0.01)
+
+    def test_generates_request_id(self):
+        middleware = request_logging.RequestContextMiddleware(lambda request: HttpResponse(status=500))
+        response = middleware(RequestFactory().get('/'))
+        self.assertEqual(len(response['X-Request-ID']), 16)
+        summary, = self.capture.records
+        self.assertEqual(summary.levelno, logging.ERROR)
+        self.assertFalse(getattr(summary, 'sampled', False))
+
+
+class LogOutputTests(SimpleTestCase):
+    def _record(self, **extra):
+        record = logging.LogRecord('checkin.request', logging.INFO, __file__, 1, 'GET %s', ('/',), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter(self):
+        record = self._record(request_id='req-1', status=200, firestore_ops=[('a', 1.5), ('b', 2.25)])
+        entry = json.loads(request_logging.JsonFormatter().format(record))
+        self.assertEqual(entry['message'], 'GET /')
+        self.assertEqual((entry['request_id'], entry['status'], entry['firestore_ms']), ('req-1', 200, 3.75))
+        self.assertNotIn('view', entry)
+
+    def test_success_sampling(self):
+        sampling = request_logging.SuccessSamplingFilter(rate=0)
+        self.assertFalse(sampling.filter(self._record(sampled=True)))
+        self.assertTrue(sampling.filter(self._record()))
+
+    def test_queue_handler_drops_when_full(self):
+        handler = request_logging.NonBlockingQueueHandler(maxsize=1, stream=io.StringIO())
+        handler.listener.stop()
+        atexit.unregister(handler.listener.stop)
+        handler.emit(self._record())
+        handler.emit(self._record())
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(handler.queue.get_nowait().msg, 'GET /')
@@ -0,0 +1,73 @@
+import json
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from checkin import firebase_init, tenancy
+
+from .fakes import FakeFirestore
+
+
+def _ok(retry=None, timeout=None):
+    return 'ok'
+
+
+@override_settings(CHECKIN_TENANTS={'default': {}, 'gdg-south': {}})
+class TenantIsolationTests(SimpleTestCase):
+    def setUp(self):
+        self.fake = FakeFirestore()
+
+    def _client(self, slug, config=None, max_concurrency=None):
+        return firebase_init.ResilientFirestoreClient(
+            self.fake, config, namespace=tenancy.get_tenant_config(slug)['namespace'], max_concurrency=max_concurrency)
+
+    def test_collections_are_namespaced(self):
+        self._client('default').collection('students').document('s1').set({'student_id': 'A001'})
+        self._client('gdg-south').collection('students').document('s1').set({'student_id': 'B001'})
+
+        self.assertEqual(self.fake.data['students']['s1']['student_id'], 'A001')
+        self.assertEqual(self.fake.data['tenants/gdg-south/students']['s1']['student_id'], 'B001')
+
+    def test_path_prefix_selects_tenant(self):
+        seen = []
+
+        def get_client(tenant=None):
+            seen.append(tenancy.current_tenant())
+            return None
+
+        with mock.patch('checkin.firebase_init.get_firestore_client', side_effect=get_client):
+            self.client.post('/t/gdg-south/checkin/', json.dumps({'course_id': 'c1', 'student_id': 'A001'}),
+                             content_type='application/json')
+            self.client.post('/checkin/', json.dumps({'course_id': 'c1', 'student_id': 'A001'}),
+                             content_type='application/json')
+            self.assertEqual(self.client.get('/t/unknown/').status_code, 404)
+        self.assertEqual(seen, ['gdg-south', 'default'])
+
+    def test_concurrency_limit_is_per_tenant(self):
+        busy = self._client('default', {'read_timeout': 0.05}, max_concurrency=1)
+        other = self._client('gdg-south', {'read_timeout': 0.05}, max_concurrency=1)
+        busy._acquire_slot(0)
+        self.addCleanup(busy._release_slot)
+
+        with self.assertRaises(firebase_init.FirestoreUnavailable):
+            busy._read('DocumentReference.get', _ok, False, (), {})
+        self.assertEqual(other._read('DocumentReference.get', _ok, False, (), {}), 'ok')
+
+    def test_hedge_pool_is_per_tenant(self):
+        config = {'hedge_enabled': True, 'hedge_workers': 1, 'hedge_min_samples': 1}
+        busy = self._client('default', config)
+        other = self._client('gdg-south', config)
+        self.assertIsNot(busy._get_hedge_executor(), other._get_hedge_executor())
+
+        # 占滿一個社團的 hedge 執行緒，另一個社團的 hedged read 不受影響
+        release = threading.Event()
+        busy._get_hedge_executor().submit(release.wait)
+        self.addCleanup(release.set)
+        other.latency.record('DocumentReference.get', 0.001)
+
+        results = []
+        worker = threading.Thread(target=lambda: results.append(other._hedged('DocumentReference.get', _ok)))
+        worker.start()
+        worker.join(timeout=2)
+        self.assertEqual(results, ['ok'])
@@ -0,0 +1,95 @@
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.test import Client, SimpleTestCase
+from django.utils import timezone
+
+from checkin import course_session, tracing
+
+from .fakes import FakeFirestore, reset_caches
+
+
+class TracingTestCase(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        for patch in (mock.patch('checkin.course_session._ensure_refresher'),
+                      mock.patch('checkin.mailer.enqueue_checkin_confirmation')):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _post_checkin(self, client, course_id, student_id):
+        return client.post('/checkin/', json.dumps({'course_id': course_id, 'student_id': student_id}),
+                           content_type='application/json')
+
+
+class RequestTraceMiddlewareTests(TracingTestCase):
+    def test_traces_are_pseudonymized(self):
+        db = FakeFirestore({'courses': {'c1': {'name': 'Django 入門'}}})
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch('checkin.firebase_init.get_firestore_client', return_value=db):
+            path = os.path.join(tmp, 'traces', 'requests.jsonl')
+            with self.settings(CHECKIN_TRACE_ENABLED=True, CHECKIN_TRACE_FILE=path):
+                client = Client()
+                self._post_checkin(client, 'c1', 'A001')
+                client.post('/add_student/', {'student_id': 'A002', 'name': '陳小華', 'email': 'b@example.com'})
+
+            with open(path, encoding='utf-8') as f:
+                raw = f.read()
+            checkin, personal = tracing.load_traces(path)
+
+        self.assertNotIn('A001', raw)
+        self.assertNotIn('A002', raw)
+        self.assertNotIn('陳小華', raw)
+        self.assertEqual(checkin['payload'], {'course_id': 'c1', 'student_id': tracing.pseudonymize('A001')})
+        self.assertTrue(personal['redacted'])
+        self.assertIsNone(personal['payload'])
+
+
+class TraceFixtureTests(TracingTestCase):
+    def setUp(self):
+        super().setUp()
+        recorded_at = timezone.now()
+        self.live = FakeFirestore({
+            'courses': {
+                'c1': {'name': 'Django 入門', 'classroom': 'A101', 'date': datetime(2026, 3, 2, tzinfo=timezone.utc)},
+                'c2': {'name': '沒有出現在軌跡'},
+            },
+            'students': {
+                's1': {'student_id': 'A001', 'name': '王小明', 'member_id': 1, 'email': 'a@example.com'},
+                's2': {'student_id': 'A002', 'name': '陳小華', 'member_id': 2, 'email': 'b@example.com'},
+            },
+            'checkin_records': {
+                'c1_A002': {'course_id': 'c1', 'student_id': 'A002', 'checkin_time': recorded_at - timedelta(minutes=5)},
+            },
+        })
+        self.traces = [
+            {'ts': recorded_at.timestamp(), 'method': 'POST', 'path': '/checkin/', 'view': 'handle_checkin',
+             'content_type': 'application/json', 'redacted': False,
+             'payload': {'course_id': 'c1', 'student_id': tracing.pseudonymize(sid)}}
+            for sid in ('A001', 'A002')
+        ]
+
+    def test_fixture_contains_no_personal_data(self):
+        fixture = json.loads(json.dumps(tracing.build_fixture(self.live, self.traces)))
+        raw = json.dumps(fixture, ensure_ascii=False)
+        for value in ('A001', '王小明', 'a@example.com', 'Django 入門', 'A101'):
+            self.assertNotIn(value, raw)
+        self.assertEqual(list(fixture['courses']), ['c1'])
+        self.assertEqual(fixture['checkins'], {'c1': [tracing.pseudonymize('A002')]})
+
+    def test_replay_against_seeded_fixture(self):
+        fixture = json.loads(json.dumps(tracing.build_fixture(self.live, self.traces)))
+        emulator = FakeFirestore()
+        tracing.seed_fixture(emulator, fixture, batch_size=2)
+
+        statuses = []
+        with mock.patch('checkin.firebase_init.get_firestore_client', return_value=emulator):
+            for entry in self.traces:
+                payload = entry['payload']
+                statuses.append(self._post_checkin(Client(), payload['course_id'], payload['student_id']).json()['status'])
+        # 假名社員可以簽到；錄製前已簽到的仍是已簽到
+        self.assertEqual(statuses, ['success', 'already_checkedin'])
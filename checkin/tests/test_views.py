@@ -0,0 +1,122 @@
+import gzip
+import json
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from checkin import firebase_init, tenancy, views
+
+from .fakes import FakeFirestore, reset_caches
+
+
+class FirestoreUnavailableTests(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        self.db = FakeFirestore({'courses': {'c1': {'name': 'Django 入門'}}})
+        patch = mock.patch('checkin.firebase_init.get_firestore_client', return_value=self.db)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _post(self, student_id):
+        return self.client.post('/checkin/', json.dumps({'course_id': 'c1', 'student_id': student_id}),
+                                content_type='application/json')
+
+    def test_checkin_returns_503(self):
+        self.db.down = True
+        response = self._post('A001')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'error')
+
+
+class ExportAllCheckinsTests(SimpleTestCase):
+    def setUp(self):
+        self.db = FakeFirestore({'checkin_records': {
+            'c1_A001': {'course_id': 'c1', 'student_id': 'A001'},
+            'c1_A002': {'course_id': 'c1', 'student_id': 'A002'},
+        }})
+        patch = mock.patch('checkin.firebase_init.get_firestore_client', return_value=self.db)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _get(self):
+        request = RequestFactory().get('/export_all/')
+        request.user = mock.Mock(is_active=True, is_staff=True)
+        return views.export_all_checkins(request)
+
+    def test_streams_all_records(self):
+        response = self._get()
+        self.assertEqual(response.status_code, 200)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], ['c1_A001', 'c1_A002'])
+
+    def test_unavailable_before_streaming_returns_503(self):
+        self.db.down = True
+        self.assertEqual(self._get().status_code, 503)
+
+    def test_unavailable_mid_stream_aborts(self):
+        def chunks(db):
+            yield b'first'
+            raise firebase_init.FirestoreUnavailable('down')
+
+        with mock.patch('checkin.exports.stream_jsonl_gzip', chunks):
+            response = self._get()
+        content = iter(response.streaming_content)
+        self.assertEqual(next(content), b'first')
+        with self.assertRaises(firebase_init.FirestoreUnavailable):
+            next(content)
+
+
+@override_settings(CHECKIN_TENANTS={'default': {}, 'gdg-south': {}})
+class BulkUpdateTests(SimpleTestCase):
+    def setUp(self):
+        reset_caches()
+        self.addCleanup(reset_caches)
+        self.fake = FakeFirestore()
+        self.clients = {}
+        patches = [
+            mock.patch('checkin.firebase_init.get_firestore_client', side_effect=self._client),
+            mock.patch('checkin.fanout.submit'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _client(self, tenant=None):
+        # 與正式環境相同：社團的 collection 由 ResilientFirestoreClient 加上命名空間
+        slug = tenant or tenancy.current_tenant()
+        if slug not in self.clients:
+            namespace = tenancy.get_tenant_config(slug)['namespace']
+            self.clients[slug] = firebase_init.ResilientFirestoreClient(self.fake, namespace=namespace)
+        return self.clients[slug]
+
+    def _seed(self, prefix):
+        self.fake.data[f'{prefix}students'] = {'s1': {'student_id': 'A001', 'name': '王小明', 'member_id': 1}}
+        self.fake.data[f'{prefix}courses'] = {'c1': {'name': 'Django 入門'}}
+
+    def _post(self, path, changes):
+        return self.client.post(path, json.dumps({'changes': changes}), content_type='application/json')
+
+    def test_missing_documents_return_404_without_writing(self):
+        self._seed('')
+        response = self._post('/api/bulk_update/', [
+            {'doc_type': 'student', 'doc_id': 's1', 'fields': {'name': '王大明', 'student_id': 'A001'}},
+            {'doc_type': 'course', 'doc_id': 'gone', 'fields': {'name': 'x', 'date': '2026-03-02'}},
+        ])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['missing'], [{'doc_type': 'course', 'doc_id': 'gone'}])
+        self.assertEqual(self.fake.commits, 0)
+        self.assertEqual(self.fake.data['students']['s1']['name'], '王小明')
+
+    def test_non_default_tenant(self):
+        self._seed('tenants/gdg-south/')
+        response = self._post('/t/gdg-south/api/bulk_update/', [
+            {'doc_type': 'student', 'doc_id': 's1', 'fields': {'name': '王小明', 'student_id': 'A001',
+                                                                 'member_id': '7'}},
+            {'doc_type': 'course', 'doc_id': 'c1', 'fields': {'name': '進階', 'date': '2026-03-02'}},
+        ])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.fake.commits, 1)
+        self.assertEqual(self.fake.data['tenants/gdg-south/students']['s1']['member_id'], 7)
+        self.assertEqual(self.fake.data['tenants/gdg-south/courses']['c1']['name'], '進階')
+        self.assertNotIn('students', self.fake.data)
@@ -0,0 +1,265 @@
+# checkin/tracing.py
+
+"""
+請求軌跡錄製 (選用)。
+
+設定 CHECKIN_TRACE_ENABLED = True 後，每個請求會以一行 JSON 追加到 CHECKIN_TRACE_FILE
+(預設為 traces/requests.jsonl)：端點、payload 形狀、狀態碼、處理時間，以及與上一個請求的間隔。
+錄下的檔案可用 `python manage.py replay_traces` 在本地模擬器上以 1×/10×/100× 速度重播。
+
+軌跡檔不含個人資料：
+- payload 只保留重播需要的 course_id 與 student_id，其餘欄位只記錄形狀
+- student_id 以 pseudonymize() 轉成假名 (同一學號得到同一假名)
+- 社員管理端點 (PERSONAL_VIEWS) 不記錄任何 payload 內容，重播時略過
+
+重播需要與錄製時相同的課程與社員：在正式環境以 `python manage.py snapshot_trace_fixture` 建立 fixture
+(build_fixture：軌跡中的課程、學號換成假名的社員、錄製開始前已有的簽到)，
+再以 `replay_traces --fixture` 寫入模擬器 (seed_fixture)，重播的簽到才會走到真正的寫入。
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from google.cloud import firestore
+from google.cloud.firestore import FieldFilter
+
+# 超過此大小的請求內容只記錄形狀，不記錄內容
+MAX_PAYLOAD_BYTES = 4096
+
+# 不需要錄製的路徑前綴
+SKIP_PREFIXES = ('/static/', '/admin/', '/favicon.ico')
+
+# 重播需要的 payload 欄位 (其餘欄位只記錄形狀)
+REPLAY_FIELDS = ('course_id', 'student_id')
+
+# payload 全部是社員個人資料的端點 (url name)
+PERSONAL_VIEWS = frozenset({'add_student', 'update_data', 'bulk_update_data'})
+
+
+def get_trace_file():
+    # 放在獨立的資料夾，不與專案根目錄的檔案混在一起
+    return getattr(settings, 'CHECKIN_TRACE_FILE', None) or settings.BASE_DIR / 'traces' / 'requests.jsonl'
+
+
+def payload_shape(payload):
+    """
+    以欄位型別描述 payload，例如 {'student_id': 'str', 'course_id': 'str'}。
+    """
+    if isinstance(payload, dict):
+        return {key: payload_shape(value) for key, value in payload.items()}
+    if isinstance(payload, list):
+        return [payload_shape(payload[0])] if payload else []
+    return type(payload).__name__
+
+
+def pseudonymize(student_id):
+    """
+    將學號轉成不可逆的假名 (以 SECRET_KEY 為金鑰的 HMAC)，同一學號在同一部署中得到同一假名。
+    """
+    digest = hmac.new(settings.SECRET_KEY.encode(), str(student_id).encode(), hashlib.sha256).hexdigest()
+    return f'p_{digest[:16]}'
+
+
+def _replay_payload(payload):
+    if not isinstance(payload, dict):
+        return None
+    replay = {field: payload[field] for field in REPLAY_FIELDS if isinstance(payload.get(field), str)}
+    if 'student_id' in replay:
+        replay['student_id'] = pseudonymize(replay['student_id'])
+    return replay
+
+
+def _extract_payload(request):
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    if request.method != 'POST' or length > MAX_PAYLOAD_BYTES:
+        return None, None
+
+    content_type = request.content_type or ''
+    if content_type == 'application/json':
+        try:
+            return content_type, json.loads(request.body)
+        except ValueError:
+            return content_type, None
+
+    payload = {key: request.POST.get(key) for key in request.POST if key != 'csrfmiddlewaretoken'}
+    return content_type, payload
+
+
+class RequestTraceMiddleware:
+    """
+    將請求軌跡逐行寫入 JSONL 檔案。未啟用時由 Django 自動移除 (MiddlewareNotUsed)。
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CHECKIN_TRACE_ENABLED', False):
+            raise MiddlewareNotUsed
+
+        self.get_response = get_response
+        self.path = get_trace_file()
+        self._lock = threading.Lock()
+        self._file = None
+        self._last_ts = None
+
+    def __call__(self, request):
+        if request.path.startswith(SKIP_PREFIXES):
+            return self.get_response(request)
+
+        # 必須在 view 讀取前取得內容 (request.body 之後仍可重複讀取)
+        content_type, payload = _extract_payload(request)
+        started = time.time()
+        response = self.get_response(request)
+        duration_ms = (time.time() - started) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match else None
+        redacted = view in PERSONAL_VIEWS
+        entry = {
+            'ts': started,
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'course_id': match.kwargs.get('course_id') if match else None,
+            'content_type': content_type,
+            'payload': None if redacted else _replay_payload(payload),
+            'redacted': redacted,
+            'shape': payload_shape(payload) if payload is not None else None,
+            'status': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+        }
+        self._write(entry)
+        return response
+
+    def _write(self, entry):
+        with self._lock:
+            entry['gap'] = round(entry['ts'] - self._last_ts, 4) if self._last_ts is not None else 0.0
+            self._last_ts = entry['ts']
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+            self._file.flush()
+
+
+def load_traces(path):
+    """
+    讀取軌跡檔，略過無法解析或不是請求軌跡的行，依時間排序後返回。
+    """
+    traces = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and 'path' in entry and 'ts' in entry:
+                traces.append(entry)
+    traces.sort(key=lambda entry: entry['ts'])
+    return traces
+
+
+# --- 重播用的 fixture ---
+
+def _traced_course_ids(traces):
+    course_ids = set()
+    for entry in traces:
+        payload = entry.get('payload')
+        if isinstance(payload, dict) and isinstance(payload.get('course_id'), str):
+            course_ids.add(payload['course_id'])
+        if entry.get('course_id'):
+            course_ids.add(entry['course_id'])
+    course_ids.discard('')
+    return course_ids
+
+
+def build_fixture(db, traces):
+    """
+    在正式環境讀取重播需要的資料，返回可寫成 JSON 的 fixture (不含個人資料)：
+    - 軌跡中出現的課程 (名稱與教室不保留)
+    - 全部社員，學號換成與軌跡相同的假名，不含姓名與 Email
+    - 這些課程在錄製開始前已有的簽到，重播時「已簽到」的情況才與當時相同
+    讀取次數約為課程數 + 社員數 + 既有簽到數。
+    """
+    started_at = datetime.fromtimestamp(traces[0]['ts']).astimezone() if traces else None
+
+    courses = {}
+    for index, course_id in enumerate(sorted(_traced_course_ids(traces)), 1):
+        course_doc = db.collection('courses').document(course_id).get()
+        if not course_doc.exists:
+            continue
+        data = course_doc.to_dict()
+        course_date = data.get('date')
+        courses[course_id] = {
+            'name': f'課程 {index}',
+            'date': course_date.isoformat() if course_date else None,
+            'session_open': bool(data.get('session_open')),
+        }
+
+    students = {}
+    for snapshot in db.collection('students').stream():
+        data = snapshot.to_dict()
+        if data.get('student_id'):
+            pseudonym = pseudonymize(data['student_id'])
+            students[pseudonym] = {'member_id': data.get('member_id')}
+
+    checkins = {}
+    for course_id in courses:
+        records = db.collection('checkin_records').where(filter=FieldFilter('course_id', '==', course_id)).stream()
+        checkins[course_id] = sorted(
+            pseudonymize(record['student_id'])
+            for record in (snapshot.to_dict() for snapshot in records)
+            if record.get('student_id') and (
+                started_at is None or not record.get('checkin_time') or record['checkin_time'] < started_at)
+        )
+
+    return {'courses': courses, 'students': students, 'checkins': checkins}
+
+
+def seed_fixture(db, fixture, batch_size=400):
+    """
+    將 build_fixture() 的結果寫入 (模擬器的) Firestore，返回寫入的文件數。
+    社員的學號與姓名都是假名，與軌跡中的 student_id 相同。
+    """
+    from . import course_session
+
+    documents = []
+    for course_id, course in fixture['courses'].items():
+        documents.append(('courses', course_id, {
+            'name': course['name'],
+            'classroom': '',
+            'date': datetime.fromisoformat(course['date']) if course['date'] else None,
+            'session_open': course['session_open'],
+        }))
+    for pseudonym, student in fixture['students'].items():
+        documents.append(('students', pseudonym, {
+            'student_id': pseudonym,
+            'name': pseudonym,
+            'member_id': student['member_id'],
+            'email': '',
+        }))
+    for course_id, pseudonyms in fixture['checkins'].items():
+        for pseudonym in pseudonyms:
+            documents.append(('checkin_records', course_session.record_id(course_id, pseudonym), {
+                'course_id': course_id,
+                'student_id': pseudonym,
+                'student_name': pseudonym,
+                'member_id': fixture['students'].get(pseudonym, {}).get('member_id'),
+                'student_email': '',
+                'checkin_time': firestore.SERVER_TIMESTAMP,
+            }))
+
+    for start in range(0, len(documents), batch_size):
+        batch = db.batch()
+        for collection, doc_id, data in documents[start:start + batch_size]:
+            batch.set(db.collection(collection).document(doc_id), {**data, 'updated_at': firestore.SERVER_TIMESTAMP})
+        batch.commit()
+    return len(documents)
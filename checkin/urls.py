@@ -5,10 +5,15 @@ urlpatterns = [
     path('', views.checkin_page, name='checkin_page'),
     path('checkin/', views.handle_checkin, name='handle_checkin'),
     path('api/checkins/<str:course_id>/', views.get_checkin_list, name='get_checkin_list'),
+    path('api/courses/<str:course_id>/absent/', views.get_absent_list, name='get_absent_list'),
     path('export/<str:course_id>/', views.export_checkins_csv, name='export_checkins_csv'),
+    path('export_all/', views.export_all_checkins, name='export_all_checkins'),
     path('management/', views.management_page, name='management_page'),
     path('add_student/', views.add_student, name='add_student'),
     path('add_course/', views.add_course, name='add_course'),
     path('api/update_data/', views.update_data, name='update_data'),
     path('api/delete_data/', views.delete_data, name='delete_data'),
+    path('api/bulk_update/', views.bulk_update_data, name='bulk_update_data'),
+    path('api/course_session/', views.manage_course_session, name='manage_course_session'),
+    path('api/fanout_jobs/<str:job_id>/', views.get_fanout_job, name='get_fanout_job'),
 ]
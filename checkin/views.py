@@ -1,19 +1,54 @@
 # checkin/views.py
 
 from django.shortcuts import render, redirect # <-- 確保有這個匯入
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt # 【已修正】: 引入 csrf_exempt
 from django.views.decorators.http import require_POST # 【已修正】: 引入 require_POST
 from django.utils import timezone
 import json
 import csv
+import functools
+import logging
 from google.cloud import firestore
 from google.cloud.firestore import FieldFilter, And
+from google.api_core import exceptions as google_exceptions
 
 # 引入您的 Firebase 初始化模組
 from . import firebase_init
+from . import archive
+from . import course_session
+from . import exports
+from . import fanout
+from . import mailer
+from . import presence
+from . import replica
+from . import tenancy
 from datetime import datetime # 確保有這個匯入
 
+logger = logging.getLogger(__name__)
+
+
+def _firestore_guard(json_response=True):
+    """
+    Firestore 斷路器開啟或社團請求過多 (FirestoreUnavailable) 時一律回應 503，
+    不會變成未處理的 500 或空白的頁面。各 view 內捕捉 Exception 前需先重新拋出。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            try:
+                return view(request, *args, **kwargs)
+            except firebase_init.FirestoreUnavailable as e:
+                logger.warning("%s: %s", view.__name__, e)
+                if json_response:
+                    return JsonResponse({'status': 'error', 'message': str(e)}, status=503)
+                return HttpResponse(str(e), status=503)
+        return wrapper
+    return decorator
+
+
+@_firestore_guard(json_response=False)
 def checkin_page(request):
     """
     簽到頁面視圖 - 取得所有課程以供選擇 (使用 Firestore)
@@ -41,8 +76,11 @@ def checkin_page(request):
                 'classroom': data.get('classroom'),
             })
 
+    except firebase_init.FirestoreUnavailable:
+        raise
+
     except Exception as e:
-        print(f"載入課程失敗: {e}")
+        logger.exception("載入課程失敗: %s", e)
 
     context = {
         'courses': courses_list,
@@ -52,6 +90,7 @@ def checkin_page(request):
 
 @csrf_exempt
 @require_POST
+@_firestore_guard(json_response=True)
 def handle_checkin(request, *args, **kwargs):
     from google.cloud import firestore
     from django.utils import timezone
@@ -67,6 +106,11 @@ def handle_checkin(request, *args, **kwargs):
         student_id_input = data.get('student_id', '').strip()
         course_id = data.get('course_id', '').strip()
 
+        # 課程場次開啟中：社員與重複簽到皆由記憶體判斷，只寫入新的簽到記錄
+        session = course_session.get_session(course_id)
+        if session is not None:
+            return _session_checkin(db, session, student_id_input)
+
         # ✅ 驗證 course 存在
         course_ref = db.collection('courses').document(course_id)
         course_doc = course_ref.get()
@@ -74,6 +118,8 @@ def handle_checkin(request, *args, **kwargs):
             return JsonResponse({'status': 'error', 'message': '課程不存在'}, status=400)
         course_data = course_doc.to_dict()
         course_name = course_data.get('name')
+        if course_data.get('archive'):
+            return JsonResponse({'status': 'error', 'message': '課程已封存，無法簽到'}, status=400)
 
         # ✅ 查詢 student
         students_ref = db.collection('students').where('student_id', '==', student_id_input).limit(1)
@@ -92,28 +138,50 @@ def handle_checkin(request, *args, **kwargs):
         student_email = student_data.get('email', '') # 【新增】: 取得 Email
 
         # ✅ 查詢是否重複簽到
+        # 改學號的同步工作 (fanout) 尚未完成時，之前的簽到記錄仍是舊學號，新舊學號都要查
+        student_ids = [student_id_input] + [
+            old_student_id for old_student_id in fanout.pending_old_student_ids(db, student_doc.id)
+            if old_student_id != student_id_input
+        ]
         checkin_ref = db.collection('checkin_records') \
             .where('course_id', '==', course_id) \
-            .where('student_id', '==', student_id_input) \
+            .where('student_id', 'in', student_ids) \
             .limit(1)
         checkin_docs = list(checkin_ref.stream())
 
         if checkin_docs:
+            presence.mark_checked_in(course_id, student_id_input)
             return JsonResponse({
                 'status': 'already_checkedin',
                 'message': f'社員 {student_name} 已簽到過'
             }, status=200)
 
-        # ✅ 建立簽到紀錄
+        # ✅ 建立簽到紀錄 (固定的文件 ID：同時送出的重複簽到只有一筆會成功)
         local_time = timezone.localtime(timezone.now())
-        db.collection('checkin_records').add({
-            'course_id': course_id,
-            'student_id': student_id_input,
-            'student_name': student_name,
-            'member_id': member_id,
-            'student_email': student_email, # 【新增】: 將 Email 寫入簽到記錄
-            'checkin_time': local_time,
-        })
+        record_ref = db.collection('checkin_records').document(course_session.record_id(course_id, student_id_input))
+        try:
+            record_ref.create({
+                'course_id': course_id,
+                'student_id': student_id_input,
+                'student_name': student_name,
+                'member_id': member_id,
+                'student_email': student_email, # 【新增】: 將 Email 寫入簽到記錄
+                'checkin_time': local_time,
+                'updated_at': firestore.SERVER_TIMESTAMP,  # 供 sync_firestore 增量同步使用
+            })
+        except google_exceptions.AlreadyExists:
+            presence.mark_checked_in(course_id, student_id_input)
+            return JsonResponse({
+                'status': 'already_checkedin',
+                'message': f'社員 {student_name} 已簽到過'
+            }, status=200)
+        presence.mark_checked_in(course_id, student_id_input)
+
+        # 確認信交給背景佇列寄送，不影響簽到回應時間
+        mailer.enqueue_checkin_confirmation(
+            tenancy.current_tenant(), course_id, course_name,
+            student_id_input, student_name, student_email, local_time,
+        )
 
         return JsonResponse({
             'status': 'success',
@@ -126,11 +194,47 @@ def handle_checkin(request, *args, **kwargs):
 
     except json.JSONDecodeError:
         return JsonResponse({'status': 'error', 'message': 'JSON 格式錯誤'}, status=400)
+    except firebase_init.FirestoreUnavailable:
+        raise
     except Exception as e:
-        print("簽到錯誤:", e)
+        logger.exception("簽到錯誤: %s", e)
         return JsonResponse({'status': 'error', 'message': f'伺服器錯誤：{e}'}, status=500)
 
 
+def _session_checkin(db, session, student_id_input):
+    """
+    課程場次模式的簽到：回應格式與 handle_checkin 相同
+    """
+    status, member, local_time = course_session.check_in(db, session, student_id_input)
+    if status == 'non_member':
+        return JsonResponse({
+            'status': 'non_member',
+            'message': f'學號 {student_id_input} 非社團成員'
+        }, status=200)
+
+    student_name, member_id, student_email = member
+    if status == 'already_checkedin':
+        return JsonResponse({
+            'status': 'already_checkedin',
+            'message': f'社員 {student_name} 已簽到過'
+        }, status=200)
+
+    mailer.enqueue_checkin_confirmation(
+        tenancy.current_tenant(), session.course_id, session.course_name,
+        student_id_input, student_name, student_email, local_time,
+    )
+
+    return JsonResponse({
+        'status': 'success',
+        'message': '簽到成功！',
+        'student_name': student_name,
+        'student_id': student_id_input,
+        'course_name': session.course_name,
+        'time': local_time.strftime('%Y/%m/%d %H:%M:%S'),
+    })
+
+
+@_firestore_guard(json_response=False)
 def export_checkins_csv(request, course_id):
     """
     根據課程 ID 匯出包含所有社員名單和簽到狀態的 CSV 檔案 (使用 Firestore)。
@@ -177,16 +281,11 @@ def export_checkins_csv(request, course_id):
     header = ['社員編號', '社員姓名', '社員學號', 'Email', '是否有簽到記錄', '實際簽到時間']
     writer.writerow(header)
 
-    # 2. 取得該課程的所有簽到記錄，並建立一個快速查詢字典
-    checkins_ref = db.collection('checkin_records').where(
-        filter=FieldFilter('course_id', '==', course_id)
-    ).stream()
-
+    # 2. 取得該課程的所有簽到記錄 (已封存的課程從冷儲存讀取)，並建立一個快速查詢字典
     # 鍵為 student_id，值為 record 字典
-    checked_in_students = {
-        record.to_dict().get('student_id'): record.to_dict()
-        for record in checkins_ref
-    }
+    # 社員資料修改後，尚在背景同步的記錄與已封存的快照都先套用新值，以對應到社員名單
+    records = fanout.apply_pending(db, archive.get_course_records(db, course_id, course_data), course_data)
+    checked_in_students = {record.get('student_id'): record for record in records}
 
     # 3. 取得所有社員，並依 member_id 排序
     all_students_ref = db.collection('students').order_by('member_id').stream()
@@ -223,6 +322,42 @@ def export_checkins_csv(request, course_id):
     return response
 
 
+@staff_member_required
+@_firestore_guard(json_response=False)
+def export_all_checkins(request):
+    """
+    (管理員) 以串流方式匯出全部簽到記錄為 gzip 壓縮的 JSONL，記憶體用量只與分頁大小有關。
+    大量或需要續傳的匯出請使用 `python manage.py export_all_checkins`。
+    """
+    db = firebase_init.get_firestore_client()
+
+    if not db:
+        return HttpResponse("伺服器錯誤：Firebase 客戶端未載入。", status=500)
+
+    # 在回應前先讀取第一段：Firestore 無法使用時由 _firestore_guard 回應 503，而不是 200 加上空的檔案
+    chunks = exports.stream_jsonl_gzip(db)
+    first_chunk = next(chunks)
+
+    filename = f"checkin_records_{timezone.localdate().strftime('%Y%m%d')}.jsonl.gz"
+    response = StreamingHttpResponse(_abort_on_unavailable(first_chunk, chunks), content_type='application/gzip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _abort_on_unavailable(first_chunk, chunks):
+    """
+    串流開始後狀態碼已送出，Firestore 中途無法使用時只能中斷連線：
+    記錄錯誤後重新拋出，用戶端會收到不完整 (缺少 gzip 結尾) 的檔案而不是看似完整的匯出。
+    """
+    yield first_chunk
+    try:
+        yield from chunks
+    except firebase_init.FirestoreUnavailable as e:
+        logger.error("匯出全部簽到記錄時中斷: %s", e)
+        raise
+
+
+@_firestore_guard(json_response=True)
 def get_checkin_list(request, course_id):
     """
     獲取指定課程的簽到列表，按簽到時間降序 (最新簽到在最前) (使用 Firestore)。
@@ -233,22 +368,17 @@ def get_checkin_list(request, course_id):
         return JsonResponse({'error': '伺服器錯誤：Firebase 客戶端未載入。'}, status=500)
 
     # 檢查課程是否存在 (非必須，但確保流程完整性)
-    if not db.collection('courses').document(course_id).get().exists:
+    course_doc = db.collection('courses').document(course_id).get()
+    if not course_doc.exists:
         return JsonResponse({'error': 'Course not found'}, status=404)
 
     data = []
     try:
-        # 查詢簽到記錄：過濾課程，並按簽到時間降序排序
-        checkin_records_ref = db.collection('checkin_records').where(
-            filter=FieldFilter('course_id', '==', course_id)
-        ).order_by(
-            'checkin_time', direction=firestore.Query.DESCENDING
-        ).stream()
+        # 查詢簽到記錄：過濾課程，並按簽到時間降序排序 (已封存的課程從冷儲存讀取)
+        checkin_records = archive.get_course_records(db, course_id, course_doc.to_dict(), newest_first=True)
 
         # 遍歷記錄並格式化輸出
-        for i, record_doc in enumerate(checkin_records_ref, 1):
-            record = record_doc.to_dict()
-
+        for i, record in enumerate(checkin_records, 1):
             # 處理 member_id
             member_id = record.get('member_id') if record.get('member_id') is not None else ''
 
@@ -264,16 +394,95 @@ def get_checkin_list(request, course_id):
                 'checkin_time': local_time.strftime('%Y/%m/%d %H:%M:%S'),
             })
 
+    except firebase_init.FirestoreUnavailable:
+        raise
+
     except Exception as e:
         # 捕獲查詢錯誤 (例如索引未建立)
-        print(f"查詢簽到列表時發生錯誤: {e}")
+        logger.exception("查詢簽到列表時發生錯誤: %s", e)
         return JsonResponse({'error': f'查詢簽到列表失敗: {e}'}, status=500)
 
     return JsonResponse({'checkins': data})
 
 
+@_firestore_guard(json_response=True)
+def get_absent_list(request, course_id):
+    """
+    獲取指定課程尚未簽到的社員，依社員編號排序並分頁 (?offset=0&limit=100)。
+    名單與已簽到學號皆由記憶體快取計算，不會每次掃描 Firestore。
+    """
+    db = firebase_init.get_firestore_client()
+
+    if not db:
+        return JsonResponse({'error': '伺服器錯誤：Firebase 客戶端未載入。'}, status=500)
+
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', 100)), 1), 500)
+    except ValueError:
+        return JsonResponse({'error': 'offset 與 limit 必須是整數'}, status=400)
+
+    try:
+        result = presence.absent_members(db, course_id, offset=offset, limit=limit)
+    except firebase_init.FirestoreUnavailable:
+        raise
+    except Exception as e:
+        logger.exception("查詢未到名單時發生錯誤: %s", e)
+        return JsonResponse({'error': f'查詢未到名單失敗: {e}'}, status=500)
+
+    if result is None:
+        return JsonResponse({'error': 'Course not found'}, status=404)
+
+    absent = [
+        {
+            'index': i,
+            'member_id': member_id if member_id is not None else '',
+            'name': name,
+            'student_id': student_id,
+        }
+        for i, (member_id, student_id, name) in enumerate(result['absent'], offset + 1)
+    ]
+    return JsonResponse({
+        'course_id': course_id,
+        'total_members': result['total_members'],
+        'checked_in': result['checked_in'],
+        'absent_count': result['absent_count'],
+        'offset': offset,
+        'limit': limit,
+        'absent': absent,
+    })
+
+
 # --- 頁面讀取視圖 ---
 
+def _student_row(doc_id, data):
+    """
+    管理頁面社員表格的一列 (management_page 與局部更新 API 共用)
+    """
+    return {
+        'id': doc_id,
+        'student_id': data.get('student_id', 'N/A'),
+        'name': data.get('name', 'N/A'),
+        'member_id': data.get('member_id', '-'),
+        'email': data.get('email', 'N/A'), # 【新增】: 載入 Email 欄位
+    }
+
+
+def _course_row(doc_id, data):
+    """
+    管理頁面課程表格的一列 (management_page 與局部更新 API 共用)
+    """
+    course_date = data.get('date')
+    return {
+        'id': doc_id,
+        'date': course_date.strftime('%Y/%m/%d') if course_date else 'N/A',  # 傳遞格式化的日期字串給前端顯示
+        'name': data.get('name', 'N/A'),
+        'classroom': data.get('classroom', '-'),
+        'session_open': bool(data.get('session_open')),
+    }
+
+
+@_firestore_guard(json_response=False)
 def management_page(request):
     """
     管理頁面：獲取並列出所有社員和課程
@@ -289,31 +498,18 @@ def management_page(request):
         # 1. 獲取所有社員，依 member_id 排序
         students_ref = db.collection('students').order_by('member_id').stream()
         for doc in students_ref:
-            data = doc.to_dict()
-            students_list.append({
-                'id': doc.id,
-                'student_id': data.get('student_id', 'N/A'),
-                'name': data.get('name', 'N/A'),
-                'member_id': data.get('member_id', '-'),
-                'email': data.get('email', 'N/A'), # 【新增】: 載入 Email 欄位
-            })
+            students_list.append(_student_row(doc.id, doc.to_dict()))
 
         # 2. 獲取所有課程，依日期降序排序
         courses_ref = db.collection('courses').order_by('date', direction=firestore.Query.DESCENDING).stream()
         for doc in courses_ref:
-            data = doc.to_dict()
-            course_date = data.get('date')
-            date_str = course_date.strftime('%Y/%m/%d') if course_date else 'N/A'
+            courses_list.append(_course_row(doc.id, doc.to_dict()))
 
-            courses_list.append({
-                'id': doc.id,
-                'date': date_str,  # 傳遞格式化的日期字串給前端顯示
-                'name': data.get('name', 'N/A'),
-                'classroom': data.get('classroom', '-'),
-            })
+    except firebase_init.FirestoreUnavailable:
+        raise
 
     except Exception as e:
-        print(f"載入管理數據失敗: {e}")
+        logger.exception("載入管理數據失敗: %s", e)
 
     context = {
         'students': students_list,
@@ -326,6 +522,7 @@ def management_page(request):
 
 @csrf_exempt
 @require_POST
+@_firestore_guard(json_response=False)
 def add_student(request):
     """
     處理新增社員的 POST 請求
@@ -365,18 +562,24 @@ def add_student(request):
             'name': name,
             'email': email, # 【新增】: 寫入 Email
             'member_id': member_id,
+            'updated_at': firestore.SERVER_TIMESTAMP,
         }
         db.collection('students').add(student_data)
+        presence.invalidate_roster()
 
         return redirect('management_page')
 
+    except firebase_init.FirestoreUnavailable:
+        raise
+
     except Exception as e:
-        print(f"新增社員失敗: {e}")
+        logger.exception("新增社員失敗: %s", e)
         return HttpResponse(f"伺服器錯誤: {e}", status=500)
 
 
 @csrf_exempt
 @require_POST
+@_firestore_guard(json_response=False)
 def add_course(request):
     """
     處理新增課程的 POST 請求
@@ -399,6 +602,7 @@ def add_course(request):
             'name': course_name,
             'classroom': classroom,
             'date': course_date,
+            'updated_at': firestore.SERVER_TIMESTAMP,
         }
         db.collection('courses').add(course_data)
 
@@ -406,15 +610,69 @@ def add_course(request):
 
     except ValueError:
         return HttpResponse("日期格式錯誤，請使用 YYYY-MM-DD 格式。", status=400)
+    except firebase_init.FirestoreUnavailable:
+        raise
     except Exception as e:
-        print(f"新增課程失敗: {e}")
+        logger.exception("新增課程失敗: %s", e)
         return HttpResponse(f"伺服器錯誤: {e}", status=500)
 
 
 # --- 資料編輯/刪除視圖 (透過 AJAX/POST) ---
 
+_ROW_BUILDERS = {
+    'student': _student_row,
+    'course': _course_row,
+}
+
+# Firestore 單一 batch 最多 500 筆寫入
+BATCH_WRITE_LIMIT = 500
+
+
+def _invalidate_presence(doc_type, doc_id, deleted=False, identity_changed=False):
+    """
+    社員 / 課程變更後，清除未到名單使用的記憶體快取 (見 presence.py)
+    """
+    if doc_type == 'student':
+        presence.invalidate_roster()
+        if deleted:
+            course_session.remove_member(doc_id)
+        if identity_changed:
+            # 已簽到學號可能是舊學號，全部重新載入
+            presence.invalidate_courses()
+    elif deleted:
+        presence.invalidate_courses(doc_id)
+
+
+def _parse_update_fields(doc_type, fields):
+    """
+    將表單 / JSON 欄位轉為 Firestore 更新內容。格式錯誤時拋出 ValueError。
+    """
+    if doc_type == 'student':
+        update_data = {
+            'name': (fields.get('name') or '').strip(),
+            'student_id': (fields.get('student_id') or '').strip(),
+            'email': (fields.get('email') or '').strip(), # 【新增】: 取得 Email
+        }
+        member_id_str = str(fields.get('member_id') or '').strip()
+        update_data['member_id'] = int(member_id_str) if member_id_str.isdigit() else None
+
+    else:
+        date_str = (fields.get('date') or '').strip()
+        course_date = datetime.strptime(date_str, '%Y-%m-%d')
+
+        update_data = {
+            'name': (fields.get('name') or '').strip(),
+            'date': course_date,
+            'classroom': (fields.get('classroom') or '').strip(),
+        }
+
+    update_data['updated_at'] = firestore.SERVER_TIMESTAMP
+    return update_data
+
+
 @csrf_exempt
 @require_POST
+@_firestore_guard(json_response=False)
 def update_data(request):
     """
     處理社員或課程的編輯更新請求
@@ -430,41 +688,44 @@ def update_data(request):
         if doc_type not in ['student', 'course'] or not doc_id:
             return HttpResponse('無效的數據類型或 ID。', status=400)
 
-        update_data = {}
-
+        update_data = _parse_update_fields(doc_type, request.POST)
+        doc_ref = db.collection(doc_type + 's').document(doc_id)
+        fanout_job = None
         if doc_type == 'student':
-            update_data = {
-                'name': request.POST.get('name').strip(),
-                'student_id': request.POST.get('student_id').strip(),
-                'email': request.POST.get('email').strip(), # 【新增】: 取得 Email
-            }
-            member_id_str = request.POST.get('member_id', '').strip()
-            update_data['member_id'] = int(member_id_str) if member_id_str.isdigit() else None
-
-        elif doc_type == 'course':
-            date_str = request.POST.get('date').strip()
-            course_date = datetime.strptime(date_str, '%Y-%m-%d')
-
-            update_data = {
-                'name': request.POST.get('name').strip(),
-                'date': course_date,
-                'classroom': request.POST.get('classroom', '').strip(),
-            }
-
-        db.collection(doc_type + 's').document(doc_id).update(update_data)
-
-        # 成功後返回 200 OK，前端 JS 會處理刷新
-        return HttpResponse('更新成功', status=200)
+            # 先讀取舊資料：學號、姓名等變更時，歷史簽到記錄交由背景工作同步
+            old_doc = doc_ref.get()
+            if not old_doc.exists:
+                return HttpResponse('社員不存在。', status=404)
+            batch = db.batch()
+            fanout_job = fanout.stage_student_update(db, batch, doc_id, old_doc.to_dict(), update_data)
+            batch.commit()
+            if fanout_job:
+                fanout.submit(fanout_job)
+            _invalidate_presence(doc_type, doc_id, identity_changed=bool(fanout_job))
+        else:
+            doc_ref.update(update_data)
+
+        # 回傳更新後的資料列，前端直接替換該列，不需重新載入整頁
+        return JsonResponse({
+            'status': 'success',
+            'message': '更新成功',
+            'doc_type': doc_type,
+            'row': _ROW_BUILDERS[doc_type](doc_id, update_data),
+            'fanout_job': fanout_job,
+        })
 
     except ValueError:
         return HttpResponse('數據格式錯誤，請檢查日期或數字欄位。', status=400)
+    except firebase_init.FirestoreUnavailable:
+        raise
     except Exception as e:
-        print(f"更新數據失敗: {e}")
+        logger.exception("更新數據失敗: %s", e)
         return HttpResponse(f'伺服器錯誤: {e}', status=500)
 
 
 @csrf_exempt
 @require_POST
+@_firestore_guard(json_response=True)
 def delete_data(request):
     """
     處理社員或課程的刪除請求 (AJAX)
@@ -480,10 +741,190 @@ def delete_data(request):
         if doc_type not in ['student', 'course'] or not doc_id:
             return JsonResponse({'status': 'error', 'message': '無效的請求數據。'}, status=400)
 
-        db.collection(doc_type + 's').document(doc_id).delete()
+        batch = db.batch()
+        replica.stage_delete(db, batch, doc_type + 's', doc_id)
+        batch.commit()
+        _invalidate_presence(doc_type, doc_id, deleted=True)
+
+        return JsonResponse({
+            'status': 'success',
+            'message': f'{doc_type} 刪除成功。',
+            'doc_type': doc_type,
+            'doc_id': doc_id,
+        })
+
+    except firebase_init.FirestoreUnavailable:
+        raise
+
+    except Exception as e:
+        logger.exception("刪除數據失敗: %s", e)
+        return JsonResponse({'status': 'error', 'message': f'伺服器錯誤: {e}'}, status=500)
+
+
+def _snapshot_exists(snapshots, doc_type, doc_id):
+    snapshot = snapshots.get((doc_type + 's', doc_id))
+    return snapshot is not None and snapshot.exists
+
+
+@csrf_exempt
+@require_POST
+@_firestore_guard(json_response=True)
+def bulk_update_data(request):
+    """
+    一次套用多筆社員 / 課程的編輯或刪除，以 batch 寫入 Firestore。
+    費用：所有被編輯的文件以一次 get_all 讀取 (每筆一次文件讀取，不掃描 collection)；
+    每筆編輯一次寫入，身分欄位有變更的社員另加一筆同步工作，每筆刪除另加一筆 tombstone。
+    請求格式 (JSON)：
+    {"changes": [
+        {"doc_type": "student", "doc_id": "...", "fields": {"name": "...", "student_id": "...", ...}},
+        {"doc_type": "course", "doc_id": "...", "delete": true}
+    ]}
+    要修改的文件有任何一筆不存在時返回 404 (附上 missing 清單)，不寫入任何資料。
+    """
+    db = firebase_init.get_firestore_client()
+    if not db:
+        return JsonResponse({'status': 'error', 'message': 'Firebase 連線錯誤。'}, status=500)
+
+    try:
+        changes = json.loads(request.body).get('changes')
+        if not isinstance(changes, list) or not changes:
+            return JsonResponse({'status': 'error', 'message': '沒有要更新的資料。'}, status=400)
+
+        # 先驗證全部內容，避免只寫入一部分
+        operations = []
+        for change in changes:
+            doc_type = change.get('doc_type')
+            doc_id = change.get('doc_id')
+            if doc_type not in _ROW_BUILDERS or not doc_id:
+                return JsonResponse({'status': 'error', 'message': f'無效的數據類型或 ID：{change}'}, status=400)
+            if change.get('delete'):
+                operations.append((doc_type, doc_id, None))
+            else:
+                operations.append((doc_type, doc_id, _parse_update_fields(doc_type, change.get('fields') or {})))
+
+        # 一次讀取所有被修改的文件：確認都存在 (batch 中的 update 遇到不存在的文件會讓整個 batch 失敗，
+        # 分段提交時前面的段落已經寫入)，並取得社員的舊資料以判斷是否需要同步歷史簽到記錄
+        update_refs = [db.collection(doc_type + 's').document(doc_id)
+                       for doc_type, doc_id, update_data in operations if update_data is not None]
+        # 以 (collection, 文件 ID) 對應：社團的文件路徑帶有命名空間前綴 (tenants/<slug>/...)
+        snapshots = {(doc.reference.parent.id, doc.id): doc for doc in db.get_all(update_refs)} if update_refs else {}
+        missing = [{'doc_type': doc_type, 'doc_id': doc_id}
+                   for doc_type, doc_id, update_data in operations
+                   if update_data is not None and not _snapshot_exists(snapshots, doc_type, doc_id)]
+        if missing:
+            return JsonResponse({'status': 'error', 'message': '部分資料不存在，未進行任何修改。',
+                                 'missing': missing}, status=404)
+        old_students = {
+            doc_id: snapshots[('students', doc_id)].to_dict() or {}
+            for doc_type, doc_id, update_data in operations
+            if doc_type == 'student' and update_data is not None
+        }
+
+        # 每筆修改最多產生兩筆寫入 (社員文件 + 同步工作，或刪除 + tombstone)
+        chunk_size = BATCH_WRITE_LIMIT // 2
+        updated, deleted, fanout_jobs = [], [], []
+        for start in range(0, len(operations), chunk_size):
+            batch = db.batch()
+            chunk_jobs = []
+            for doc_type, doc_id, update_data in operations[start:start + chunk_size]:
+                if update_data is None:
+                    replica.stage_delete(db, batch, doc_type + 's', doc_id)
+                elif doc_type == 'student':
+                    job_id = fanout.stage_student_update(db, batch, doc_id, old_students[doc_id], update_data)
+                    if job_id:
+                        chunk_jobs.append(job_id)
+                else:
+                    batch.update(db.collection(doc_type + 's').document(doc_id), update_data)
+            batch.commit()
+
+            for job_id in chunk_jobs:
+                fanout.submit(job_id)
+            fanout_jobs.extend(chunk_jobs)
+
+            for doc_type, doc_id, update_data in operations[start:start + chunk_size]:
+                _invalidate_presence(doc_type, doc_id, deleted=update_data is None,
+                                     identity_changed=bool(chunk_jobs))
+                if update_data is None:
+                    deleted.append({'doc_type': doc_type, 'doc_id': doc_id})
+                else:
+                    updated.append({'doc_type': doc_type, 'row': _ROW_BUILDERS[doc_type](doc_id, update_data)})
+
+        return JsonResponse({'status': 'success', 'updated': updated, 'deleted': deleted, 'fanout_jobs': fanout_jobs})
+
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'status': 'error', 'message': 'JSON 格式錯誤'}, status=400)
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': '數據格式錯誤，請檢查日期或數字欄位。'}, status=400)
+    except firebase_init.FirestoreUnavailable:
+        raise
+    except Exception as e:
+        logger.exception("批次更新數據失敗: %s", e)
+        return JsonResponse({'status': 'error', 'message': f'伺服器錯誤: {e}'}, status=500)
+
+
+@_firestore_guard(json_response=True)
+def get_fanout_job(request, job_id):
+    """
+    查詢社員變更同步工作的進度 (AJAX)
+    """
+    db = firebase_init.get_firestore_client()
+    if not db:
+        return JsonResponse({'status': 'error', 'message': 'Firebase 連線錯誤。'}, status=500)
+
+    job_doc = db.collection(fanout.JOB_COLLECTION).document(job_id).get()
+    if not job_doc.exists:
+        return JsonResponse({'status': 'error', 'message': '找不到同步工作。'}, status=404)
+
+    job = job_doc.to_dict()
+    return JsonResponse({
+        'status': 'success',
+        'job_id': job_id,
+        'job_status': job.get('status'),
+        'processed': job.get('processed', 0),
+        'error': job.get('error'),
+    })
+
+
+@csrf_exempt
+@require_POST
+@_firestore_guard(json_response=True)
+def manage_course_session(request):
+    """
+    開啟或關閉課程場次 (AJAX)。action 為 'start' 或 'close'
+    """
+    db = firebase_init.get_firestore_client()
+    if not db:
+        return JsonResponse({'status': 'error', 'message': 'Firebase 連線錯誤。'}, status=500)
+
+    course_id = request.POST.get('course_id')
+    action = request.POST.get('action')
+    if not course_id or action not in ('start', 'close'):
+        return JsonResponse({'status': 'error', 'message': '無效的請求數據。'}, status=400)
+
+    try:
+        if action == 'start':
+            session = course_session.start(db, course_id)
+            return JsonResponse({
+                'status': 'success',
+                'message': f'已開啟「{session.course_name}」的場次',
+                'course_id': course_id,
+                'session_open': True,
+                'members': course_session.member_count(),
+                'checked_in': len(session.checked_in),
+            })
 
-        return JsonResponse({'status': 'success', 'message': f'{doc_type} 刪除成功。'})
+        course_session.close(db, course_id)
+        return JsonResponse({
+            'status': 'success',
+            'message': '場次已關閉',
+            'course_id': course_id,
+            'session_open': False,
+        })
 
+    except ValueError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    except firebase_init.FirestoreUnavailable:
+        raise
     except Exception as e:
-        print(f"刪除數據失敗: {e}")
-        return JsonResponse({'status': 'error', 'message': f'伺服器錯誤: {e}'}, status=500)
\ No newline at end of file
+        logger.exception("切換課程場次失敗: %s", e)
+        return JsonResponse({'status': 'error', 'message': f'伺服器錯誤: {e}'}, status=500)